@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+ARCHIVE_DIR = "archive"
+
+# Same layout as the live tables, so archived rows keep their keys
+ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS {s}.bills (
+        id INTEGER PRIMARY KEY,
+        bill_no TEXT NOT NULL UNIQUE,
+        ts INTEGER NOT NULL,
+        customer_phone TEXT,
+        created_by TEXT,
+        payment_mode TEXT DEFAULT 'Cash',
+        total REAL NOT NULL DEFAULT 0,
+        discount_amount REAL NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_bills_ts ON bills(ts)",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_bills_customer_ts ON bills(customer_phone, ts)",
+    """CREATE TABLE IF NOT EXISTS {s}.bill_lines (
+        bill_id INTEGER NOT NULL REFERENCES bills(id),
+        line_no INTEGER NOT NULL,
+        product_code TEXT NOT NULL,
+        category_id INTEGER,
+        quantity INTEGER NOT NULL,
+        total REAL NOT NULL,
+        discount_amount REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (bill_id, line_no)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_bill_lines_category ON bill_lines(category_id, bill_id)",
+]
+
+# SQLite allows 10 attached databases per connection; leave headroom
+MAX_ATTACHED = 8
+
+
+def season_bounds(year):
+    """Local-time [start, end) epoch range of a calendar-year season."""
+    start = time.mktime(datetime(year, 1, 1).timetuple())
+    end = time.mktime(datetime(year + 1, 1, 1).timetuple())
+    return int(start), int(end)
+
+
+def schema_name(year):
+    return f"arc{year}"
+
+
+class SeasonArchive:
+    """Moves closed seasons out of the live bills tables into per-year files.
+
+    After archiving, bills/bill_lines only hold the current season, so the
+    billing terminal and everyday reports work on a small hot table. Report
+    queries whose date range reaches an archived year ATTACH that year's
+    file read-only on the reading connection and UNION it in.
+    """
+
+    def __init__(self, db, directory=ARCHIVE_DIR):
+        self.db = db
+        self.directory = directory
+
+    def path(self, year):
+        return os.path.join(self.directory, f"sales_{year}.db")
+
+    # --- Archiving ---
+
+    def closed_seasons(self):
+        """Years before the current one that still have bills in the live tables."""
+        current_start = season_bounds(datetime.now().year)[0]
+        rows = self.db.reader().execute("""
+            SELECT DISTINCT CAST(strftime('%Y', ts, 'unixepoch', 'localtime') AS INTEGER)
+            FROM bills WHERE ts < ?""", (current_start,)).fetchall()
+        return sorted(r[0] for r in rows)
+
+    def archive_season(self, year):
+        """Moves one season's bills and lines out; returns (bills, lines) moved.
+
+        Safe to re-run: rows already copied are ignored and only deleted from
+        the live tables once the archive copy is committed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        start, end = season_bounds(year)
+        s = schema_name(year)
+        conn = self.db.manager.connect()
+        try:
+            # ATTACH is not allowed inside a transaction, so it comes first
+            conn.execute(f"ATTACH DATABASE ? AS {s}", (self.path(year),))
+            for ddl in ARCHIVE_SCHEMA:
+                conn.execute(ddl.format(s=s))
+            conn.commit()
+
+            # 1. Copy into the archive file and commit it there first
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"INSERT OR IGNORE INTO {s}.bills SELECT * FROM main.bills WHERE ts >= ? AND ts < ?", (start, end))
+            conn.execute(f"""
+                INSERT OR IGNORE INTO {s}.bill_lines
+                SELECT l.* FROM main.bill_lines l JOIN main.bills b ON b.id = l.bill_id
+                WHERE b.ts >= ? AND b.ts < ?""", (start, end))
+            conn.commit()
+
+            # 2. Catalog the season and drop it from the hot tables
+            conn.execute("BEGIN IMMEDIATE")
+            bills, lines, min_ts, max_ts = conn.execute(f"""
+                SELECT (SELECT COUNT(*) FROM {s}.bills), (SELECT COUNT(*) FROM {s}.bill_lines),
+                       (SELECT MIN(ts) FROM {s}.bills), (SELECT MAX(ts) FROM {s}.bills)""").fetchone()
+            conn.execute(f"""
+                INSERT OR IGNORE INTO archive_days (day, year)
+                SELECT DISTINCT date(ts, 'unixepoch', 'localtime'), ? FROM {s}.bills""", (year,))
+            conn.execute("""
+                INSERT INTO archive_seasons (year, path, min_ts, max_ts, bills, lines, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(year) DO UPDATE SET path=excluded.path, min_ts=excluded.min_ts, max_ts=excluded.max_ts,
+                    bills=excluded.bills, lines=excluded.lines, archived_at=excluded.archived_at
+            """, (year, self.path(year), min_ts or start, max_ts or start, bills, lines, int(time.time())))
+            conn.execute(f"""
+                DELETE FROM main.bill_lines WHERE bill_id IN
+                (SELECT id FROM main.bills WHERE ts >= ? AND ts < ? AND id IN (SELECT id FROM {s}.bills))""", (start, end))
+            moved = conn.execute(f"DELETE FROM main.bills WHERE ts >= ? AND ts < ? AND id IN (SELECT id FROM {s}.bills)", (start, end)).rowcount
+            conn.commit()
+            conn.execute(f"DETACH DATABASE {s}")
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+        logging.info(f"ARCHIVE: season {year} moved to {self.path(year)} ({moved} bills)")
+        return bills, lines
+
+    def archive_closed_seasons(self):
+        """Archives every closed season; returns {year: (bills, lines)}."""
+        return {year: self.archive_season(year) for year in self.closed_seasons()}
+
+    def archive_in_background(self):
+        """Runs archive_closed_seasons on a worker thread; returns a Future."""
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.archive_closed_seasons())
+            except Exception as e:
+                logging.error(f"ARCHIVE FAILED: {e}")
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="archive", daemon=True).start()
+        return future
+
+    # --- Reading ---
+
+    def years(self):
+        """Every archived year, oldest first."""
+        return [r[0] for r in self.db.reader().execute("SELECT year FROM archive_seasons ORDER BY year")]
+
+    def seasons_for_range(self, ts_from, ts_to):
+        """Archived years overlapping [ts_from, ts_to)."""
+        rows = self.db.reader().execute(
+            "SELECT year FROM archive_seasons WHERE min_ts < ? AND max_ts >= ? ORDER BY year",
+            (ts_to, ts_from)).fetchall()
+        return [r[0] for r in rows]
+
+    def check_range(self, ts_from, ts_to):
+        """Archived years of [ts_from, ts_to); ValueError if one query cannot attach them all."""
+        years = self.seasons_for_range(ts_from, ts_to)
+        if len(years) > MAX_ATTACHED:
+            raise ValueError(f"The dates span {len(years)} archived seasons ({years[0]}-{years[-1]}), "
+                             f"but a report can cover at most {MAX_ATTACHED}. Choose a shorter date range.")
+        return years
+
+    def attach(self, conn, years):
+        """Attaches the given archived years read-only on `conn`; returns schema names.
+
+        Raises ValueError for more than MAX_ATTACHED years rather than
+        leaving some out of the report.
+        """
+        if len(years) > MAX_ATTACHED:
+            raise ValueError(f"A report can cover at most {MAX_ATTACHED} archived seasons, not {len(years)}")
+        attached = {r[1] for r in conn.execute("PRAGMA database_list")} - {"main", "temp"}
+        wanted = {schema_name(y): y for y in years if os.path.exists(self.path(y))}
+        # Make room by dropping archives this query does not need
+        for name in attached - set(wanted):
+            if len(attached) + len(set(wanted) - attached) <= MAX_ATTACHED:
+                break
+            conn.execute(f"DETACH DATABASE {name}")
+            attached.discard(name)
+        for name, year in wanted.items():
+            if name not in attached:
+                conn.execute(f"ATTACH DATABASE ? AS {name}", (f"file:{self.path(year)}?mode=ro",))
+        return list(wanted)
+
+    def days(self):
+        return [r[0] for r in self.db.reader().execute("SELECT day FROM archive_days ORDER BY day DESC")]
@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+from datetime import datetime
+
+BACKUP_DIR = "backups"
+
+# Differential files: magic, page size, page count of the new image,
+# base file name, then (page number, page bytes) records.
+DIFF_MAGIC = b"CSDIFF1\0"
+
+
+class _Restarted(Exception):
+    pass
+
+
+class BackupManager:
+    """Hot snapshots of the live database through the SQLite backup API.
+
+    Full snapshots are complete, verified database files. Differential
+    snapshots store only the pages that changed since the latest full one,
+    so frequent backups during the season stay small.
+    """
+
+    def __init__(self, db, directory=BACKUP_DIR, keep_full=7, pages=256, pause=0.002, max_restarts=3):
+        self.db = db
+        self.directory = directory
+        self.keep_full = keep_full
+        self.pages = pages
+        self.pause = pause
+        self.max_restarts = max_restarts
+        self._lock = threading.Lock()
+        self._base_hashes = {}
+        os.makedirs(directory, exist_ok=True)
+
+    # --- Snapshots ---
+
+    def snapshot(self):
+        """Writes and verifies a full snapshot; returns its path."""
+        with self._lock:
+            path = os.path.join(self.directory, f"full_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db")
+            self._copy_live(path)
+            if not self.verify(path):
+                os.remove(path)
+                raise RuntimeError(f"Backup {path} failed integrity check")
+            logging.info(f"BACKUP: full snapshot {path} ({os.path.getsize(path)} bytes)")
+            return path
+
+    def differential(self):
+        """Stores pages changed since the latest full snapshot; returns its path.
+
+        Falls back to a full snapshot when there is no base to diff against.
+        """
+        base = self.latest_full()
+        if base is None:
+            return self.snapshot()
+        with self._lock:
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            image = os.path.join(self.directory, f".tmp_{stamp}.db")
+            path = os.path.join(self.directory, f"diff_{stamp}.dbdiff")
+            try:
+                self._copy_live(image)
+                changed = self._write_diff(base, image, path)
+            finally:
+                if os.path.exists(image):
+                    os.remove(image)
+            if not self.verify(path):
+                os.remove(path)
+                raise RuntimeError(f"Backup {path} failed integrity check")
+            logging.info(f"BACKUP: differential {path} ({changed} changed pages vs {os.path.basename(base)})")
+            return path
+
+    def _copy_live(self, dest):
+        """Copies the live database in small steps, off the writer connection."""
+        pages = self.pages
+        for attempt in range(2):
+            src = self.db.manager.connect(readonly=True)
+            target = sqlite3.connect(dest)
+            remaining = [None, 0]
+
+            def progress(status, left, total):
+                # Writes from other connections restart a stepped backup
+                if remaining[0] is not None and left > remaining[0]:
+                    remaining[1] += 1
+                    if remaining[1] > self.max_restarts:
+                        raise _Restarted()
+                remaining[0] = left
+
+            try:
+                src.backup(target, pages=pages, progress=progress, sleep=self.pause)
+                # Snapshots are standalone files, not WAL databases
+                target.execute("PRAGMA journal_mode=DELETE")
+                return
+            except _Restarted:
+                # Busy counter: take the copy in one step. In WAL mode that only
+                # holds a read snapshot, so billing can still commit meanwhile.
+                logging.warning("BACKUP: restarted repeatedly under load, copying in one step")
+                pages = -1
+            finally:
+                target.close()
+                src.close()
+        raise RuntimeError("Backup could not complete")
+
+    # --- Differentials ---
+
+    def _page_hashes(self, path, page_size):
+        key = (path, os.path.getmtime(path))
+        if key not in self._base_hashes:
+            hashes = []
+            with open(path, "rb") as f:
+                while True:
+                    page = f.read(page_size)
+                    if not page:
+                        break
+                    hashes.append(hashlib.blake2b(page, digest_size=16).digest())
+            self._base_hashes = {key: hashes}
+        return self._base_hashes[key]
+
+    def _write_diff(self, base, image, path):
+        page_size = _page_size(image)
+        base_hashes = self._page_hashes(base, page_size) if _page_size(base) == page_size else []
+        page_count = os.path.getsize(image) // page_size
+        changed = 0
+        name = os.path.basename(base).encode("utf-8")
+        with open(image, "rb") as src, open(path, "wb") as out:
+            out.write(DIFF_MAGIC + struct.pack(">IIH", page_size, page_count, len(name)) + name)
+            for page_no in range(page_count):
+                page = src.read(page_size)
+                if page_no < len(base_hashes) and hashlib.blake2b(page, digest_size=16).digest() == base_hashes[page_no]:
+                    continue
+                out.write(struct.pack(">I", page_no) + page)
+                changed += 1
+            out.flush()
+            os.fsync(out.fileno())
+        return changed
+
+    def restore(self, snapshot, dest):
+        """Rebuilds a standalone database file from a full or differential snapshot."""
+        if not snapshot.endswith(".dbdiff"):
+            shutil.copyfile(snapshot, dest)
+            return dest
+        with open(snapshot, "rb") as f:
+            page_size, page_count, base = _read_diff_header(f)
+            shutil.copyfile(os.path.join(os.path.dirname(snapshot), base), dest)
+            with open(dest, "r+b") as out:
+                while True:
+                    head = f.read(4)
+                    if not head:
+                        break
+                    (page_no,) = struct.unpack(">I", head)
+                    out.seek(page_no * page_size)
+                    out.write(f.read(page_size))
+                out.truncate(page_count * page_size)
+        return dest
+
+    def verify(self, snapshot):
+        """Runs PRAGMA integrity_check on a snapshot (diffs are rebuilt first)."""
+        path = snapshot
+        if snapshot.endswith(".dbdiff"):
+            path = self.restore(snapshot, snapshot + ".verify")
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            result = str(e)
+        finally:
+            if path != snapshot:
+                os.remove(path)
+        if result != "ok":
+            logging.error(f"BACKUP VERIFY FAILED for {snapshot}: {result}")
+        return result == "ok"
+
+    # --- Rotation ---
+
+    def fulls(self):
+        return sorted(os.path.join(self.directory, n) for n in os.listdir(self.directory)
+                      if n.startswith("full_") and n.endswith(".db"))
+
+    def latest_full(self):
+        fulls = self.fulls()
+        return fulls[-1] if fulls else None
+
+    def rotate(self):
+        """Keeps the newest `keep_full` full snapshots and the diffs based on them."""
+        fulls = self.fulls()
+        expired = fulls[:-self.keep_full] if self.keep_full else []
+        kept = {os.path.basename(p) for p in fulls if p not in expired}
+        for path in expired:
+            os.remove(path)
+            logging.info(f"BACKUP: rotated out {path}")
+        for name in os.listdir(self.directory):
+            if not name.endswith(".dbdiff"):
+                continue
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as f:
+                base = _read_diff_header(f)[2]
+            if base not in kept:
+                os.remove(path)
+                logging.info(f"BACKUP: rotated out {path}")
+
+
+class BackupScheduler:
+    """Background thread: a differential every `interval` seconds, a fresh
+    full snapshot every `full_every` runs, then rotation."""
+
+    def __init__(self, manager, interval=3600, full_every=24):
+        self.manager = manager
+        self.interval = interval
+        self.full_every = full_every
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="backup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        runs = 0
+        while not self._stop.wait(self.interval):
+            try:
+                if runs % self.full_every == 0:
+                    self.manager.snapshot()
+                else:
+                    self.manager.differential()
+                self.manager.rotate()
+            except Exception as e:
+                logging.error(f"SCHEDULED BACKUP FAILED: {e}")
+            runs += 1
+
+
+def _page_size(path):
+    with open(path, "rb") as f:
+        header = f.read(18)
+    size = struct.unpack(">H", header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def _read_diff_header(f):
+    if f.read(len(DIFF_MAGIC)) != DIFF_MAGIC:
+        raise ValueError("Not a differential backup file")
+    page_size, page_count, name_len = struct.unpack(">IIH", f.read(10))
+    return page_size, page_count, f.read(name_len).decode("utf-8")
@@ -0,0 +1,266 @@
+"""Crash-safe journal of the bills a cashier has completed.
+
+Checkout appends the whole bill to an append-only file and fsyncs it before
+the bill is sent to the database. If the commit fails (database locked by a
+long backup or report, stock daemon unreachable) or the app dies half way,
+the bill is still on disk: a background replayer keeps posting pending
+bills until they are committed. Posting is idempotent by bill number
+(save_bill skips a bill that already exists), so replaying a bill whose
+commit did land only marks it done.
+
+Each line of the file is one JSON record: a bill, or a "done"/"void"
+marker for an earlier bill. The file is emptied once nothing is pending.
+A bill the database refuses for good (stock ran out, a constraint) cannot
+be fixed by retrying: it is moved to bills-<series>.rejected.jsonl for the
+shop to sort out, so the bills behind it still post.
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from receipts import safe_name
+from repositories import InsufficientStock
+from services.billing import save_bill
+
+JOURNAL_DIR = "journal"
+RETRY_MIN = 1.0
+RETRY_MAX = 30.0
+# Settled records are dropped once nothing is pending and the file is this big
+COMPACT_BYTES = 256 * 1024
+
+
+def retryable(error):
+    """True for failures that pass (a locked database, an unreachable daemon)."""
+    return isinstance(error, (sqlite3.OperationalError, OSError))
+
+
+class BillJournal:
+    """Write-ahead journal plus replayer for one terminal's bills.
+
+    submit() journals a bill and posts it, returning a Future like
+    WriteQueue.submit. A bill rejected for stock while the cashier is still
+    waiting is voided (nothing was sold); any other failure leaves it
+    pending for the replayer. Once the cashier has moved on (detach), a
+    bill is never voided, since the goods have left the counter: a locked
+    database is retried and a bill that can never post is set aside in the
+    rejected file (see rejected()).
+    """
+
+    def __init__(self, db, terminal, directory=JOURNAL_DIR):
+        self.db = db
+        self.path = os.path.join(directory, f"bills-{safe_name(terminal)}.jsonl")
+        self.rejected_path = os.path.join(directory, f"bills-{safe_name(terminal)}.rejected.jsonl")
+        self.counter = None
+        self._lock = threading.Lock()
+        self._pending = {}  # bill_no -> entry, oldest first
+        self._in_flight = set()
+        self._detached = set()
+        self._file = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        atexit.register(self.close)
+
+    # --- Journal file ---
+
+    def _open(self):
+        """Loads unsettled bills from the file and opens it for appending."""
+        if self._file is not None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            for n, raw in enumerate(data[:end].splitlines(), 1):
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    logging.warning(f"JOURNAL: skipping unreadable line {n} of {self.path}")
+                    continue
+                if "bill" in record:
+                    self._pending[record["bill"]] = record
+                else:
+                    self._pending.pop(record.get("done") or record.get("void"), None)
+            if end < len(data):
+                # Torn last write from a crash: that bill never reached the database or
+                # the cashier. Cut it off so the next record starts on a line of its own.
+                logging.warning(f"JOURNAL: dropping incomplete last record of {self.path}")
+                with open(self.path, "r+b") as f:
+                    f.truncate(end)
+                    os.fsync(f.fileno())
+        self._file = open(self.path, "ab")
+        if self._pending:
+            logging.warning(f"JOURNAL: {len(self._pending)} bill(s) to replay from {self.path}")
+        else:
+            self._compact(force=True)
+
+    def _append(self, record, sync=True):
+        if self._file is None:
+            # Closed at exit: without the marker the bill is just re-checked next start
+            return
+        self._file.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def _compact(self, force=False):
+        if self._file is not None and not self._pending and (force or self._file.tell() > COMPACT_BYTES):
+            self._file.truncate(0)
+            self._file.seek(0)
+            os.fsync(self._file.fileno())
+
+    def pending(self):
+        """Bill numbers journaled but not yet in the database."""
+        with self._lock:
+            return list(self._pending)
+
+    def rejected(self):
+        """Bills set aside because the database refused them; each has its "error"."""
+        if not os.path.exists(self.rejected_path):
+            return []
+        with open(self.rejected_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _reject(self, entry, error):
+        """Moves a bill that can never post out of the journal (lock held)."""
+        record = dict(entry, error=str(error), rejected=int(time.time()))
+        with open(self.rejected_path, "ab") as f:
+            f.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending.pop(entry["bill"], None)
+        self._append({"void": entry["bill"]})
+        logging.error(f"JOURNAL: bill {entry['bill']} cannot be posted and was moved to "
+                      f"{self.rejected_path}: {error}")
+        self._compact()
+
+    # --- Posting ---
+
+    def submit(self, bill_no, ts, user, customer, lines):
+        """Journals the bill (fsync'd) and posts it; the Future yields the bill key."""
+        entry = {"bill": bill_no, "ts": ts, "user": user, "customer": list(customer),
+                 "lines": [list(line) for line in lines]}
+        with self._lock:
+            self._open()
+            self._append(entry)
+            self._pending[bill_no] = entry
+            self._in_flight.add(bill_no)
+        return self._post(entry, replay=False)
+
+    def detach(self, bill_no):
+        """The cashier stops waiting for a bill; False if its outcome is already in."""
+        with self._lock:
+            if bill_no in self._in_flight:
+                self._detached.add(bill_no)
+                return True
+            return False
+
+    def _post(self, entry, replay):
+        result = Future()
+        if self.counter is not None:
+            inner = self.counter.checkout(entry["bill"], entry["ts"], entry["user"], entry["customer"], entry["lines"])
+        else:
+            inner = self.db.writes.submit(save_bill, self.db, entry["bill"], entry["ts"], entry["user"],
+                                          tuple(entry["customer"]), [tuple(line) for line in entry["lines"]])
+        inner.add_done_callback(lambda f: self._settle(entry, replay, f, result))
+        return result
+
+    def _settle(self, entry, replay, inner, result):
+        bill_no = entry["bill"]
+        error = inner.exception()
+        with self._lock:
+            self._in_flight.discard(bill_no)
+            unattended = replay or bill_no in self._detached
+            retry = False
+            if error is None:
+                self._detached.discard(bill_no)
+                self._pending.pop(bill_no, None)
+                # Losing this marker is harmless: a replay finds the bill already saved
+                self._append({"done": bill_no}, sync=False)
+                self._compact()
+            elif isinstance(error, InsufficientStock) and not unattended:
+                # The cashier is told it failed and may reuse the number: make that durable first
+                self._pending.pop(bill_no, None)
+                self._append({"void": bill_no})
+            elif unattended and not retryable(error):
+                self._detached.discard(bill_no)
+                self._reject(entry, error)
+            else:
+                retry = True
+        if error is None:
+            if unattended:
+                self._posted(entry)
+            result.set_result(inner.result())
+            return
+        if retry:
+            logging.warning(f"JOURNAL: bill {bill_no} not posted yet, will retry: {error}")
+            if not replay:
+                self._wake.set()
+        result.set_exception(error)
+
+    def _posted(self, entry):
+        """Follow-up the billing screen did not do for a bill posted in the background."""
+        logging.info(f"JOURNAL: bill {entry['bill']} posted")
+        self.db.products.refresh_index([line[0] for line in entry["lines"]])
+        if entry["customer"][0]:
+            self.db.customers.refresh_index([entry["customer"][0]])
+        self.db.changes.publish("bills", [entry["bill"]])
+        try:
+            self.db.receipts.render(entry["bill"])
+        except Exception as e:
+            logging.error(f"RECEIPT NOT QUEUED for {entry['bill']}: {e}")
+
+    # --- Replayer ---
+
+    def start(self, counter=None):
+        """Replays bills left over from the last run, then keeps retrying failed ones."""
+        self.counter = counter
+        with self._lock:
+            self._open()
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._replay, name="bill-journal", daemon=True)
+            self._thread.start()
+        return self
+
+    def _replay(self):
+        delay = RETRY_MIN
+        while not self._stop.is_set():
+            # Cleared before looking, so a wake-up for a bill added meanwhile is kept
+            self._wake.clear()
+            with self._lock:
+                due = [entry for bill_no, entry in self._pending.items() if bill_no not in self._in_flight]
+                self._in_flight.update(entry["bill"] for entry in due)
+            failed = False
+            for n, entry in enumerate(due):
+                try:
+                    self._post(entry, replay=True).result()
+                except Exception as e:
+                    if not retryable(e):
+                        # Set aside by _settle; the bills behind it go on
+                        continue
+                    # Keep journal order: later bills wait for this one
+                    failed = True
+                    with self._lock:
+                        self._in_flight.difference_update(later["bill"] for later in due[n + 1:])
+                    break
+            if failed:
+                self._stop.wait(delay)
+                delay = min(delay * 2, RETRY_MAX)
+                continue
+            delay = RETRY_MIN
+            self._wake.wait()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
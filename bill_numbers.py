@@ -0,0 +1,159 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+# Series prefix for this terminal; counters default to their counter name
+BILL_PREFIX = os.environ.get("CRACKERSHOP_BILL_PREFIX") or os.environ.get("CRACKERSHOP_COUNTER") or "BILL"
+# CRACKERSHOP_BILL_FY_RESET=1 starts every financial year (April-March) from 1
+FY_RESET = os.environ.get("CRACKERSHOP_BILL_FY_RESET", "0") == "1"
+BLOCK_SIZE = int(os.environ.get("CRACKERSHOP_BILL_BLOCK", "50"))
+
+
+def financial_year(day, start_month=4):
+    """Indian financial year label, e.g. 2026-27 for 18 Oct 2026."""
+    start = day.year if day.month >= start_month else day.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+class BillNumberAllocator:
+    """Collision-free bill numbers: PREFIX-000123, or PREFIX-2026-27-000123 with FY reset.
+
+    Each series (prefix, plus financial year when resetting) has one counter
+    row in bill_sequences. A terminal claims a block of `block_size` numbers
+    in one short transaction and then hands them out from memory, so
+    numbering a bill needs no database round trip. The next block is
+    claimed through the write queue while the current one still has
+    numbers left (and the first one from start()), so checkout never waits
+    for the write lock that a backup or archive may be holding. Claimed
+    blocks are recorded in bill_blocks; on exit the unused tail is given
+    back, and gaps() lists numbers that were claimed but never became a bill.
+    """
+
+    def __init__(self, db, prefix=BILL_PREFIX, block_size=BLOCK_SIZE, fy_reset=FY_RESET):
+        self.db = db
+        self.prefix = prefix
+        self.block_size = block_size
+        self.fy_reset = fy_reset
+        self.terminal = prefix
+        self._lock = threading.Lock()
+        self._scope = None
+        self._block = None  # (first, last)
+        self._next = None
+        # Future of the block claimed ahead: (scope, (first, last))
+        self._claiming = None
+        # Claim the next block once this few numbers are left
+        self.low_water = max(1, block_size // 5)
+        atexit.register(self.close)
+
+    def start(self):
+        """Claims the first block in the background."""
+        with self._lock:
+            self._prefetch(self.scope())
+        return self
+
+    def scope(self, day=None):
+        if not self.fy_reset:
+            return self.prefix
+        return f"{self.prefix}-{financial_year(day or date.today())}"
+
+    def format(self, scope, number):
+        return f"{scope}-{number:06d}"
+
+    def next(self):
+        """The next bill number for this terminal."""
+        with self._lock:
+            scope = self.scope()
+            if scope != self._scope:
+                # New financial year: the old series is finished
+                self._release()
+                self._scope = scope
+            if self._block is None or self._next > self._block[1]:
+                self._block = self._take(scope)
+                self._next = self._block[0]
+            number = self._next
+            self._next += 1
+            if self._block[1] - number < self.low_water:
+                self._prefetch(scope)
+            return self.format(scope, number)
+
+    def _prefetch(self, scope):
+        if self._claiming is None:
+            self._claiming = self.db.writes.submit(self._claim, scope)
+
+    def _claim(self, conn, scope):
+        block = self.db.sequences.claim(scope, self.block_size, self.terminal, int(time.time()), conn)
+        logging.info(f"BILL NUMBERS: claimed {scope} {block[0]}-{block[1]}")
+        return scope, block
+
+    def _take(self, scope):
+        """The block claimed ahead, waiting for it only if it is not in yet."""
+        future, self._claiming = self._claiming, None
+        claimed = None
+        if future is not None:
+            try:
+                claimed = future.result()
+            except Exception as e:
+                # Lost to a lock or a busy moment: claim again now rather than fail the checkout
+                logging.warning(f"BILL NUMBERS: claiming ahead failed ({e}), claiming again")
+        if claimed is None:
+            claimed = self.db.writes.submit(self._claim, scope).result()
+        claimed_scope, block = claimed
+        if claimed_scope != scope:
+            # Claimed just before the financial year turned
+            self._trim(claimed_scope, block[0], block[1], block[0] - 1)
+            return self._take(scope)
+        return block
+
+    def give_back(self, bill_no):
+        """Returns the number just issued when its bill was not saved, so it is reused."""
+        with self._lock:
+            if self._block and bill_no == self.format(self._scope, self._next - 1) and self._next > self._block[0]:
+                self._next -= 1
+
+    def close(self):
+        """Gives the block claimed ahead and the unused end of the current block back to the series."""
+        with self._lock:
+            future, self._claiming = self._claiming, None
+            if future is not None:
+                try:
+                    scope, (first, last) = future.result(timeout=5)
+                except Exception:
+                    scope = None
+                # The newest block goes first, so the current one can be rewound after it
+                if scope is not None:
+                    self._trim(scope, first, last, first - 1)
+            self._release()
+
+    def _release(self):
+        if self._block is None:
+            return
+        first, last = self._block
+        self._trim(self._scope, first, last, self._next - 1)
+        self._block = None
+
+    def _trim(self, scope, first, last, used_last):
+        try:
+            self.db.sequences.trim(scope, first, last, used_last)
+        except Exception as e:
+            # Not fatal: the unused numbers just show up in gaps()
+            logging.error(f"BILL NUMBERS: could not release {scope} {used_last + 1}-{last}: {e}")
+
+    def gaps(self):
+        """Claimed numbers with no bill, excluding this terminal's unissued numbers."""
+        issued_by_scope = {}
+        missing = []
+        claiming = self._claiming
+        ahead = claiming.result() if claiming is not None and claiming.done() and not claiming.exception() else None
+        for scope, first, last in self.db.sequences.blocks():
+            if scope not in issued_by_scope:
+                issued_by_scope[scope] = set(self.db.sequences.issued(scope))
+            if scope == self._scope and self._block and first == self._block[0]:
+                last = self._next - 1
+            elif ahead is not None and (scope, first) == (ahead[0], ahead[1][0]):
+                continue
+            missing.extend(bill_no for bill_no in (self.format(scope, n) for n in range(first, last + 1))
+                           if bill_no not in issued_by_scope[scope])
+        return missing
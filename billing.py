@@ -1,15 +1,29 @@
 import customtkinter as ctk
 from tkinter import messagebox, ttk
-from datetime import datetime
 import time, logging
+from collections import deque
+from query_scheduler import QueryScheduler
+from repositories import InsufficientStock
+from services.billing import BillingService
+from customer_index import normalize_phone
+
+# Seconds the cashier waits for a commit before the journal takes over
+CHECKOUT_WAIT = 1.5
 
 class BillingModule:
-    def __init__(self, main_view, db, current_user):
+    def __init__(self, main_view, db, current_user, counter=None):
         # Added current_user to track who is billing
         self.main_view = main_view
         self.db = db
         self.current_user = current_user
-        self.cart = []
+        # terminals.CounterClient in multi-counter mode; None when this process owns the DB
+        self.counter = counter
+        self.service = BillingService(db, counter)
+        self.cart = self.service.new_cart()
+        self.search_results = {}
+        self.scans = deque()
+        self.draining = False
+        self.saving = False
 
     def render(self):
         for w in self.main_view.winfo_children(): w.destroy()
@@ -32,14 +46,19 @@ class BillingModule:
         self.c_address = ctk.CTkEntry(c_frame, placeholder_text="Shipping Address", width=350)
         self.c_address.grid(row=0, column=3, padx=5, pady=5)
 
+        # Known customers matching the digits typed so far
+        self.customer_matches = {}
+        self.c_suggest = ctk.CTkComboBox(c_frame, values=[], width=220, command=self.pick_customer)
+        self.c_suggest.set("")
+        self.c_suggest.grid(row=0, column=4, padx=5, pady=5)
+
         # --- Search & Filter Frame ---
         f = ctk.CTkFrame(self.main_view)
         f.pack(fill="x", padx=20, pady=10)
         
         ctk.CTkLabel(f, text="Category:").grid(row=0, column=0, padx=5)
-        self.db.cursor.execute("SELECT name FROM categories")
-        cats = ["All Categories"] + [r[0] for r in self.db.cursor.fetchall()]
-        self.cat_filter = ctk.CTkComboBox(f, values=cats, width=140, command=lambda x: self.handle_search())
+        cats = ["All Categories"] + self.db.categories.names()
+        self.cat_filter = ctk.CTkComboBox(f, values=cats, width=140, command=lambda x: self.handle_search(debounce=False))
         self.cat_filter.set("All Categories")
         self.cat_filter.grid(row=0, column=1, padx=5)
 
@@ -51,6 +70,8 @@ class BillingModule:
 
         self.res_dropdown = ctk.CTkComboBox(f, values=[], width=280)
         self.res_dropdown.grid(row=0, column=4, padx=5)
+        # The index answers in well under a millisecond, so a short debounce will do
+        self.search = QueryScheduler(self.res_dropdown, self.db, delay=80)
 
         self.qty = ctk.CTkEntry(f, placeholder_text="Qty", width=60)
         self.qty.insert(0, "1")
@@ -58,13 +79,25 @@ class BillingModule:
         
         ctk.CTkButton(f, text="Add", width=80, command=self.add_to_cart).grid(row=0, column=6, padx=10)
 
+        # Express lane: a barcode scanner types the code and presses Enter
+        ctk.CTkLabel(f, text="Scan:").grid(row=1, column=2, padx=5, pady=(0, 5))
+        self.scan_entry = ctk.CTkEntry(f, placeholder_text="Scan product code...", width=150)
+        self.scan_entry.grid(row=1, column=3, padx=5, pady=(0, 5))
+        self.scan_entry.bind("<Return>", lambda e: self.queue_scan())
+        self.scan_status = ctk.CTkLabel(f, text="", anchor="w")
+        self.scan_status.grid(row=1, column=4, columnspan=3, sticky="w", padx=5, pady=(0, 5))
+
         # --- Cart Table ---
-        cols = ("Code", "Item Name", "Category", "Price", "Qty", "Total")
+        cols = ("Code", "Item Name", "Category", "Price", "Qty", "Total", "Discount")
         self.tree = ttk.Treeview(self.main_view, columns=cols, show='headings')
         for c in cols: 
             self.tree.heading(c, text=c)
             self.tree.column(c, width=120, anchor="center")
         self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+        self.tree.bind("<Delete>", lambda e: self.remove_selected())
+        if self.counter:
+            # Leaving the screen drops the cart, so give its stock back to the other counters
+            self.tree.bind("<Destroy>", lambda e: self.service.release())
 
         # --- Footer ---
         footer = ctk.CTkFrame(self.main_view, fg_color="transparent")
@@ -76,114 +109,278 @@ class BillingModule:
         self.total_lbl = ctk.CTkLabel(footer, text="Grand Total: ₹0.00", font=("Arial", 20, "bold"), text_color="#2ecc71")
         self.total_lbl.pack(side="right", padx=20)
         
-        ctk.CTkButton(footer, text="Complete Sale", fg_color="#27ae60", command=self.checkout).pack(side="right", padx=20)
+        self.checkout_btn = ctk.CTkButton(footer, text="Complete Sale", fg_color="#27ae60", command=self.checkout)
+        self.checkout_btn.pack(side="right", padx=20)
 
-        self.handle_search()
+        # Suspended bills: park the current cart, serve the next customer, resume later
+        ctk.CTkButton(footer, text="Resume", width=70, fg_color="#3498db", command=self.resume_bill).pack(side="right", padx=5)
+        self.parked_list = ctk.CTkComboBox(footer, values=[], width=200)
+        self.parked_list.pack(side="right", padx=5)
+        ctk.CTkButton(footer, text="Park Bill", width=80, fg_color="#7f8c8d", command=self.park_bill).pack(side="right", padx=5)
+        self.refresh_parked()
+
+        if self.cart:
+            self.service.sync(self.cart)
+        self.handle_search(debounce=False)
+        self.scan_entry.focus_set()
 
     def lookup_customer(self):
-        """Auto-fills name and address if phone exists in DB."""
+        """Suggests customers from the 4th digit; auto-fills name and address on a full match."""
         phone = self.c_phone.get().strip()
-        if len(phone) >= 10:
-            self.db.cursor.execute("SELECT name, address FROM customers WHERE phone=?", (phone,))
-            res = self.db.cursor.fetchone()
+        self.customer_matches = {f"{p} - {n}": (p, n, a) for p, n, a in self.service.suggest_customers(phone)}
+        self.c_suggest.configure(values=list(self.customer_matches))
+        self.c_suggest.set(next(iter(self.customer_matches), ""))
+        if len(normalize_phone(phone)) >= 10:
+            res = self.service.find_customer(phone)
             if res:
-                self.c_name.delete(0, 'end')
-                self.c_name.insert(0, res[0])
-                self.c_address.delete(0, 'end')
-                self.c_address.insert(0, res[1])
+                self.fill_customer(*res)
+
+    def pick_customer(self, choice):
+        if choice in self.customer_matches:
+            self.fill_customer(*self.customer_matches[choice])
 
-    def get_cart_qty(self, product_name):
-        return sum(item[4] for item in self.cart if item[1] == product_name)
+    def fill_customer(self, phone, name, address):
+        # The stored spelling of the number, so the checkout upsert hits the same record
+        for entry, value in ((self.c_phone, phone), (self.c_name, name), (self.c_address, address)):
+            entry.delete(0, 'end')
+            if value: entry.insert(0, value)
 
-    def handle_search(self):
+    def customer(self):
+        return (self.c_phone.get().strip(), self.c_name.get().strip(), self.c_address.get().strip())
+
+    def handle_search(self, debounce=True):
         val = self.search_var.get()
         cat = self.cat_filter.get()
-        query = "SELECT name, stock FROM inventory WHERE (name LIKE ? OR product_code LIKE ?)"
-        params = [f"%{val}%", f"%{val}%"]
-        if cat != "All Categories":
-            query += " AND category = ?"
-            params.append(cat)
-        query += " ORDER BY name ASC LIMIT 50"
-        self.db.cursor.execute(query, params)
-        db_results = self.db.cursor.fetchall()
-        formatted_results = [f"{n} (Avail: {s - self.get_cart_qty(n)})" for n, s in db_results]
+        # Served from the in-memory index (or the stock daemon's); no query per keystroke
+        self.search.schedule(self.service.search_products, self.show_results,
+                             val, None if cat == "All Categories" else cat, delay=None if debounce else 0)
+
+    def show_results(self, results):
+        self.search_results = {f"{r[1]} (Avail: {r[4] - self.cart.qty(r[0])})": r[0] for r in results}
+        formatted_results = list(self.search_results)
         self.res_dropdown.configure(values=formatted_results)
         if formatted_results: self.res_dropdown.set(formatted_results[0])
 
     def add_to_cart(self):
+        if self.search.pending():
+            # Added before the debounced search caught up with the typing
+            self.search.cancel()
+            cat = self.cat_filter.get()
+            self.show_results(self.service.search_products(self.search_var.get(), None if cat == "All Categories" else cat))
         selected_raw = self.res_dropdown.get()
         if "No results found" in selected_raw or not selected_raw: return
         selected_name = selected_raw.split(" (Avail:")[0]
+        code = self.search_results.get(selected_raw)
+        if code is None:
+            res = self.db.products.get_by_name(selected_name)
+            if not res: return
+            code = res[0]
+        if self.saving:
+            # The cart on screen is being committed: this line is for the next bill, like a scan
+            self.scans.append((code, self.qty.get()))
+            self.scan_status.configure(text=f"Queued {selected_name} for the next bill", text_color="#f39c12")
+            self.start_draining()
+            return
         try:
-            qty_to_add = int(self.qty.get())
-            if qty_to_add <= 0: raise ValueError
-        except:
+            self.service.add_item(self.cart, code, self.qty.get())
+        except InsufficientStock:
+            messagebox.showerror("Stock Error", "Insufficient Stock!")
+            return
+        except KeyError:
+            return
+        except ValueError:
             messagebox.showerror("Error", "Enter a valid quantity")
             return
+        self.show_changes()
+        self.update_total()
+        self.handle_search(debounce=False)
 
-        self.db.cursor.execute("SELECT product_code, name, category, price, stock FROM inventory WHERE name=?", (selected_name,))
-        res = self.db.cursor.fetchone()
-        if res:
-            p_code, p_name, p_cat, p_price, p_db_stock = res
-            current_in_cart = self.get_cart_qty(p_name)
-            if (current_in_cart + qty_to_add) > p_db_stock:
-                messagebox.showerror("Stock Error", "Insufficient Stock!")
-                return
-            
-            found = False
-            for item in self.cart:
-                if item[0] == p_code:
-                    item[4] += qty_to_add
-                    item[5] = item[3] * item[4]
-                    found = True
-                    break
-            if not found:
-                self.cart.append([p_code, p_name, p_cat, p_price, qty_to_add, p_price * qty_to_add])
-
-            self.refresh_table()
+    def queue_scan(self):
+        """Takes the scanned code off the entry at once; the cart catches up in order."""
+        code = self.scan_entry.get().strip()
+        self.scan_entry.delete(0, 'end')
+        if code:
+            self.scans.append((code, 1))
+        self.start_draining()
+        return "break"
+
+    def start_draining(self):
+        if not self.draining:
+            self.draining = True
+            self.main_view.after_idle(self.drain_scans)
+
+    def drain_scans(self, batch=25):
+        """Applies queued (code, qty) scans a batch at a time so typing and redraws keep up."""
+        if not self.tree.winfo_exists():
+            self.scans.clear()
+            self.draining = False
+            return
+        if self.saving:
+            # Scans for the next customer wait until this bill is committed
+            self.main_view.after(50, self.drain_scans)
+            return
+        problems = []
+        added = 0
+        for _ in range(min(batch, len(self.scans))):
+            code, qty = self.scans.popleft()
+            try:
+                line = self.service.add_item(self.cart, code, qty)
+            except KeyError:
+                problems.append(f"Unknown code {code}")
+                continue
+            except ValueError:
+                problems.append(f"{code}: enter a valid quantity")
+                continue
+            except InsufficientStock as e:
+                problems.append(f"{e.lines[0][1]}: insufficient stock")
+                continue
+            self.show_changes()
+            added += 1
+            last = line[1]
+        if added:
             self.update_total()
-            self.handle_search() 
+            self.handle_search()
+        if problems:
+            # A dialog would stall the scanner; beep and show it inline instead
+            self.main_view.bell()
+            self.scan_status.configure(text=" | ".join(problems[-3:]), text_color="#e74c3c")
+        elif added:
+            self.scan_status.configure(text=f"Added {last}", text_color="#2ecc71")
+        if self.scans:
+            self.main_view.after(1, self.drain_scans)
+        else:
+            self.draining = False
+
+    def show_line(self, code, line):
+        """Updates one cart row in place; rows are keyed by product code."""
+        if line is None:
+            if self.tree.exists(code): self.tree.delete(code)
+        elif self.tree.exists(code):
+            self.tree.item(code, values=line)
+        else:
+            self.tree.insert("", "end", iid=code, values=line)
+
+    def show_changes(self):
+        """Redraws the lines the last cart change repriced, added or removed."""
+        for code in self.cart.changed:
+            self.show_line(code, self.cart.get(code))
+
+    def remove_selected(self):
+        if self.saving:
+            # These lines are already on their way to the database
+            self.main_view.bell()
+            self.scan_status.configure(text="Bill is being saved, it can no longer be changed", text_color="#e74c3c")
+            return
+        for code in self.tree.selection():
+            self.service.remove_item(self.cart, code)
+            self.show_changes()
+        self.update_total()
+        self.handle_search(debounce=False)
 
     def refresh_table(self):
         for i in self.tree.get_children(): self.tree.delete(i)
-        for item in self.cart: self.tree.insert("", "end", values=item)
+        for item in self.cart: self.tree.insert("", "end", iid=item[0], values=item)
 
     def update_total(self):
-        total = sum(i[5] for i in self.cart)
-        self.total_lbl.configure(text=f"Grand Total: ₹{total:.2f}")
+        saved = f"  (Discount ₹{self.cart.discount:.2f})" if self.cart.discount else ""
+        self.total_lbl.configure(text=f"Grand Total: ₹{self.cart.total:.2f}{saved}")
+
+    def refresh_parked(self):
+        self.parked = {}
+        for pid, ts, user, phone, name, cart_json in self.service.parked():
+            label = f"#{pid} {time.strftime('%H:%M', time.localtime(ts))} {name or phone or user or ''}".strip()
+            self.parked[label] = pid
+        self.parked_list.configure(values=list(self.parked))
+        self.parked_list.set(next(iter(self.parked), "No parked bills"))
+
+    def park_bill(self):
+        if not self.cart: return
+        self.service.park(self.cart, self.customer(), self.current_user)
+        self.cart = self.service.new_cart()
+        self.render()
+
+    def resume_bill(self):
+        pid = self.parked.get(self.parked_list.get())
+        if pid is None: return
+        if self.cart:
+            messagebox.showwarning("Cart in use", "Park or complete the current bill first.")
+            return
+        resumed = self.service.resume(pid)
+        if resumed is None:
+            messagebox.showerror("Error", "That bill was already resumed.")
+            self.refresh_parked()
+            return
+        customer, self.cart = resumed
+        self.fill_customer(*customer)
+        self.refresh_table()
+        self.update_total()
+        self.refresh_parked()
+        short = self.service.sync(self.cart)
+        if short:
+            messagebox.showwarning("Stock", "Other counters now hold some of this stock:\n" +
+                                   "\n".join(f"{name}: {wanted} in cart, {available} free" for code, name, wanted, available in short))
+        self.handle_search(debounce=False)
 
     def checkout(self):
         if not self.cart: return
-        phone = self.c_phone.get().strip()
-        name = self.c_name.get().strip()
-        addr = self.c_address.get().strip()
-        
-        bill_id = f"BILL-{int(time.time())}"
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        customer = self.customer()
+        # The bill is on disk in the journal before the writer thread commits it;
+        # the screen stays live meanwhile
+        self.checkout_btn.configure(state="disabled", text="Saving...")
+        self.saving = True
+        try:
+            bill_id, future = self.service.submit_bill(self.cart, customer, self.current_user)
+        except Exception as e:
+            # No bill number or the journal could not be written: nothing was saved
+            logging.error(f"CHECKOUT FAILED: {str(e)}")
+            self.saving = False
+            self.checkout_btn.configure(state="normal", text="Complete Sale")
+            messagebox.showerror("Error", f"Bill not saved, please try again:\n{e}")
+            return
+        self.main_view.after(20, self.poll_checkout, future, bill_id, customer, time.monotonic() + CHECKOUT_WAIT)
 
+    def poll_checkout(self, future, bill_id, customer, deadline=None):
+        if not future.done():
+            if deadline is None or time.monotonic() < deadline or not self.db.journal.detach(bill_id):
+                self.main_view.after(20, self.poll_checkout, future, bill_id, customer, deadline)
+                return
+            # Database busy (backup, long report): the journal finishes this bill in the background
+            logging.warning(f"CHECKOUT SLOW {bill_id}: left to the journal")
+            self.bill_journaled(bill_id)
+            return
+        on_screen = self.tree.winfo_exists()
         try:
-            # 1. Update/Save Customer CRM
-            if phone and name:
-                self.db.cursor.execute("""
-                    INSERT INTO customers (phone, name, address) VALUES (?,?,?)
-                    ON CONFLICT(phone) DO UPDATE SET name=excluded.name, address=excluded.address
-                """, (phone, name, addr))
-
-            # 2. Process Transactions
-            for item in self.cart:
-                p_code, p_name, p_cat, p_price, p_qty, p_total = item
-                # Update Stock
-                self.db.cursor.execute("UPDATE inventory SET stock=stock-?, sold_qty=sold_qty+? WHERE product_code=?", (p_qty, p_qty, p_code))
-                # Insert Sale Record with Customer and User Info
-                self.db.cursor.execute("""
-                    INSERT INTO sales (bill_id, item_name, category, quantity, total, customer_phone, created_by, date) 
-                    VALUES (?,?,?,?,?,?,?,?)
-                """, (bill_id, p_name, p_cat, p_qty, p_total, phone, self.current_user, now))
-
-            self.db.conn.commit()
-            messagebox.showinfo("Success", f"Bill {bill_id} Saved!\nBilled by: {self.current_user}")
-            self.cart = []
-            self.render()
+            future.result()
+        except InsufficientStock as e:
+            # Another terminal sold these first; nothing was saved, the cart stays for editing
+            self.saving = False
+            self.service.bill_rejected(bill_id, e)
+            short = "\n".join(f"{name}: {wanted} in cart, {available} in stock" for code, name, wanted, available in e.lines)
+            messagebox.showerror("Stock Error", f"Not enough stock, bill not saved:\n{short}")
+            if on_screen:
+                self.checkout_btn.configure(state="normal", text="Complete Sale")
+                self.handle_search(debounce=False)
+            return
         except Exception as e:
+            # Locked database, daemon down...: the bill is safe in the journal and will be posted
             logging.error(f"CHECKOUT ERROR: {str(e)}")
-            messagebox.showerror("Error", f"Checkout failed: {e}")
\ No newline at end of file
+            self.bill_journaled(bill_id)
+            return
+        # Invoice PDF and thermal receipt render in the background while the next customer is billed
+        self.service.bill_saved(bill_id, self.cart, customer)
+        self.next_bill("Success", f"Bill {bill_id} Saved!\nBilled by: {self.current_user}")
+
+    def bill_journaled(self, bill_id):
+        """The bill is journaled but not yet in the database; billing goes on."""
+        self.next_bill("Saved", f"Bill {bill_id} saved to the local journal.\n"
+                       "The database is busy; it will be posted automatically.")
+
+    def next_bill(self, title, message):
+        """Swaps in a fresh cart, lets the lines queued during the save into it, then tells the cashier."""
+        # The dialog runs a nested event loop: the swap must be done before it opens,
+        # or queued lines would land in the committed cart and be thrown away
+        self.cart = self.service.new_cart()
+        self.saving = False
+        if self.tree.winfo_exists(): self.render()
+        if self.scans: self.start_draining()
+        self.main_view.after_idle(messagebox.showinfo, title, message)
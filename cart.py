@@ -0,0 +1,110 @@
+import json
+
+
+class Cart:
+    """Bill lines keyed by product_code, in the order they were added.
+
+    Each line is [code, name, category, price, qty, total, discount]: the
+    row layout the cart Treeview and SalesRepo.insert_bill use, with total
+    the net amount after the line's discount. With a pricing.PriceBook the
+    whole cart is repriced on every change (slab discounts depend on other
+    lines); `changed` then holds the codes whose line changed, so a screen
+    only redraws those rows.
+    """
+
+    def __init__(self, lines=(), book=None):
+        self._lines = {}
+        self.book = book
+        self.version = None
+        self.total = 0.0
+        self.discount = 0.0
+        self.changed = set()
+        for line in lines:
+            self._lines[line[0]] = list(line[:5]) + [0.0, 0.0]
+        self.reprice()
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return iter(self._lines.values())
+
+    def __contains__(self, code):
+        return code in self._lines
+
+    def get(self, code):
+        return self._lines.get(code)
+
+    def qty(self, code):
+        """Quantity of a product already reserved by this bill."""
+        line = self._lines.get(code)
+        return line[4] if line else 0
+
+    def codes(self):
+        return list(self._lines)
+
+    def lines(self):
+        """Snapshot of the lines as tuples, e.g. for the writer thread."""
+        return [tuple(line) for line in self._lines.values()]
+
+    def add(self, code, name, category, price, qty):
+        """Adds qty of a product, merging with its existing line; returns the line."""
+        line = self._lines.get(code)
+        if line is None:
+            line = self._lines[code] = [code, name, category, price, 0, 0.0, 0.0]
+        return self.set_qty(code, line[4] + qty)
+
+    def set_qty(self, code, qty):
+        """Sets a line's quantity (0 removes it); returns the line or None."""
+        if qty <= 0:
+            return self.remove(code)
+        self._lines[code][4] = qty
+        self.reprice()
+        self.changed.add(code)
+        return self._lines[code]
+
+    def remove(self, code):
+        if self._lines.pop(code, None) is not None:
+            self.reprice()
+            self.changed.add(code)
+        return None
+
+    def clear(self):
+        self._lines.clear()
+        self.total = self.discount = 0.0
+        self.changed = set()
+
+    # --- Pricing ---
+
+    def stale(self):
+        """True when the price book changed since the cart was last priced."""
+        return self.book is not None and self.version != self.book.version
+
+    def reprice(self):
+        """Prices every line in one pass and updates the totals; returns the changed codes."""
+        lines = list(self._lines.values())
+        if self.book is None:
+            priced = [(line[3], line[3] * line[4], 0.0) for line in lines]
+        else:
+            self.version = self.book.version
+            priced = self.book.price([(line[0], line[2], line[3], line[4]) for line in lines])
+        changed = set()
+        total = discount = 0.0
+        for line, (price, net, off) in zip(lines, priced):
+            if line[3] != price or line[5] != net or line[6] != off:
+                line[3], line[5], line[6] = price, net, off
+                changed.add(line[0])
+            total += net
+            discount += off
+        self.total, self.discount = round(total, 2), round(discount, 2)
+        self.changed = changed
+        return changed
+
+    # --- Parking ---
+
+    def to_json(self):
+        return json.dumps(self.lines())
+
+    @classmethod
+    def from_json(cls, text, book=None):
+        return cls(json.loads(text), book)
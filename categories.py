@@ -1,10 +1,13 @@
 import customtkinter as ctk
 from tkinter import messagebox, ttk, filedialog
 import csv, logging, os
+from import_dialog import ImportDialog
+from services.inventory import InventoryService
 
 class CategoryModule:
     def __init__(self, main_view, db):
         self.main_view, self.db = main_view, db
+        self.service = InventoryService(db)
 
     def render(self):
         for w in self.main_view.winfo_children(): w.destroy()
@@ -48,11 +51,7 @@ class CategoryModule:
             return messagebox.showwarning("Error", "Code and Name required")
         
         try:
-            self.db.cursor.execute("""
-                INSERT INTO categories (cat_code, name, description) VALUES (?, ?, ?)
-                ON CONFLICT(cat_code) DO UPDATE SET name=excluded.name, description=excluded.description
-            """, (code, name, desc))
-            self.db.conn.commit()
+            self.db.categories.upsert(code, name, desc)
             logging.info(f"CATEGORY SAVED: {code} - {name}")
             self.refresh()
             self.c_code.delete(0, 'end'); self.c_name.delete(0, 'end'); self.c_desc.delete(0, 'end')
@@ -65,21 +64,18 @@ class CategoryModule:
         code = self.tree.item(sel[0])['values'][0]
         
         if messagebox.askyesno("Confirm", f"Delete category {code}? Items in inventory with this category will remain."):
-            self.db.cursor.execute("DELETE FROM categories WHERE cat_code=?", (code,))
-            self.db.conn.commit()
+            self.db.categories.delete(code)
             logging.warning(f"CATEGORY DELETED: {code}")
             self.refresh()
 
     def refresh(self):
         for i in self.tree.get_children(): self.tree.delete(i)
-        self.db.cursor.execute("SELECT cat_code, name, description FROM categories")
-        for r in self.db.cursor.fetchall(): self.tree.insert("", "end", values=r)
+        for r in self.db.categories.list(): self.tree.insert("", "end", values=r)
 
     def export_csv(self):
         if not os.path.exists("exports"): os.makedirs("exports")
         path = "exports/categories_backup.csv"
-        self.db.cursor.execute("SELECT cat_code, name, description FROM categories")
-        data = self.db.cursor.fetchall()
+        data = self.db.categories.list()
         with open(path, 'w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(["cat_code", "name", "description"])
@@ -89,13 +85,15 @@ class CategoryModule:
     def import_csv(self):
         path = filedialog.askopenfilename(filetypes=[("CSV", "*.csv")])
         if not path: return
-        try:
-            with open(path, 'r') as f:
-                reader = csv.DictReader(f)
-                for r in reader:
-                    self.db.cursor.execute("INSERT INTO categories (cat_code, name, description) VALUES (?,?,?) ON CONFLICT(cat_code) DO UPDATE SET name=excluded.name", (r['cat_code'], r['name'], r['description']))
-            self.db.conn.commit()
-            logging.info(f"CATEGORIES IMPORTED from {path}")
-            self.refresh()
-        except Exception as e:
-            messagebox.showerror("Error", "Required headers: cat_code, name, description")
\ No newline at end of file
+        ImportDialog(self.main_view, "Checking file", self.service.category_import(path, dry_run=True),
+                     lambda result: self.confirm_import(path, result))
+
+    def confirm_import(self, path, result):
+        if result.rows == result.errors:
+            return messagebox.showerror("Error", result.summary())
+        if messagebox.askyesno("Confirm Import", f"{result.summary()}\n\nApply these changes?"):
+            ImportDialog(self.main_view, "Importing", self.service.category_import(path), self.import_done)
+
+    def import_done(self, result):
+        self.refresh()
+        messagebox.showinfo("Import", result.summary())
\ No newline at end of file
@@ -0,0 +1,150 @@
+import logging
+import queue
+import threading
+from collections import namedtuple
+
+# op is "upsert" or "delete" for one row, or RELOAD (key None) when a table
+# changed in ways not known row by row: another process committed to it
+Change = namedtuple("Change", "table key op")
+UPSERT, DELETE, RELOAD = "upsert", "delete", "reload"
+
+# Tables reported as reloaded when another process commits
+TABLES = ("inventory", "customers", "categories", "price_rules", "users", "bills", "parked_bills")
+
+
+class ChangeBus:
+    """Row-level change notifications between the repositories, caches and screens.
+
+    Repositories publish (table, key, op) after their write has committed.
+    subscribe() callbacks run on the publishing thread (caches); watch()
+    hands changes to a screen on the Tk thread, batched, so a burst of
+    writes becomes one update.
+
+    Commits by other processes (another counter's stock daemon, a script)
+    are noticed through PRAGMA data_version, which moves whenever any other
+    connection commits, however many commits there were. So the version is
+    checked by the poller and also by every local writer while it holds the
+    write lock, just before it commits (before_commit), and noted again
+    right after (committed): a move found at a check is always another
+    process's, and is reported as RELOAD for every table.
+    """
+
+    def __init__(self, db, interval=1.0):
+        self.db = db
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._next_token = 0
+        # Poll connection and the data_version last accounted for, guarded by _version_lock
+        self._version_lock = threading.Lock()
+        self._conn = None
+        self._version = None
+        self._external = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, tables, callback):
+        """Calls callback(changes) for changes to `tables` (None: all); returns a token."""
+        with self._lock:
+            self._next_token += 1
+            self._subscribers[self._next_token] = (tables, callback)
+            return self._next_token
+
+    def unsubscribe(self, token):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def publish(self, table, keys, op=UPSERT):
+        changes = [Change(table, key, op) for key in keys]
+        if not changes:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for tables, callback in subscribers:
+            if tables is None or table in tables:
+                try:
+                    callback(changes)
+                except Exception as e:
+                    logging.error(f"CHANGE SUBSCRIBER FAILED on {table}: {e}")
+
+    def before_commit(self):
+        """Called by this process's writers holding the write lock, right before they commit."""
+        # Nothing else can commit now, so any move is another process's
+        self._check()
+
+    def committed(self):
+        """Called right after every commit made by this process, so it is not taken for another's."""
+        with self._version_lock:
+            if self._conn is not None:
+                self._version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def watch(self, widget, tables, callback, poll=200):
+        """Delivers changes to a screen: callback(changes) on the Tk thread every `poll` ms.
+
+        Repeated changes to a row are passed once. The watch ends when the
+        widget is destroyed (the screen was left).
+        """
+        pending = queue.SimpleQueue()
+        token = self.subscribe(tables, lambda changes: [pending.put(c) for c in changes])
+
+        def drain():
+            if not widget.winfo_exists():
+                self.unsubscribe(token)
+                return
+            changes = []
+            while True:
+                try:
+                    changes.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            if changes:
+                callback(list(dict.fromkeys(changes)))
+            widget.after(poll, drain)
+
+        widget.after(poll, drain)
+        return token
+
+    # --- Other processes ---
+
+    def start(self):
+        """Starts polling for commits made by other processes."""
+        if self._thread is None:
+            with self._version_lock:
+                self._conn = self.db.manager.connect(readonly=True)
+                self._version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            self._thread = threading.Thread(target=self._poll, name="change-poll", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _check(self):
+        with self._version_lock:
+            if self._conn is None:
+                return
+            current = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if current != self._version:
+                self._version = current
+                self._external = True
+
+    def _poll(self):
+        try:
+            while not self._stop.wait(self.interval):
+                self._check()
+                self.publish_external()
+        except Exception as e:
+            logging.error(f"CHANGE POLL STOPPED: {e}")
+        finally:
+            with self._version_lock:
+                self._conn.close()
+                self._conn = None
+
+    def publish_external(self):
+        """Reports another process's commits found since the last call as RELOAD for every table."""
+        with self._version_lock:
+            external, self._external = self._external, False
+        if external:
+            # Published here rather than in before_commit, where the writer still holds the lock
+            logging.info("CHANGE BUS: database changed by another process")
+            for table in TABLES:
+                self.publish(table, [None], RELOAD)
@@ -0,0 +1,371 @@
+"""Streaming CSV imports for inventory and categories.
+
+A file is read one row at a time: its header is mapped onto the table's
+fields (alternative spellings and missing optional columns are fine), every
+row is validated, bad rows go to an error report instead of stopping the
+import, and good rows are committed in chunks through the write queue. A
+dry run does everything except the commit and writes a diff of what the
+import would change.
+
+    result = ProductImport(db, "supplier.csv", dry_run=True).run()
+    print(result.summary())
+"""
+import abc
+import csv
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+
+EXPORT_DIR = "exports"
+REQUIRED = object()
+
+
+def normalize(name):
+    """Header spelling that ignores case, spaces and punctuation ('Disc %' -> 'disc')."""
+    return "".join(ch for ch in name.lower() if ch.isalnum())
+
+
+# --- Field parsers: raise ValueError with a message fit for the error report ---
+
+def text(value):
+    value = value.strip()
+    if not value:
+        raise ValueError("is empty")
+    return value
+
+
+def code(value):
+    return text(value).upper()
+
+
+def optional_text(value):
+    return value.strip()
+
+
+def number(value):
+    value = value.strip().replace(",", "")
+    try:
+        amount = float(value)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a number")
+    if amount < 0:
+        raise ValueError("cannot be negative")
+    return amount
+
+
+def whole(value):
+    amount = number(value)
+    if amount != int(amount):
+        raise ValueError(f"'{value.strip()}' is not a whole number")
+    return int(amount)
+
+
+def percent(value):
+    amount = number(value.strip().rstrip("%"))
+    if amount > 100:
+        raise ValueError("must be 0-100")
+    return amount
+
+
+class Field:
+    """One column of an import: its name, other accepted headers, parser and default."""
+
+    def __init__(self, name, parse, default=REQUIRED, aliases=()):
+        self.name = name
+        self.parse = parse
+        self.default = default
+        self.headers = {normalize(name)} | {normalize(a) for a in aliases}
+
+
+def map_header(header, fields, mapping=None):
+    """{field name: column index} for a CSV header row.
+
+    `mapping` ({field name: header text}) overrides the automatic match.
+    Raises ValueError naming every required field with no column.
+    """
+    positions = {normalize(h): i for i, h in reversed(list(enumerate(header)))}
+    columns = {}
+    for field in fields:
+        wanted = {normalize(mapping[field.name])} if mapping and field.name in mapping else field.headers
+        found = [positions[h] for h in wanted if h in positions]
+        if found:
+            columns[field.name] = min(found)
+    missing = [f.name for f in fields if f.name not in columns and f.default is REQUIRED]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)} (found: {', '.join(header)})")
+    return columns
+
+
+class ImportResult:
+    """What an import did (or, for a dry run, would do)."""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.cancelled = False
+        self.error_file = None
+        self.diff_file = None
+        # First few changes for a screen to show; the diff file has them all
+        self.changes = []
+
+    def summary(self):
+        verb = "Would import" if self.dry_run else "Imported"
+        lines = [f"{verb} {self.rows - self.errors} of {self.rows} rows: {self.added} new, "
+                 f"{self.updated} changed, {self.unchanged} unchanged."]
+        if self.cancelled:
+            lines.append("Cancelled: rows after the last saved chunk were not imported.")
+        if self.errors:
+            lines.append(f"{self.errors} row(s) rejected, see {self.error_file}")
+        if self.diff_file:
+            lines.append(f"Changes listed in {self.diff_file}")
+        return "\n".join(lines)
+
+
+class CsvImport(abc.ABC):
+    """One CSV file imported into one table; subclasses describe the table.
+
+    run() imports on the calling thread and returns an ImportResult;
+    start() does the same on a worker thread and returns a Future. Each
+    chunk of valid rows is one write-queue job, so billing keeps going
+    during a long import and cancel() stops at the next chunk boundary
+    with every earlier chunk saved. `progress(fraction, rows)` is called
+    after every chunk, on the importing thread.
+    """
+
+    FIELDS = ()
+    KIND = "rows"
+    MAX_CHANGES = 200
+
+    def __init__(self, db, path, dry_run=False, mapping=None, progress=None, chunk_size=500, directory=EXPORT_DIR):
+        self.db = db
+        self.path = path
+        self.dry_run = dry_run
+        self.mapping = mapping
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.directory = directory
+        self.fraction = 0.0
+        self._cancel = threading.Event()
+        self._read = 0
+        self._reports = {}
+        # Dry runs store nothing, so later chunks must build on what earlier ones would have done
+        self._seen = {}
+
+    # --- Table specifics ---
+
+    @abc.abstractmethod
+    def current(self, keys):
+        """{key: row} of the rows already stored for these keys."""
+
+    def merged(self, old, new):
+        """The row as it will be stored once `new` is imported over `old` (None if new)."""
+        return new
+
+    @abc.abstractmethod
+    def apply(self, conn, rows):
+        """Writes one chunk; runs on the writer thread inside its transaction."""
+
+    def applied(self, rows):
+        """After a chunk commits (e.g. to refresh caches)."""
+
+    # --- Running ---
+
+    def cancel(self):
+        self._cancel.set()
+
+    def start(self):
+        """Runs the import on a worker thread; returns a Future with the ImportResult."""
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.run())
+            except Exception as e:
+                logging.error(f"CSV IMPORT FAILED: {self.path}: {e}")
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="csv-import", daemon=True).start()
+        return future
+
+    def run(self):
+        result = ImportResult(self.dry_run)
+        size = os.path.getsize(self.path) or 1
+        try:
+            with open(self.path, mode='r', newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(self._counted(f))
+                header = next(reader, None)
+                if not header:
+                    raise ValueError("The file is empty")
+                columns = map_header(header, self.FIELDS, self.mapping)
+                chunk = []
+                for row in reader:
+                    if not any(cell.strip() for cell in row):
+                        continue
+                    result.rows += 1
+                    try:
+                        chunk.append(self.parse(row, columns))
+                    except ValueError as e:
+                        self.reject(result, header, reader.line_num, row, e)
+                        continue
+                    if len(chunk) >= self.chunk_size:
+                        self.flush(chunk, result)
+                        chunk = []
+                        self.report_progress(self._read / size, result.rows)
+                        if self._cancel.is_set():
+                            result.cancelled = True
+                            break
+                else:
+                    if chunk:
+                        self.flush(chunk, result)
+                    self.report_progress(1.0, result.rows)
+        finally:
+            for f, writer in self._reports.values():
+                f.close()
+        mode = "DRY RUN" if self.dry_run else "CSV IMPORT"
+        logging.info(f"{mode}: {self.KIND} from {self.path}: {result.rows} rows, {result.added} new, "
+                     f"{result.updated} changed, {result.errors} rejected{', cancelled' if result.cancelled else ''}")
+        return result
+
+    def _counted(self, f):
+        # csv.reader consumes the file by iteration, where tell() is unavailable
+        for line in f:
+            self._read += len(line)
+            yield line
+
+    def report_progress(self, fraction, rows):
+        self.fraction = min(fraction, 1.0)
+        if self.progress:
+            self.progress(self.fraction, rows)
+
+    def parse(self, row, columns):
+        values, problems = [], []
+        for field in self.FIELDS:
+            i = columns.get(field.name)
+            raw = row[i] if i is not None and i < len(row) else ""
+            if not raw.strip() and field.default is not REQUIRED:
+                values.append(field.default)
+                continue
+            try:
+                values.append(field.parse(raw))
+            except ValueError as e:
+                problems.append(f"{field.name} {e}")
+        if problems:
+            raise ValueError("; ".join(problems))
+        return tuple(values)
+
+    def flush(self, chunk, result):
+        keys = {row[0] for row in chunk}
+        found = {key: self._seen[key] for key in keys if key in self._seen}
+        if keys - found.keys():
+            found.update(self.current(keys - found.keys()))
+        for row in chunk:
+            old = found.get(row[0])
+            new = self.merged(old, row)
+            # Later rows of the same key in this chunk build on the earlier ones
+            found[row[0]] = new
+            if old is None:
+                result.added += 1
+                self.record_change(result, "new", None, new)
+            elif tuple(old) != tuple(new):
+                result.updated += 1
+                self.record_change(result, "changed", old, new)
+            else:
+                result.unchanged += 1
+        if self.dry_run:
+            self._seen.update(found)
+        else:
+            self.db.writes.submit(self.apply, chunk).result()
+            self.applied(chunk)
+
+    # --- Reports ---
+
+    def report(self, name, header):
+        """The CSV writer for one report file next to the exports, opened on first use."""
+        if name not in self._reports:
+            os.makedirs(self.directory, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(self.path))[0]
+            path = os.path.join(self.directory, f"{stem}_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.csv")
+            f = open(path, mode='w', newline='', encoding='utf-8')
+            writer = csv.writer(f)
+            writer.writerow(header)
+            self._reports[name] = (f, writer)
+        return self._reports[name][1]
+
+    def reject(self, result, header, line, row, error):
+        result.errors += 1
+        self.report("errors", ["line", "error"] + header).writerow([line, str(error)] + row)
+        result.error_file = self._reports["errors"][0].name
+
+    def record_change(self, result, change, old, new):
+        """Adds one row's changes to the diff: one line per changed field (dry runs only)."""
+        if not self.dry_run:
+            return
+        writer = self.report("changes", ["change", "key", "field", "old", "new"])
+        result.diff_file = self._reports["changes"][0].name
+        for i, field in enumerate(self.FIELDS):
+            before = None if old is None else old[i]
+            if before != new[i]:
+                writer.writerow([change, new[0], field.name, "" if before is None else before, new[i]])
+                if len(result.changes) < self.MAX_CHANGES:
+                    result.changes.append((change, new[0], field.name, before, new[i]))
+
+
+class ProductImport(CsvImport):
+    """Inventory rows; incoming stock is added to what is on hand as an import move."""
+
+    KIND = "products"
+    FIELDS = (
+        Field("product_code", code, aliases=("code", "sku", "item code", "product code")),
+        Field("name", text, aliases=("product", "product name", "item", "item name")),
+        Field("category", text, default="General", aliases=("cat", "category name")),
+        Field("price", number, aliases=("rate", "mrp", "unit price")),
+        Field("stock", whole, default=0, aliases=("qty", "quantity")),
+        Field("discount_percent", percent, default=0.0, aliases=("discount", "disc", "disc %")),
+    )
+
+    def current(self, keys):
+        return {row[0]: row for row in self.db.products.import_rows(set(keys))}
+
+    def merged(self, old, new):
+        if old is None:
+            return new
+        # An existing product keeps its category and gains the stock
+        code, name, category, price, stock, discount = new
+        return (code, name, old[2], price, old[4] + stock, discount)
+
+    def apply(self, conn, rows):
+        self.db.products.bulk_import(rows, conn, ref=os.path.basename(self.path))
+
+    def applied(self, rows):
+        self.db.products.refresh_index({row[0] for row in rows})
+
+
+class CategoryImport(CsvImport):
+    """Categories; existing ones are renamed and keep their description."""
+
+    KIND = "categories"
+    FIELDS = (
+        Field("cat_code", code, aliases=("code", "category code")),
+        Field("name", text, aliases=("category", "category name")),
+        Field("description", optional_text, default="", aliases=("desc", "details")),
+    )
+
+    def current(self, keys):
+        return {row[0]: row for row in self.db.categories.import_rows(set(keys))}
+
+    def merged(self, old, new):
+        return new if old is None else (new[0], new[1], old[2])
+
+    def apply(self, conn, rows):
+        self.db.categories.bulk_import(rows, conn)
+
+    def applied(self, rows):
+        self.db.changes.publish("categories", [row[0] for row in rows])
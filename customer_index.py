@@ -0,0 +1,107 @@
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+COUNTRY_CODE = "91"
+
+
+def normalize_phone(text):
+    """Digits only, without the +91 / 0 prefixes: '+91 98765-43210' -> '9876543210'."""
+    digits = "".join(ch for ch in str(text or "") if ch.isdigit())
+    if len(digits) > 10 and digits.startswith(COUNTRY_CODE):
+        digits = digits[len(COUNTRY_CODE):]
+    if len(digits) > 10 and digits.startswith("0"):
+        digits = digits[1:]
+    return digits
+
+
+class CustomerIndex:
+    """Phone-prefix index over customers for the billing screen.
+
+    Normalized phones are kept in one sorted list of (normalized, stored
+    phone) pairs, so the customers sharing a typed prefix are a single
+    bisect range; unlike a node-per-digit trie this stays a few bytes per
+    customer. Names and addresses are only needed for the handful of
+    suggestions on screen, so they sit in an LRU cache of `cache_size`
+    entries and are read by primary key on a miss.
+    """
+
+    def __init__(self, phones, fetch, cache_size=2000):
+        self._fetch = fetch
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._details = OrderedDict()
+        self._keys = sorted((normalize_phone(p), p) for p in phones)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _range(self, prefix):
+        i = bisect_left(self._keys, (prefix,))
+        while i < len(self._keys) and self._keys[i][0].startswith(prefix):
+            yield self._keys[i][1]
+            i += 1
+
+    def details(self, phone):
+        """(name, address) of a stored phone, from the LRU cache or the database."""
+        with self._lock:
+            if phone in self._details:
+                self._details.move_to_end(phone)
+                return self._details[phone]
+        row = self._fetch(phone)
+        if row is not None:
+            with self._lock:
+                self._details[phone] = tuple(row)
+                if len(self._details) > self.cache_size:
+                    self._details.popitem(last=False)
+        return row
+
+    def find(self, text):
+        """Exact match on the normalized number: (stored phone, name, address) or None."""
+        key = normalize_phone(text)
+        with self._lock:
+            phones = [p for p in self._range(key) if normalize_phone(p) == key]
+        for phone in phones:
+            row = self.details(phone)
+            if row is not None:
+                return (phone,) + tuple(row)
+        return None
+
+    def suggest(self, text, limit=8, min_digits=4):
+        """(phone, name, address) for customers whose number starts with what was typed."""
+        key = normalize_phone(text)
+        if len(key) < min_digits:
+            return []
+        with self._lock:
+            phones = []
+            for phone in self._range(key):
+                phones.append(phone)
+                if len(phones) >= limit:
+                    break
+        results = []
+        for phone in phones:
+            row = self.details(phone)
+            if row is not None:
+                results.append((phone,) + tuple(row))
+        return results
+
+    # --- Invalidation ---
+
+    def upsert(self, phone):
+        """A customer was saved: index its number and drop any stale details."""
+        phone = str(phone)
+        entry = (normalize_phone(phone), phone)
+        with self._lock:
+            self._details.pop(phone, None)
+            i = bisect_left(self._keys, entry)
+            if i == len(self._keys) or self._keys[i] != entry:
+                insort(self._keys, entry)
+
+    def remove(self, phone):
+        phone = str(phone)
+        entry = (normalize_phone(phone), phone)
+        with self._lock:
+            self._details.pop(phone, None)
+            i = bisect_left(self._keys, entry)
+            if i < len(self._keys) and self._keys[i] == entry:
+                del self._keys[i]
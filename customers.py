@@ -1,6 +1,6 @@
 import customtkinter as ctk
 
-from tkinter import messagebox, ttk, filedialog
+from tkinter import messagebox, filedialog
 
 import csv
 
@@ -8,6 +8,9 @@ import logging
 
 from datetime import datetime
 
+from change_bus import RELOAD
+from virtual_table import VirtualTable
+
 class CustomerModule:
 
     def __init__(self, main_view, db):
@@ -80,19 +83,15 @@ class CustomerModule:
 
         cols = ("Phone", "Name", "Address")
 
-        self.tree = ttk.Treeview(self.main_view, columns=cols, show='headings')
-
-        for col in cols:
+        self.table = VirtualTable(self.main_view, self.db, cols, self.db.customers.page, sort=1, width=200, anchor="w")
 
-            self.tree.heading(col, text=col)
-
-            self.tree.column(col, width=200, anchor="w")
-
-        
+        self.tree = self.table.tree
 
         self.tree.bind("<<TreeviewSelect>>", self.on_row_select)
 
-        self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+        self.table.pack(fill="both", expand=True, padx=20, pady=10)
+
+        self.db.changes.watch(self.tree, ("customers",), self.on_changes)
 
         
 
@@ -130,25 +129,14 @@ class CustomerModule:
 
             # UPSERT logic: Insert or Update if phone exists
 
-            self.db.cursor.execute("""
-
-                INSERT INTO customers (phone, name, address) 
-
-                VALUES (?, ?, ?)
-
-                ON CONFLICT(phone) 
-
-                DO UPDATE SET name=excluded.name, address=excluded.address
-
-            """, (p, n, a))
-
-            
-
-            self.db.conn.commit()
+            self.db.customers.upsert(p, n, a)
 
             messagebox.showinfo("Success", f"Customer {n} saved.")
 
-            self.refresh_list()
+            # A shown row is redrawn by on_changes; a new customer needs its place in the list
+            if not self.table.shown([p]):
+
+                self.refresh_list()
 
             self.clear_entries()
 
@@ -178,11 +166,7 @@ class CustomerModule:
 
             try:
 
-                self.db.cursor.execute("DELETE FROM customers WHERE phone=?", (p,))
-
-                self.db.conn.commit()
-
-                self.refresh_list()
+                self.db.customers.delete(p)
 
                 self.clear_entries()
 
@@ -192,9 +176,7 @@ class CustomerModule:
 
     def export_customers(self):
 
-        self.db.cursor.execute("SELECT phone, name, address FROM customers")
-
-        rows = self.db.cursor.fetchall()
+        rows = self.db.customers.all()
 
         
 
@@ -234,13 +216,23 @@ class CustomerModule:
 
     def refresh_list(self):
 
-        for i in self.tree.get_children(): self.tree.delete(i)
+        self.table.load()
+
+    def on_changes(self, changes):
+
+        """Customers saved or deleted anywhere (including at checkout): redraws just those rows"""
+
+        if any(c.op == RELOAD for c in changes):
+
+            phones = self.table.loaded()
+
+        else:
 
-        self.db.cursor.execute("SELECT phone, name, address FROM customers ORDER BY name ASC")
+            phones = self.table.shown([c.key for c in changes])
 
-        for row in self.db.cursor.fetchall():
+        if phones:
 
-            self.tree.insert("", "end", values=row)
+            self.table.update_rows(phones, self.db.customers.rows(phones))
 
     def clear_entries(self):
 
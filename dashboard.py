@@ -16,13 +16,9 @@ class DashboardModule:
         stats_frame = ctk.CTkFrame(self.main_view, fg_color="transparent")
         stats_frame.pack(fill="x", padx=20, pady=10)
 
-        total_value = self.get_total_inventory_value()
-        low_stock_count = self.get_low_stock_count()
-        total_sales = self.get_total_sales_count()
-
-        self.create_stat_card(stats_frame, "Stock Value", f"₹{total_value:,.2f}", "#2ecc71").grid(row=0, column=0, padx=10)
-        self.create_stat_card(stats_frame, "Low Stock Items", str(low_stock_count), "#e74c3c").grid(row=0, column=1, padx=10)
-        self.create_stat_card(stats_frame, "Items Sold (Total)", str(total_sales), "#3498db").grid(row=0, column=2, padx=10)
+        self.value_lbl = self.create_stat_card(stats_frame, "Stock Value", "#2ecc71", 0)
+        self.low_stock_lbl = self.create_stat_card(stats_frame, "Low Stock Items", "#e74c3c", 1)
+        self.sold_lbl = self.create_stat_card(stats_frame, "Items Sold (Total)", "#3498db", 2)
 
         # --- Data Section ---
         data_frame = ctk.CTkFrame(self.main_view)
@@ -45,34 +41,39 @@ class DashboardModule:
         self.top_tree.grid(row=1, column=1, padx=20, pady=5)
 
         self.load_dashboard_data()
+        # Every figure here comes from inventory; a sale anywhere updates them in place
+        self.db.changes.watch(self.top_tree, ("inventory",), lambda changes: self.load_dashboard_data(), poll=1000)
 
-    def create_stat_card(self, parent, title, value, color):
+    def create_stat_card(self, parent, title, color, column):
+        """Places a card and returns its value label, filled in by load_dashboard_data"""
         card = ctk.CTkFrame(parent, width=200, height=100, border_width=2, border_color=color)
+        card.grid(row=0, column=column, padx=10)
         ctk.CTkLabel(card, text=title, font=("Arial", 14)).pack(pady=5)
-        ctk.CTkLabel(card, text=value, font=("Arial", 20, "bold"), text_color=color).pack(pady=5)
-        return card
+        value = ctk.CTkLabel(card, text="", font=("Arial", 20, "bold"), text_color=color)
+        value.pack(pady=5)
+        return value
 
     def get_total_inventory_value(self):
-        self.db.cursor.execute("SELECT SUM(price * stock) FROM inventory")
-        res = self.db.cursor.fetchone()[0]
-        return res if res else 0.0
+        return self.db.products.stock_value()
 
     def get_low_stock_count(self):
-        self.db.cursor.execute("SELECT COUNT(*) FROM inventory WHERE stock < 10")
-        return self.db.cursor.fetchone()[0]
+        return self.db.products.low_stock_count(10)
 
     def get_total_sales_count(self):
-        self.db.cursor.execute("SELECT SUM(sold_qty) FROM inventory")
-        res = self.db.cursor.fetchone()[0]
-        return res if res else 0
+        return self.db.products.total_sold()
 
     def load_dashboard_data(self):
+        self.value_lbl.configure(text=f"₹{self.get_total_inventory_value():,.2f}")
+        self.low_stock_lbl.configure(text=str(self.get_low_stock_count()))
+        self.sold_lbl.configure(text=str(self.get_total_sales_count()))
+
+        for tree in (self.cat_tree, self.top_tree):
+            tree.delete(*tree.get_children())
+
         # Category Data
-        self.db.cursor.execute("SELECT category, SUM(sold_qty) as total FROM inventory GROUP BY category ORDER BY total DESC")
-        for row in self.db.cursor.fetchall():
+        for row in self.db.products.sold_by_category():
             self.cat_tree.insert("", "end", values=row)
 
         # Top Sellers Data
-        self.db.cursor.execute("SELECT name, sold_qty FROM inventory ORDER BY sold_qty DESC LIMIT 5")
-        for row in self.db.cursor.fetchall():
+        for row in self.db.products.top_sellers(5):
             self.top_tree.insert("", "end", values=row)
\ No newline at end of file
@@ -1,5 +1,22 @@
 import sqlite3
+import threading
+import time
+import os
+import re
+import sys
+import csv
+import functools
+from collections import Counter, deque
+from datetime import datetime, timedelta
 import logging
+import migrations
+from write_queue import WriteQueue
+from change_bus import ChangeBus
+from archive import SeasonArchive
+from bill_numbers import BillNumberAllocator
+from bill_journal import BillJournal
+from receipts import ReceiptPrinter
+from repositories import keyset_page, ProductRepo, SalesRepo, CustomerRepo, CategoryRepo, UserRepo, ParkedBillRepo, SequenceRepo, PriceRuleRepo, StockRepo
 
 # Configure Logging
 logging.basicConfig(
@@ -8,97 +25,387 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+DB_FILE = "cracker_shop.db"
+
+# Connection tuning applied to every connection we open.
+# WAL lets report readers run alongside the billing writer; NORMAL sync is
+# safe in WAL mode (only the last commits can roll back on power loss).
+PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -20000,       # ~20 MB page cache (negative = KiB)
+    "mmap_size": 268435456,     # 256 MB memory-mapped reads
+    "busy_timeout": 5000,       # wait up to 5s for a lock instead of failing
+    "temp_store": "MEMORY",
+}
+
+# --- SQL instrumentation ---
+# Every connection is opened with InstrumentedConnection, so all statements
+# are timed and attributed to the calling module/function. Statements slower than SLOW_QUERY_MS are
+# written to slow_queries.log.
+SLOW_QUERY_MS = float(os.environ.get("CRACKERSHOP_SLOW_QUERY_MS", "100"))
+
+slow_log = logging.getLogger("slow_query")
+slow_log.propagate = False
+_slow_handler = logging.FileHandler("slow_queries.log", delay=True)
+_slow_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+slow_log.addHandler(_slow_handler)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Collapses literals and whitespace so equivalent statements group together."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _IN_LIST.sub("IN (?)", sql)
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[k]
+
+
+class QueryStats:
+    """Thread-safe latency/row statistics per normalized statement."""
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, sql, ms, rows, caller):
+        key = normalize_sql(sql)
+        with self._lock:
+            s = self._stats.get(key)
+            if s is None:
+                s = self._stats[key] = {"count": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                        "samples": deque(maxlen=self.sample_size), "callers": Counter()}
+            s["count"] += 1
+            s["rows"] += rows if rows and rows > 0 else 0
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+            s["samples"].append(ms)
+            s["callers"][caller] += 1
+        if ms >= SLOW_QUERY_MS:
+            slow_log.warning(f"{ms:.1f}ms rows={rows} caller={caller} sql={key}")
+
+    def snapshot(self):
+        """Aggregates per statement, slowest total time first."""
+        with self._lock:
+            items = [(k, dict(s, samples=sorted(s["samples"]), callers=s["callers"].copy()))
+                     for k, s in self._stats.items()]
+        result = []
+        for key, s in items:
+            result.append({
+                "statement": key,
+                "count": s["count"],
+                "rows": s["rows"],
+                "total_ms": round(s["total_ms"], 2),
+                "p50_ms": round(_percentile(s["samples"], 50), 3),
+                "p95_ms": round(_percentile(s["samples"], 95), 3),
+                "p99_ms": round(_percentile(s["samples"], 99), 3),
+                "max_ms": round(s["max_ms"], 3),
+                "caller": s["callers"].most_common(1)[0][0],
+            })
+        result.sort(key=lambda r: r["total_ms"], reverse=True)
+        return result
+
+    def dump(self, path):
+        rows = self.snapshot()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=STATS_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+STATS_FIELDS = ["statement", "count", "rows", "total_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "caller"]
+
+query_stats = QueryStats()
+
+
+# Data-access plumbing between a screen or service and SQLite; statements are
+# attributed to whoever called into it, not to the repository method.
+_PLUMBING = {__name__, "repositories", "write_queue"}
+
+
+def _caller():
+    """'module.function' that issued the SQL: the first frame outside the data-access plumbing.
+
+    Statements with no such caller on their thread (the write queue's own
+    BEGIN/COMMIT) keep the first frame outside this module.
+    """
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back
+    fallback = frame
+    while frame is not None and frame.f_globals.get("__name__") in _PLUMBING:
+        frame = frame.f_back
+    if frame is None or frame.f_globals.get("__name__", "").startswith(("threading", "concurrent.")):
+        frame = fallback
+    if frame is None:
+        return "?"
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # SELECT timing includes the fetch, so it is recorded when rows are read:
+    # by a fetch call, or once iteration runs out or the cursor is closed
+    _pending = None
+    _rows = 0
+
+    def execute(self, sql, parameters=()):
+        self._flush()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._track(sql, start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._track(sql, start)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._flush(self._rows)
+            raise
+        self._rows += 1
+        return row
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._flush(self._rows + (1 if row is not None else 0))
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        self._flush(self._rows + len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._flush(self._rows + len(rows))
+        return rows
+
+    def close(self):
+        self._flush(self._rows)
+        super().close()
+
+    def _track(self, sql, start):
+        caller = _caller()
+        self._rows = 0
+        if self.description is None:
+            query_stats.record(sql, (time.perf_counter() - start) * 1000, self.rowcount, caller)
+        else:
+            self._pending = (sql, start, caller)
+
+    def _flush(self, rows=None):
+        if self._pending is not None:
+            sql, start, caller = self._pending
+            self._pending = None
+            query_stats.record(sql, (time.perf_counter() - start) * 1000, rows, caller)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts bypass cursor(), so route them through an instrumented one
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# The queries behind every search box, report filter and paged table, with
+# sample parameters. check_query_plans() fails any that degrade to a full
+# scan or a temporary sort not listed in PLAN_ALLOWLIST.
+_P, _S = ProductRepo, SalesRepo
+
+
+def _page(query, keys, desc, after, params):
+    """A keyset page of `query` as a (sql, params) hot query."""
+    sql, page_params = keyset_page(query, keys, desc, after, 100)
+    return sql, list(params) + page_params
+
+
+HOT_QUERIES = {
+    "billing_search": (_P.SEARCH, ("%a%", "%a%", 50)),
+    "billing_search_category": (_P.SEARCH_IN_CATEGORY, ("%a%", "%a%", "General", 50)),
+    "billing_add_to_cart": (_P.BY_NAME, ("Sky Rocket",)),
+    "billing_by_code": (_P.BY_CODE, ("SKY001",)),
+    "report_dates": (_S.DAYS, ()),
+    "report_all": (_S.REPORT_HOT + _S.REPORT_ORDER, ()),
+    "report_bill": (_S.REPORT_HOT + _S.REPORT_BILL + _S.REPORT_ORDER, ("%1%",)),
+    "report_category": (_S.REPORT_HOT + _S.REPORT_CATEGORY + _S.REPORT_ORDER, ("General",)),
+    "report_date_range": (_S.REPORT_HOT + _S.REPORT_RANGE + _S.REPORT_ORDER, (1767225600, 1769904000)),
+    "report_category_date_range": (
+        _S.REPORT_HOT + _S.REPORT_CATEGORY + _S.REPORT_RANGE + _S.REPORT_ORDER,
+        ("General", 1767225600, 1769904000)),
+    "customer_lookup": (CustomerRepo.GET, ("9999999999",)),
+    "customer_history": (_S.CUSTOMER_HISTORY, ("9999999999",)),
+    "stock_history": (StockRepo.HISTORY, ("SKY001", 50)),
+    "inventory_next_page": _page(_P.PAGE.format(sort="name"), ["_key"], False, ("Sky Rocket", "SKY001"),
+                                 ("%a%", "%a%")),
+    "report_first_page": _page(_S.REPORT_PAGE.format(src="", sort="b.ts") + _S.REPORT_RANGE, _S.REPORT_KEYS,
+                               True, None, (1767225600, 1769904000)),
+}
+
+# Plan steps that are expected in a hot query, each with the reason it is acceptable
+PLAN_ALLOWLIST = {
+    ("billing_search", "SCAN inventory USING COVERING INDEX idx_inventory_name"):
+        "a substring LIKE cannot seek; billing searches the in-memory index, this is the fallback",
+    ("report_dates", "SCAN bills USING COVERING INDEX idx_bills_ts"):
+        "lists every sale day of the live season; archived days come from archive_days",
+    ("report_dates", "USE TEMP B-TREE FOR DISTINCT"): "one row per sale day",
+    ("report_dates", "USE TEMP B-TREE FOR ORDER BY"): "one row per sale day",
+    ("report_all", "SCAN b USING INDEX idx_bills_ts"):
+        "the unfiltered report is every live line, walked newest first",
+    ("report_bill", "SCAN b USING INDEX idx_bills_ts"): "a substring match on the bill number cannot seek",
+    ("report_category", "USE TEMP B-TREE FOR ORDER BY"): "sorts only the lines of one category",
+    ("report_category_date_range", "USE TEMP B-TREE FOR ORDER BY"): "sorts only the lines of one category",
+}
+
+
+def check_query_plans(conn, queries=HOT_QUERIES, allowed=PLAN_ALLOWLIST):
+    """Runs EXPLAIN QUERY PLAN on each hot query.
+
+    Returns a list of (name, plan step) for every step that scans a whole
+    table or index, or sorts in a temporary b-tree, unless (name, step) is
+    in `allowed`; an empty list means all hot queries seek through indexes.
+    """
+    failures = []
+    for name, (sql, params) in queries.items():
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[3]
+            if detail.startswith(("SCAN ", "USE TEMP B-TREE")) and (name, detail) not in allowed:
+                failures.append((name, detail))
+    return failures
+
+
+def day_range(d_from, d_to):
+    """Converts inclusive local 'YYYY-MM-DD' dates to a half-open epoch range."""
+    start = datetime.strptime(d_from, "%Y-%m-%d")
+    end = datetime.strptime(d_to, "%Y-%m-%d") + timedelta(days=1)
+    return int(time.mktime(start.timetuple())), int(time.mktime(end.timetuple()))
+
+
+class ConnectionManager:
+    """Owns the single writer connection and one read-only connection per thread."""
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._readers = []
+        self._lock = threading.Lock()
+        self.writer = self.connect()
+        # WAL is persistent in the file; setting it once on the writer is enough
+        mode = self.writer.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if mode.lower() != "wal":
+            logging.warning(f"WAL mode unavailable, journal_mode={mode}")
+
+    def connect(self, readonly=False):
+        """Opens a new tuned connection. Read-only connections cannot write."""
+        uri = f"file:{self.path}?mode=ro" if readonly else f"file:{self.path}"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256,
+                               factory=InstrumentedConnection)
+        for name, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def reader(self):
+        """Returns the calling thread's read-only connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connect(readonly=True)
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def close_reader(self):
+        """Closes the calling thread's read-only connection, for threads that end (one per client)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                self._readers.remove(conn)
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
+        self.writer.close()
+
+
 class Database:
-    def __init__(self):
-        # Using a consistent naming convention for the db file
-        self.conn = sqlite3.connect("cracker_shop.db")
-        self.cursor = self.conn.cursor()
-        self.create_tables()
-        self.run_migrations() # Ensures existing DBs get new columns
-
-    def create_tables(self):
-        # 1. Inventory Table
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS inventory (
-                product_code TEXT PRIMARY KEY,
-                name TEXT,
-                category TEXT,
-                price REAL,
-                stock INTEGER,
-                discount_percent REAL DEFAULT 0,
-                sold_qty INTEGER DEFAULT 0
-            )""")
-        
-        # 2. Sales Table
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                bill_id TEXT,
-                item_name TEXT,
-                category TEXT,
-                quantity INTEGER,
-                total REAL,
-                discount_amount REAL DEFAULT 0,
-                payment_mode TEXT,
-                customer_phone TEXT,
-                created_by TEXT,
-                date TEXT
-            )""")
-
-        # 3. Customer CRM Table
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS customers (
-                phone TEXT PRIMARY KEY,
-                name TEXT,
-                address TEXT
-            )""")
-        
-        # 4. Users Table
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE, 
-                password TEXT, 
-                role TEXT
-            )""")
-        
-        # 5. Categories Table
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                cat_code TEXT UNIQUE,
-                name TEXT,
-                description TEXT
-            )""")
-
-        # Initial Data Seeds
-        self.cursor.execute("INSERT OR IGNORE INTO categories (cat_code, name, description) VALUES ('GEN', 'General', 'Default Category')")
-        self.cursor.execute("INSERT OR IGNORE INTO users (username, password, role) VALUES ('admin', 'admin123', 'Admin')")
-        
-        self.conn.commit()
-        logging.info("Database tables initialized successfully.")
-
-    def run_migrations(self):
-        """Adds columns to existing tables if they don't exist."""
-        # Check if sales table has the new columns we added recently
-        self.cursor.execute("PRAGMA table_info(sales)")
-        columns = [column[1] for column in self.cursor.fetchall()]
-        
-        migrations = {
-            "discount_amount": "ALTER TABLE sales ADD COLUMN discount_amount REAL DEFAULT 0",
-            "payment_mode": "ALTER TABLE sales ADD COLUMN payment_mode TEXT DEFAULT 'Cash'",
-            "customer_phone": "ALTER TABLE sales ADD COLUMN customer_phone TEXT",
-            "created_by": "ALTER TABLE sales ADD COLUMN created_by TEXT"
-        }
-
-        for col, sql in migrations.items():
-            if col not in columns:
-                try:
-                    self.cursor.execute(sql)
-                    self.conn.commit()
-                    logging.info(f"Migration: Added column {col} to sales table.")
-                except Exception as e:
-                    logging.error(f"Migration failed for {col}: {e}")
+    def __init__(self, path=DB_FILE):
+        self.manager = ConnectionManager(path)
+        # Writes go through the single writer connection
+        self.conn = self.manager.writer
+        self.stats = query_stats
+        # Committed row changes go out to open screens and caches; other processes' commits are polled
+        self.changes = ChangeBus(self)
+        # Bills are committed off the UI thread by a dedicated writer
+        self.writes = WriteQueue(self.manager.connect, on_commit=self.changes.committed,
+                                 before_commit=self.changes.before_commit)
+        # Data access for the screens
+        self.products = ProductRepo(self)
+        # Every stock change is a ledger move; inventory.stock is their running total
+        self.stock = StockRepo(self)
+        self.sales = SalesRepo(self)
+        self.customers = CustomerRepo(self)
+        self.categories = CategoryRepo(self)
+        self.users = UserRepo(self)
+        self.parked = ParkedBillRepo(self)
+        self.sequences = SequenceRepo(self)
+        self.price_rules = PriceRuleRepo(self)
+        self.changes.subscribe(("inventory",), self.products.reload)
+        self.changes.subscribe(("customers",), self.customers.reload)
+        # Bill numbers come from blocks claimed in bill_sequences
+        self.bill_numbers = BillNumberAllocator(self)
+        # Completed bills are journaled to disk before they reach the database
+        self.journal = BillJournal(self, self.bill_numbers.terminal)
+        # Invoice/receipt files are rendered by a worker process pool
+        self.receipts = ReceiptPrinter(self)
+        # Closed seasons live in per-year files under archive/
+        self.archive = SeasonArchive(self)
+        # Schema changes are versioned; nothing runs when already current
+        if migrations.migrate(self.conn):
+            logging.info(f"Database schema upgraded to version {migrations.latest_version()}.")
+            for name, detail in check_query_plans(self.conn):
+                logging.warning(f"Query plan regression in {name}: {detail}")
+
+    def reader(self):
+        """Read-only connection for the current thread; never blocks the writer."""
+        return self.manager.reader()
 
 # Create a single instance to be used across the app
 db = Database()
\ No newline at end of file
@@ -0,0 +1,51 @@
+import customtkinter as ctk
+from tkinter import messagebox, ttk
+import os
+from datetime import datetime
+from database import STATS_FIELDS, SLOW_QUERY_MS
+
+class DiagnosticsModule:
+    def __init__(self, main_view, db):
+        self.main_view = main_view
+        self.db = db
+
+    def render(self):
+        """Shows per-statement SQL timings collected since startup"""
+        for widget in self.main_view.winfo_children():
+            widget.destroy()
+
+        ctk.CTkLabel(self.main_view, text="SQL Performance", font=("Arial", 22, "bold")).pack(pady=10)
+
+        btn_f = ctk.CTkFrame(self.main_view, fg_color="transparent")
+        btn_f.pack(fill="x", padx=20)
+
+        ctk.CTkLabel(btn_f, text=f"Slow query threshold: {SLOW_QUERY_MS:.0f} ms (see slow_queries.log)",
+                     font=("Arial", 12, "italic")).pack(side="left", padx=5)
+        ctk.CTkButton(btn_f, text="🔄 Refresh", width=100, command=self.refresh_list).pack(side="right", padx=5)
+        ctk.CTkButton(btn_f, text="📤 Dump CSV", fg_color="#27ae60", width=100, command=self.dump_stats).pack(side="right", padx=5)
+        ctk.CTkButton(btn_f, text="Reset", fg_color="#7f8c8d", width=80, command=self.reset_stats).pack(side="right", padx=5)
+
+        cols = ("Statement", "Count", "Rows", "Total ms", "p50", "p95", "p99", "Max", "Caller")
+        self.tree = ttk.Treeview(self.main_view, columns=cols, show='headings')
+        for col in cols:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=70, anchor="center")
+        self.tree.column("Statement", width=380, anchor="w")
+        self.tree.column("Caller", width=180, anchor="w")
+        self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+
+        self.refresh_list()
+
+    def refresh_list(self):
+        for i in self.tree.get_children(): self.tree.delete(i)
+        for row in self.db.stats.snapshot():
+            self.tree.insert("", "end", values=[row[f] for f in STATS_FIELDS])
+
+    def dump_stats(self):
+        if not os.path.exists("exports"): os.makedirs("exports")
+        path = self.db.stats.dump(f"exports/SQL_Stats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        messagebox.showinfo("Exported", f"Saved to {path}")
+
+    def reset_stats(self):
+        self.db.stats.reset()
+        self.refresh_list()
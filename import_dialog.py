@@ -0,0 +1,48 @@
+import customtkinter as ctk
+from tkinter import messagebox
+
+
+class ImportDialog:
+    """Progress window for a csv_import job running on a worker thread.
+
+    Shows a progress bar and a Cancel button, polls the job's Future and
+    calls on_done(result) on the Tk thread once it finishes.
+    """
+
+    def __init__(self, parent, title, job, on_done, poll=100):
+        self.parent = parent
+        self.job = job
+        self.on_done = on_done
+        self.poll = poll
+        self.win = ctk.CTkToplevel(parent)
+        self.win.title(title)
+        self.win.geometry("420x140")
+        self.win.transient(parent.winfo_toplevel())
+        self.win.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.label = ctk.CTkLabel(self.win, text=f"{title}...")
+        self.label.pack(pady=(15, 5))
+        self.bar = ctk.CTkProgressBar(self.win, width=360)
+        self.bar.set(0)
+        self.bar.pack(pady=5)
+        self.cancel_btn = ctk.CTkButton(self.win, text="Cancel", fg_color="#e74c3c", width=100, command=self.cancel)
+        self.cancel_btn.pack(pady=10)
+        self.future = job.start()
+        self.win.after(self.poll, self.check)
+
+    def cancel(self):
+        # Stops after the chunk being written; earlier chunks stay imported
+        self.job.cancel()
+        self.cancel_btn.configure(state="disabled", text="Cancelling...")
+
+    def check(self):
+        if not self.future.done():
+            self.bar.set(self.job.fraction)
+            self.win.after(self.poll, self.check)
+            return
+        self.win.destroy()
+        try:
+            result = self.future.result()
+        except Exception as e:
+            messagebox.showerror("Import Error", str(e))
+            return
+        self.on_done(result)
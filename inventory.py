@@ -1,13 +1,17 @@
 import customtkinter as ctk
 from tkinter import messagebox, ttk, filedialog
-import csv
 import logging
 from datetime import datetime
+from change_bus import RELOAD
+from import_dialog import ImportDialog
+from services.inventory import InventoryService
+from virtual_table import VirtualTable
 
 class InventoryModule:
     def __init__(self, main_view, db):
         self.main_view = main_view
         self.db = db
+        self.service = InventoryService(db)
 
     def render(self):
         for widget in self.main_view.winfo_children():
@@ -26,8 +30,7 @@ class InventoryModule:
         self.inv_name = ctk.CTkEntry(f, placeholder_text="Product Name", width=150)
         self.inv_name.grid(row=0, column=1, padx=5)
 
-        self.db.cursor.execute("SELECT name FROM categories")
-        cat_list = [r[0] for r in self.db.cursor.fetchall()]
+        cat_list = self.service.categories()
         if not cat_list: cat_list = ["General"]
 
         self.inv_cat = ctk.CTkComboBox(f, values=cat_list, width=130)
@@ -53,21 +56,22 @@ class InventoryModule:
         util_f.pack(fill="x", padx=20, pady=5)
 
         self.search_var = ctk.StringVar()
-        self.search_var.trace_add("write", lambda *args: self.refresh_list())
+        self.search_var.trace_add("write", lambda *args: self.refresh_list(debounce=True))
         ctk.CTkEntry(util_f, placeholder_text="🔍 Filter items...", textvariable=self.search_var, width=250).pack(side="left")
 
         ctk.CTkButton(util_f, text="📤 Export CSV", fg_color="#27ae60", width=100, command=self.export_csv).pack(side="right", padx=5)
         ctk.CTkButton(util_f, text="📥 Import CSV", fg_color="#3498db", width=100, command=self.import_csv).pack(side="right", padx=5)
+        ctk.CTkButton(util_f, text="🧮 Reconcile", fg_color="#7f8c8d", width=100, command=self.reconcile_stock).pack(side="right", padx=5)
+        ctk.CTkButton(util_f, text="📜 Stock History", fg_color="#7f8c8d", width=100, command=self.show_history).pack(side="right", padx=5)
 
         # --- Table ---
         cols = ("Code", "Name", "Category", "Price", "Stock", "Disc %", "Sold Qty")
-        self.tree = ttk.Treeview(self.main_view, columns=cols, show='headings')
-        for col in cols:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=100, anchor="center")
-        
+        # Paged and sorted by the database; starts sorted by name
+        self.table = VirtualTable(self.main_view, self.db, cols, self.service.product_page, sort=1)
+        self.tree = self.table.tree
         self.tree.bind("<<TreeviewSelect>>", self.on_row_select)
-        self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+        self.table.pack(fill="both", expand=True, padx=20, pady=10)
+        self.db.changes.watch(self.tree, ("inventory",), self.on_changes)
         self.refresh_list()
 
     def on_row_select(self, event):
@@ -84,42 +88,58 @@ class InventoryModule:
         self.inv_disc.insert(0, v[5])
 
     def save_item(self):
+        cat = self.inv_cat.get()
+        if not self.inv_code.get().strip() or cat == "Select Category":
+            messagebox.showwarning("Error", "Missing required fields")
+            return
         try:
-            code = self.inv_code.get().upper()
-            name, cat = self.inv_name.get(), self.inv_cat.get()
-            price, stock = float(self.inv_price.get()), int(self.inv_stock.get())
-            disc = float(self.inv_disc.get())
-
-            if not code or cat == "Select Category":
-                messagebox.showwarning("Error", "Missing required fields")
-                return
-
-            self.db.cursor.execute("""
-                INSERT INTO inventory (product_code, name, category, price, stock, discount_percent) 
-                VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(product_code) 
-                DO UPDATE SET name=excluded.name, category=excluded.category, 
-                              price=excluded.price, stock=excluded.stock, 
-                              discount_percent=excluded.discount_percent
-            """, (code, name, cat, price, stock, disc))
-            
-            self.db.conn.commit()
-            self.refresh_list()
+            code = self.service.save_product(self.inv_code.get(), self.inv_name.get(), cat,
+                                             self.inv_price.get(), self.inv_stock.get(), self.inv_disc.get())
+            # A shown row is redrawn by on_changes; a new product needs its place in the list
+            if not self.table.shown([code]):
+                self.refresh_list()
             self.clear_entries()
             messagebox.showinfo("Success", f"Product {code} updated.")
         except ValueError:
             messagebox.showerror("Error", "Check numeric fields: Price, Stock, and Disc %")
 
-    def refresh_list(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        search = f"%{self.search_var.get()}%"
-        self.db.cursor.execute("""
-            SELECT product_code, name, category, price, stock, discount_percent, sold_qty 
-            FROM inventory 
-            WHERE name LIKE ? OR product_code LIKE ?
-        """, (search, search))
-        for row in self.db.cursor.fetchall():
-            self.tree.insert("", "end", values=row)
+    def refresh_list(self, debounce=False):
+        self.table.load(self.search_var.get(), debounce=debounce)
+
+    def on_changes(self, changes):
+        """Products changed anywhere (an edit, a checkout, an import): redraws just those rows"""
+        if any(c.op == RELOAD for c in changes):
+            codes = self.table.loaded()
+        else:
+            codes = self.table.shown([c.key for c in changes])
+        if codes:
+            self.table.update_rows(codes, self.service.product_rows(codes))
+
+    def show_history(self):
+        """Stock ledger of the selected product, newest first"""
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showwarning("Select", "Select a product to see its stock history.")
+            return
+        code = self.tree.item(selected[0])['values'][0]
+        moves = self.service.stock_history(code, 25)
+        if not moves:
+            messagebox.showinfo("Stock History", f"No stock moves for {code}.")
+            return
+        lines = "\n".join(f"{when}  {kind:<10} {qty:+d}  {ref or ''}" for _, when, kind, qty, ref in moves)
+        messagebox.showinfo("Stock History", f"{code}, latest {len(moves)} moves:\n{lines}")
+
+    def reconcile_stock(self):
+        """Compares each product's stock with the total of its ledger moves"""
+        mismatches = self.service.reconcile_stock()
+        if not mismatches:
+            messagebox.showinfo("Reconcile", "Stock matches the ledger for every product.")
+            return
+        shown = "\n".join(f"{code} {name}: stock {stock}, ledger {ledger}"
+                          for code, name, stock, ledger in mismatches[:30])
+        more = f"\n... and {len(mismatches) - 30} more" if len(mismatches) > 30 else ""
+        logging.warning(f"STOCK RECONCILE: {len(mismatches)} product(s) differ from the ledger")
+        messagebox.showwarning("Reconcile", f"{len(mismatches)} product(s) differ from the ledger:\n{shown}{more}")
 
     def clear_entries(self):
         for entry in [self.inv_code, self.inv_name, self.inv_price, self.inv_stock]:
@@ -131,34 +151,27 @@ class InventoryModule:
     def import_csv(self):
         path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
         if not path: return
-        try:
-            with open(path, mode='r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    disc = row.get('discount_percent', 0)
-                    self.db.cursor.execute("""
-                        INSERT INTO inventory (product_code, name, category, price, stock, discount_percent) 
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        ON CONFLICT(product_code) DO UPDATE SET 
-                        name=excluded.name, price=excluded.price, 
-                        stock=stock + excluded.stock, discount_percent=excluded.discount_percent
-                    """, (row['product_code'].upper(), row['name'], row['category'], 
-                          float(row['price']), int(row['stock']), float(disc)))
-            self.db.conn.commit()
-            self.refresh_list()
-            messagebox.showinfo("Success", "Import Complete.")
-        except Exception as e:
-            messagebox.showerror("Import Error", str(e))
+        # Dry run first: nothing is written until the changes are confirmed
+        ImportDialog(self.main_view, "Checking file", self.service.product_import(path, dry_run=True),
+                     lambda result: self.confirm_import(path, result))
+
+    def confirm_import(self, path, result):
+        if result.rows == result.errors:
+            messagebox.showerror("Import Error", result.summary())
+            return
+        preview = "\n".join(f"{change} {key}: {field} {'' if old is None else old} → {new}"
+                            for change, key, field, old, new in result.changes[:12])
+        if not messagebox.askyesno("Confirm Import", f"{result.summary()}\n\n{preview}\n\nApply these changes?"):
+            return
+        ImportDialog(self.main_view, "Importing", self.service.product_import(path), self.import_done)
+
+    def import_done(self, result):
+        self.refresh_list()
+        messagebox.showinfo("Import", result.summary())
 
     def export_csv(self):
-        self.db.cursor.execute("SELECT product_code, name, category, price, stock, discount_percent, sold_qty FROM inventory")
-        rows = self.db.cursor.fetchall()
-        if not rows: return
         path = filedialog.asksaveasfilename(defaultextension=".csv", 
                                             initialfile=f"Inventory_{datetime.now().strftime('%d%m%Y')}.csv")
         if not path: return
-        with open(path, mode='w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(["product_code", "name", "category", "price", "stock", "discount_percent", "sold_qty"])
-            writer.writerows(rows)
+        if not self.service.export_csv(path): return
         messagebox.showinfo("Exported", f"Saved to {path}")
\ No newline at end of file
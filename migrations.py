@@ -0,0 +1,386 @@
+import logging
+import os
+import sqlite3
+
+# Registered schema migrations as (version, description, function), in order.
+# Each one runs exactly once, inside its own transaction, and the database
+# records the last applied version in PRAGMA user_version.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Registers a function as schema migration number `version`."""
+    def register(fn):
+        if MIGRATIONS and version != MIGRATIONS[-1][0] + 1:
+            raise ValueError(f"Migration {version} is out of sequence")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Applies pending migrations. Returns how many were applied (0 when current)."""
+    if current_version(conn) >= latest_version():
+        return 0
+
+    applied = 0
+    for version, description, fn in MIGRATIONS:
+        # IMMEDIATE takes the write lock up front, so a second process starting
+        # at the same time waits here and then sees the bumped version.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            fn(conn)
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"Migration {version} ({description}) failed: {e}")
+            raise
+        applied += 1
+        logging.info(f"Migration {version} applied: {description}")
+    return applied
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+# Legacy `sales` rows rebuilt from the normalized bill tables
+SALES_VIEW = """
+    CREATE VIEW sales AS
+    SELECT b.bill_no AS bill_id,
+           COALESCE(i.name, l.product_code) AS item_name,
+           COALESCE(c.name, i.category) AS category,
+           l.quantity AS quantity,
+           l.total AS total,
+           l.discount_amount AS discount_amount,
+           b.payment_mode AS payment_mode,
+           b.customer_phone AS customer_phone,
+           b.created_by AS created_by,
+           datetime(b.ts, 'unixepoch', 'localtime') AS date
+    FROM bills b
+    JOIN bill_lines l ON l.bill_id = b.id
+    LEFT JOIN inventory i ON i.product_code = l.product_code
+    LEFT JOIN categories c ON c.id = l.category_id
+"""
+
+
+@migration(1, "base schema")
+def base_schema(conn):
+    # 1. Inventory Table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS inventory (
+            product_code TEXT PRIMARY KEY,
+            name TEXT,
+            category TEXT,
+            price REAL,
+            stock INTEGER,
+            discount_percent REAL DEFAULT 0,
+            sold_qty INTEGER DEFAULT 0
+        )""")
+
+    # 2. Sales Table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bill_id TEXT,
+            item_name TEXT,
+            category TEXT,
+            quantity INTEGER,
+            total REAL,
+            discount_amount REAL DEFAULT 0,
+            payment_mode TEXT,
+            customer_phone TEXT,
+            created_by TEXT,
+            date TEXT
+        )""")
+
+    # 3. Customer CRM Table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS customers (
+            phone TEXT PRIMARY KEY,
+            name TEXT,
+            address TEXT
+        )""")
+
+    # 4. Users Table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            password TEXT,
+            role TEXT
+        )""")
+
+    # 5. Categories Table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cat_code TEXT UNIQUE,
+            name TEXT,
+            description TEXT
+        )""")
+
+    # Databases created by older builds may predate these sales columns
+    columns = _columns(conn, "sales")
+    legacy_columns = {
+        "discount_amount": "ALTER TABLE sales ADD COLUMN discount_amount REAL DEFAULT 0",
+        "payment_mode": "ALTER TABLE sales ADD COLUMN payment_mode TEXT DEFAULT 'Cash'",
+        "customer_phone": "ALTER TABLE sales ADD COLUMN customer_phone TEXT",
+        "created_by": "ALTER TABLE sales ADD COLUMN created_by TEXT"
+    }
+    for col, sql in legacy_columns.items():
+        if col not in columns:
+            conn.execute(sql)
+
+    # Initial Data Seeds
+    conn.execute("INSERT OR IGNORE INTO categories (cat_code, name, description) VALUES ('GEN', 'General', 'Default Category')")
+    conn.execute("INSERT OR IGNORE INTO users (username, password, role) VALUES ('admin', 'admin123', 'Admin')")
+
+
+@migration(2, "indexes for billing search and sales reports")
+def hot_path_indexes(conn):
+    # Sales: bill lookup, date range / ordering, category and customer history
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_bill ON sales(bill_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_day ON sales(date(date))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_category_date ON sales(category, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_customer_date ON sales(customer_phone, date)")
+    # Inventory: covering indexes for the billing search (name, stock) and name lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_name ON inventory(name, product_code, stock)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_category_name ON inventory(category, name, product_code, stock)")
+
+
+@migration(3, "normalized bills and bill_lines with a sales compatibility view")
+def normalized_bills(conn):
+    # One header per bill; ts is epoch seconds so date filters are plain ranges
+    conn.execute("""
+        CREATE TABLE bills (
+            id INTEGER PRIMARY KEY,
+            bill_no TEXT NOT NULL UNIQUE,
+            ts INTEGER NOT NULL,
+            customer_phone TEXT,
+            created_by TEXT,
+            payment_mode TEXT DEFAULT 'Cash',
+            total REAL NOT NULL DEFAULT 0,
+            discount_amount REAL NOT NULL DEFAULT 0
+        )""")
+    conn.execute("CREATE INDEX idx_bills_ts ON bills(ts)")
+    conn.execute("CREATE INDEX idx_bills_customer_ts ON bills(customer_phone, ts)")
+
+    # Lines carry only keys and numbers; names come from inventory/categories
+    conn.execute("""
+        CREATE TABLE bill_lines (
+            bill_id INTEGER NOT NULL REFERENCES bills(id),
+            line_no INTEGER NOT NULL,
+            product_code TEXT NOT NULL,
+            category_id INTEGER REFERENCES categories(id),
+            quantity INTEGER NOT NULL,
+            total REAL NOT NULL,
+            discount_amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (bill_id, line_no)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX idx_bill_lines_category ON bill_lines(category_id, bill_id)")
+    conn.execute("CREATE INDEX idx_bill_lines_product ON bill_lines(product_code)")
+    # Lines store category ids, so filters resolve category names first
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_categories_name ON categories(name)")
+
+    # Keep categories that only exist in sales history so lines can reference them
+    conn.execute("""
+        INSERT OR IGNORE INTO categories (cat_code, name, description)
+        SELECT DISTINCT UPPER(category), category, 'Imported from sales history'
+        FROM sales
+        WHERE category IS NOT NULL AND category NOT IN (SELECT name FROM categories)
+    """)
+
+    # Headers: one per legacy bill_id, local text dates converted to UTC epoch
+    conn.execute("""
+        INSERT INTO bills (bill_no, ts, customer_phone, created_by, payment_mode, total, discount_amount)
+        SELECT COALESCE(bill_id, 'LEGACY-' || id),
+               CAST(strftime('%s', MIN(date), 'utc') AS INTEGER),
+               MAX(customer_phone), MAX(created_by), COALESCE(MAX(payment_mode), 'Cash'),
+               SUM(total), SUM(COALESCE(discount_amount, 0))
+        FROM sales
+        GROUP BY COALESCE(bill_id, 'LEGACY-' || id)
+        ORDER BY MIN(id)
+    """)
+
+    # Lines: products matched by name; unknown products keep their name as code
+    conn.execute("""
+        INSERT INTO bill_lines (bill_id, line_no, product_code, category_id, quantity, total, discount_amount)
+        SELECT b.id,
+               ROW_NUMBER() OVER (PARTITION BY b.id ORDER BY s.id),
+               COALESCE((SELECT product_code FROM inventory WHERE name = s.item_name LIMIT 1), s.item_name, ''),
+               (SELECT id FROM categories WHERE name = s.category LIMIT 1),
+               COALESCE(s.quantity, 0), COALESCE(s.total, 0), COALESCE(s.discount_amount, 0)
+        FROM sales s
+        JOIN bills b ON b.bill_no = COALESCE(s.bill_id, 'LEGACY-' || s.id)
+    """)
+
+    # Old queries against `sales` keep working through a read-only view
+    conn.execute("DROP TABLE sales")
+    conn.execute(SALES_VIEW)
+
+
+@migration(4, "catalog of archived sales seasons")
+def archive_catalog(conn):
+    # One row per closed season moved out to archive/sales_<year>.db
+    conn.execute("""
+        CREATE TABLE archive_seasons (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            min_ts INTEGER NOT NULL,
+            max_ts INTEGER NOT NULL,
+            bills INTEGER NOT NULL,
+            lines INTEGER NOT NULL,
+            archived_at INTEGER NOT NULL
+        )""")
+    # Sale days that now live in an archive, for the report date pickers
+    conn.execute("""
+        CREATE TABLE archive_days (
+            day TEXT PRIMARY KEY,
+            year INTEGER NOT NULL
+        ) WITHOUT ROWID""")
+
+
+@migration(5, "parked (suspended) bills")
+def parked_bills(conn):
+    # A serialized Cart plus the customer details typed so far
+    conn.execute("""
+        CREATE TABLE parked_bills (
+            id INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            parked_by TEXT,
+            customer_phone TEXT,
+            customer_name TEXT,
+            customer_address TEXT,
+            cart TEXT NOT NULL
+        )""")
+
+
+@migration(6, "bill number sequences and allocated blocks")
+def bill_sequences(conn):
+    # Next free number per series (prefix, plus financial year when numbering resets)
+    conn.execute("""
+        CREATE TABLE bill_sequences (
+            scope TEXT PRIMARY KEY,
+            next_no INTEGER NOT NULL
+        ) WITHOUT ROWID""")
+    # Every block handed to a terminal, so unused numbers can be accounted for
+    conn.execute("""
+        CREATE TABLE bill_blocks (
+            scope TEXT NOT NULL,
+            first_no INTEGER NOT NULL,
+            last_no INTEGER NOT NULL,
+            terminal TEXT,
+            allocated_at INTEGER NOT NULL,
+            PRIMARY KEY (scope, first_no)
+        ) WITHOUT ROWID""")
+
+
+@migration(7, "price rules (category and quantity-slab discounts)")
+def price_rules(conn):
+    # A rule targets one product, one category, or (neither set) every item on the bill
+    conn.execute("""
+        CREATE TABLE price_rules (
+            id INTEGER PRIMARY KEY,
+            product_code TEXT,
+            category TEXT,
+            min_qty INTEGER NOT NULL DEFAULT 1,
+            discount_percent REAL NOT NULL,
+            CHECK (product_code IS NULL OR category IS NULL),
+            CHECK (discount_percent BETWEEN 0 AND 100)
+        )""")
+
+
+@migration(8, "stock movement ledger and stock snapshots")
+def stock_ledger(conn):
+    # Every change to a product's stock, signed; inventory.stock is their running total
+    conn.execute("""
+        CREATE TABLE stock_moves (
+            id INTEGER PRIMARY KEY,
+            product_code TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('opening', 'receipt', 'sale', 'adjustment', 'return', 'import')),
+            qty INTEGER NOT NULL,
+            ref TEXT
+        )""")
+    conn.execute("CREATE INDEX idx_stock_moves_product ON stock_moves(product_code, id)")
+    conn.execute("CREATE INDEX idx_stock_moves_ts ON stock_moves(ts)")
+
+    # Every product's stock as of one move, so history queries replay only what came after
+    conn.execute("""
+        CREATE TABLE stock_snapshots (
+            id INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            last_move_id INTEGER NOT NULL
+        )""")
+    conn.execute("""
+        CREATE TABLE stock_snapshot_lines (
+            snapshot_id INTEGER NOT NULL REFERENCES stock_snapshots(id),
+            product_code TEXT NOT NULL,
+            stock INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_id, product_code)
+        ) WITHOUT ROWID""")
+
+    # The ledger starts from today's stock: one opening move per product, and a first snapshot
+    conn.execute("""
+        INSERT INTO stock_moves (product_code, ts, kind, qty, ref)
+        SELECT product_code, CAST(strftime('%s', 'now') AS INTEGER), 'opening', stock, 'ledger started'
+        FROM inventory WHERE stock != 0 ORDER BY product_code
+    """)
+    conn.execute("""
+        INSERT INTO stock_snapshots (ts, last_move_id)
+        VALUES (CAST(strftime('%s', 'now') AS INTEGER), (SELECT COALESCE(MAX(id), 0) FROM stock_moves))
+    """)
+    conn.execute("""
+        INSERT INTO stock_snapshot_lines (snapshot_id, product_code, stock)
+        SELECT (SELECT MAX(id) FROM stock_snapshots), product_code, stock FROM inventory WHERE stock != 0
+    """)
+
+
+@migration(9, "bill ids never reused after archiving")
+def bill_ids_autoincrement(conn):
+    # Archiving empties bills, and a plain INTEGER PRIMARY KEY would then hand out
+    # ids already used by archived bills. AUTOINCREMENT keeps going from the highest.
+    archived = 0
+    for (path,) in conn.execute("SELECT path FROM archive_seasons").fetchall():
+        if os.path.exists(path):
+            season = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                archived = max(archived, season.execute("SELECT COALESCE(MAX(id), 0) FROM bills").fetchone()[0])
+            finally:
+                season.close()
+
+    conn.execute("DROP VIEW sales")
+    conn.execute("""
+        CREATE TABLE bills_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bill_no TEXT NOT NULL UNIQUE,
+            ts INTEGER NOT NULL,
+            customer_phone TEXT,
+            created_by TEXT,
+            payment_mode TEXT DEFAULT 'Cash',
+            total REAL NOT NULL DEFAULT 0,
+            discount_amount REAL NOT NULL DEFAULT 0
+        )""")
+    conn.execute("INSERT INTO bills_new SELECT * FROM bills")
+    conn.execute("DROP TABLE bills")
+    conn.execute("ALTER TABLE bills_new RENAME TO bills")
+    conn.execute("CREATE INDEX idx_bills_ts ON bills(ts)")
+    conn.execute("CREATE INDEX idx_bills_customer_ts ON bills(customer_phone, ts)")
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'bills'")
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('bills', MAX(?, (SELECT COALESCE(MAX(id), 0) FROM bills)))",
+                 (archived,))
+    conn.execute(SALES_VIEW)
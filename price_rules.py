@@ -0,0 +1,71 @@
+import customtkinter as ctk
+from tkinter import messagebox, ttk
+from services.inventory import InventoryService
+
+ANY_CATEGORY = "Any Category"
+
+class PriceRuleModule:
+    def __init__(self, main_view, db):
+        self.main_view, self.db = main_view, db
+        self.service = InventoryService(db)
+
+    def render(self):
+        for w in self.main_view.winfo_children(): w.destroy()
+
+        ctk.CTkLabel(self.main_view, text="Price Rules", font=("Arial", 22, "bold")).pack(pady=10)
+        ctk.CTkLabel(self.main_view, text="Discount from a minimum quantity on a product, a category, or (both empty) the whole bill. "
+                     "Each line gets its best discount, including the item's own Disc %.",
+                     font=("Arial", 12, "italic"), text_color="gray").pack()
+
+        # --- Entry Form ---
+        f = ctk.CTkFrame(self.main_view)
+        f.pack(fill="x", padx=20, pady=10)
+
+        self.r_code = ctk.CTkEntry(f, placeholder_text="Product Code", width=120)
+        self.r_code.grid(row=0, column=0, padx=5, pady=10)
+        self.r_cat = ctk.CTkComboBox(f, values=[ANY_CATEGORY] + self.service.categories(), width=150)
+        self.r_cat.set(ANY_CATEGORY)
+        self.r_cat.grid(row=0, column=1, padx=5)
+        self.r_min = ctk.CTkEntry(f, placeholder_text="Min Qty", width=80)
+        self.r_min.insert(0, "1")
+        self.r_min.grid(row=0, column=2, padx=5)
+        self.r_disc = ctk.CTkEntry(f, placeholder_text="Disc %", width=80)
+        self.r_disc.grid(row=0, column=3, padx=5)
+
+        ctk.CTkButton(f, text="Add Rule", width=100, command=self.add_rule).grid(row=0, column=4, padx=5)
+        ctk.CTkButton(f, text="🗑️ Delete Selected", fg_color="#e74c3c", width=120, command=self.delete_rule).grid(row=0, column=5, padx=5)
+
+        # --- Table ---
+        cols = ("ID", "Applies To", "Min Qty", "Disc %")
+        self.tree = ttk.Treeview(self.main_view, columns=cols, show='headings')
+        for c in cols:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=150, anchor="center")
+        self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+
+        self.refresh()
+
+    def add_rule(self):
+        cat = self.r_cat.get()
+        try:
+            self.service.add_price_rule(self.r_code.get(), "" if cat == ANY_CATEGORY else cat,
+                                        self.r_min.get(), self.r_disc.get())
+        except ValueError as e:
+            messagebox.showerror("Error", f"Check the rule: {e}")
+            return
+        self.r_code.delete(0, 'end'); self.r_disc.delete(0, 'end')
+        self.refresh()
+
+    def delete_rule(self):
+        sel = self.tree.selection()
+        if not sel: return
+        if messagebox.askyesno("Confirm", "Delete the selected rule(s)?"):
+            for item in sel:
+                self.service.delete_price_rule(self.tree.item(item)['values'][0])
+            self.refresh()
+
+    def refresh(self):
+        for i in self.tree.get_children(): self.tree.delete(i)
+        for rule_id, code, cat, min_qty, percent in self.service.price_rules():
+            target = f"Product {code}" if code else f"Category {cat}" if cat else "Whole bill"
+            self.tree.insert("", "end", values=(rule_id, target, min_qty, percent))
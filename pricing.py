@@ -0,0 +1,109 @@
+import threading
+from bisect import bisect_right
+from collections import Counter
+
+# Rule targets: a product code, a category, or every item on the bill
+ALL_ITEMS = "*"
+
+
+class Slabs:
+    """Quantity slabs for one target: the best discount reached at a quantity."""
+
+    def __init__(self, rules):
+        # rules: (min_qty, percent); a running max so a bigger slab never pays less
+        self.thresholds, self.percents, best = [], [], 0.0
+        for min_qty, percent in sorted(rules):
+            best = max(best, percent)
+            self.thresholds.append(min_qty)
+            self.percents.append(best)
+
+    def percent(self, qty):
+        i = bisect_right(self.thresholds, qty)
+        return self.percents[i - 1] if i else 0.0
+
+
+NO_SLABS = Slabs(())
+
+
+class PriceBook:
+    """Current prices and discount rules, held in memory for the billing cart.
+
+    For every product the book keeps its base price, category and item
+    discount (inventory.discount_percent). Price rules give a discount
+    percent from a minimum quantity on a product, a category, or the whole
+    bill; a category-wide discount is simply a rule with min_qty 1. A line
+    gets the best of its item discount and every rule it qualifies for;
+    discounts do not stack. Category and whole-bill slabs count the cart's
+    total quantity in that category (or on the bill), so changing one line
+    can reprice others, and price() always prices the whole cart.
+
+    `version` goes up on every change, so a cart priced against an older
+    book knows it has to be repriced.
+    """
+
+    def __init__(self, products, rules):
+        self._lock = threading.Lock()
+        self.version = 0
+        # code -> (price, item discount %, category)
+        self._items = {code: (price, discount or 0.0, category) for code, category, price, discount in products}
+        self._set_rules(rules)
+
+    def _set_rules(self, rules):
+        grouped = {}
+        for rule_id, code, category, min_qty, percent in rules:
+            key = ("product", code) if code else ("category", category) if category else ("bill", ALL_ITEMS)
+            grouped.setdefault(key, []).append((min_qty, percent))
+        self._slabs = {key: Slabs(slabs) for key, slabs in grouped.items()}
+
+    def set_rules(self, rules):
+        """rules: (id, product_code, category, min_qty, discount_percent) rows."""
+        with self._lock:
+            self._set_rules(rules)
+            self.version += 1
+
+    def reload(self, products, rules):
+        """Replaces every product and rule at once (see __init__ for the row shapes)."""
+        items = {code: (price, discount or 0.0, category) for code, category, price, discount in products}
+        with self._lock:
+            self._items = items
+            self._set_rules(rules)
+            self.version += 1
+
+    def upsert_product(self, code, category, price, discount):
+        entry = (price, discount or 0.0, category)
+        with self._lock:
+            if self._items.get(code) != entry:
+                self._items[code] = entry
+                self.version += 1
+
+    def remove_product(self, code):
+        with self._lock:
+            if self._items.pop(code, None) is not None:
+                self.version += 1
+
+    def price(self, lines):
+        """Prices a whole cart in one pass.
+
+        lines: (code, category, base price, qty) as the cart holds them.
+        Returns (price, net total, discount amount) per line, in order; a
+        product missing from the book keeps the cart's price.
+        """
+        with self._lock:
+            items, slabs = self._items, self._slabs
+            bill_slabs = slabs.get(("bill", ALL_ITEMS), NO_SLABS)
+            # Quantities the category and whole-bill slabs are measured on
+            by_category = Counter()
+            for code, category, price, qty in lines:
+                by_category[items.get(code, (0, 0, category))[2]] += qty
+            bill_qty = sum(by_category.values())
+            bill_percent = bill_slabs.percent(bill_qty)
+            priced = []
+            for code, category, price, qty in lines:
+                price, item_percent, category = items.get(code, (price, 0.0, category))
+                percent = max(item_percent, bill_percent,
+                              slabs.get(("product", code), NO_SLABS).percent(qty),
+                              slabs.get(("category", category), NO_SLABS).percent(by_category[category]))
+                gross = price * qty
+                discount = round(gross * percent / 100, 2)
+                priced.append((price, round(gross - discount, 2), discount))
+            return priced
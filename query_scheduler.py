@@ -0,0 +1,88 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# One query thread for every screen: only one screen is on display at a time
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query")
+_running_lock = threading.Lock()
+_running = [None, None]  # (scheduler, connection) of the query now executing
+
+
+class QueryScheduler:
+    """Debounced, cancellable search-as-you-type for one screen.
+
+    Every schedule() restarts a short timer, so a burst of keystrokes (or a
+    barcode wedge) turns into one query once typing pauses for `delay` ms.
+    The query runs on the background query thread and its result is applied
+    on the Tk thread only if no newer request arrived meanwhile; a superseded
+    query still queued is cancelled and one already running on SQLite is
+    interrupted.
+    """
+
+    def __init__(self, widget, db, delay=150, poll=15):
+        # `widget` is the one the results go into; nothing is applied once it is gone
+        self.widget = widget
+        self.db = db
+        self.delay = delay
+        self.poll = poll
+        self._timer = None
+        self._future = None
+        self._generation = 0
+
+    def schedule(self, query, apply, *args, delay=None):
+        """Runs query(*args) off the UI thread after the debounce, then apply(result) on it.
+
+        Pass delay=0 for button clicks and other one-off refreshes.
+        """
+        self.cancel()
+        wait = self.delay if delay is None else delay
+        self._timer = self.widget.after(wait, self._start, self._generation, query, apply, args)
+
+    def cancel(self):
+        """Drops the pending request and interrupts its query if it already started."""
+        self._generation += 1
+        if self._timer is not None:
+            self.widget.after_cancel(self._timer)
+            self._timer = None
+        future, self._future = self._future, None
+        if future is None or future.cancel():
+            return
+        with _running_lock:
+            if _running[0] is self:
+                _running[1].interrupt()
+
+    def pending(self):
+        """True while a request is waiting for its debounce or its result."""
+        return self._timer is not None or self._future is not None
+
+    def _start(self, generation, query, apply, args):
+        self._timer = None
+        if generation != self._generation or not self.widget.winfo_exists():
+            return
+        self._future = _executor.submit(self._run, query, args)
+        self.widget.after(self.poll, self._poll, generation, self._future, apply)
+
+    def _run(self, query, args):
+        # Queries use this thread's reader, so that is the connection to interrupt
+        conn = self.db.reader()
+        with _running_lock:
+            _running[:] = [self, conn]
+        try:
+            return query(*args)
+        finally:
+            with _running_lock:
+                _running[:] = [None, None]
+
+    def _poll(self, generation, future, apply):
+        if generation != self._generation or not self.widget.winfo_exists():
+            return
+        if not future.done():
+            self.widget.after(self.poll, self._poll, generation, future, apply)
+            return
+        self._future = None
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"SEARCH QUERY FAILED: {e}")
+            return
+        apply(result)
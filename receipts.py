@@ -0,0 +1,349 @@
+"""Bill output: GST invoice PDF plus thermal receipt (plain text and ESC/POS).
+
+Rendering runs in a small process pool, so a big invoice never holds up the
+billing screen. The workers get plain bill dicts and never open the
+database; the shop profile and the fixed parts of the layout are prepared
+once per worker process and reused for every bill it renders.
+"""
+import atexit
+import copy
+import io
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+RECEIPT_DIR = os.path.join("exports", "receipts")
+PROFILE_FILE = "shop_profile.json"
+
+# Optional shop_profile.json overrides any of these
+DEFAULT_PROFILE = {
+    "name": "CRACKER SHOP",
+    "address": "",
+    "phone": "",
+    "gstin": "",
+    "hsn": "3604",
+    "gst_rate": 18.0,
+    "footer": "Thank you! Handle fireworks with care.",
+    "receipt_width": 42,
+    # A .ttf with the scripts used in product and customer names (e.g. Tamil, Hindi) and the rupee sign
+    "font": "",
+}
+
+# Tried in order when the profile names no font
+FONT_CANDIDATES = [
+    os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts", "Nirmala.ttf"),
+    "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
+
+# ESC/POS: initialize, bold on/off, centre/left, double height on/off, feed and cut
+ESC_INIT = b"\x1b@"
+ESC_BOLD_ON, ESC_BOLD_OFF = b"\x1bE\x01", b"\x1bE\x00"
+ESC_CENTER, ESC_LEFT = b"\x1ba\x01", b"\x1ba\x00"
+ESC_DOUBLE_ON, ESC_DOUBLE_OFF = b"\x1d!\x01", b"\x1d!\x00"
+ESC_CUT = b"\n\n\n\x1dV\x01"
+
+
+def load_profile(path=PROFILE_FILE):
+    profile = dict(DEFAULT_PROFILE)
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                profile.update(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.error(f"RECEIPTS: ignoring unreadable {path}: {e}")
+    return profile
+
+
+def safe_name(bill_no):
+    return re.sub(r"[^\w.-]", "_", str(bill_no))
+
+
+def find_font(profile):
+    """Path of the Unicode TTF for invoices: the profile's "font", else the first candidate found."""
+    for path in [profile.get("font")] + FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def latin1(text):
+    """Text the built-in PDF fonts can show: the rupee sign as Rs., anything else non-Latin-1 as '?'."""
+    return text.replace("\u20b9", "Rs.").encode("latin-1", "replace").decode("latin-1")
+
+
+def gst_split(total, rate):
+    """Prices are GST-inclusive: (taxable value, CGST, SGST)."""
+    taxable = total / (1 + rate / 100)
+    tax = total - taxable
+    return taxable, tax / 2, tax / 2
+
+
+# --- Worker side ---
+
+_template = None
+
+
+def _init_worker(profile):
+    """Runs once per worker process: everything that is the same on every bill."""
+    global _template
+    # Import fpdf2 and load its core font metrics now rather than on the first bill
+    from fpdf import FPDF
+    FPDF().set_font("Helvetica")
+    font = find_font(profile)
+    fonts = _load_fonts(font) if font else None
+    if fonts is None:
+        logging.warning("RECEIPTS: no Unicode font found; set \"font\" in shop_profile.json to a .ttf file, "
+                        "until then non-Latin names print as '?' on invoices")
+    try:
+        import uharfbuzz  # noqa: F401
+        shaping = fonts is not None
+    except ImportError:
+        # Without it Tamil and Devanagari vowel signs print unjoined, but they print
+        shaping = False
+    width = int(profile["receipt_width"])
+    header = [profile["name"].center(width)]
+    header += [line.center(width) for line in (profile["address"], profile["phone"]) if line]
+    if profile["gstin"]:
+        header.append(f"GSTIN: {profile['gstin']}".center(width))
+    _template = {
+        "profile": profile,
+        "font": font,
+        "fonts": fonts,
+        "shaping": shaping,
+        "width": width,
+        "rule": "-" * width,
+        "text_header": header,
+        "escpos_header": (ESC_INIT + ESC_CENTER + ESC_BOLD_ON + ESC_DOUBLE_ON
+                          + profile["name"].encode("ascii", "replace") + ESC_DOUBLE_OFF + ESC_BOLD_OFF + b"\n"
+                          + "".join(line.strip() + "\n" for line in header[1:]).encode("ascii", "replace")
+                          + ESC_LEFT),
+    }
+
+
+def _load_fonts(path):
+    """Parses the invoice TTF once per worker: {fontkey: TTFFont} for the regular, bold and italic styles."""
+    from fpdf import FPDF
+    pdf = FPDF()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        for style in ("", "B", "I"):
+            pdf.add_font("Shop", style, path)
+    except Exception as e:
+        logging.error(f"RECEIPTS: cannot load font {path}: {e}")
+        return None
+    return {"data": data, "styles": pdf.fonts}
+
+
+def _add_fonts(pdf, fonts):
+    """Gives `pdf` its own copy of the parsed fonts.
+
+    The glyph tables are shared; the subset and the font file object are
+    per document, since writing the PDF cuts the font down to the glyphs used.
+    """
+    from fontTools import ttLib
+    from fpdf.fonts import SubsetMap
+    for key, parsed in fonts["styles"].items():
+        font = copy.copy(parsed)
+        font.i = len(pdf.fonts) + 1
+        font.ttfont = ttLib.TTFont(io.BytesIO(fonts["data"]), recalcTimestamp=False, fontNumber=0, lazy=True)
+        font.missing_glyphs = []
+        font.subset = SubsetMap(font, [ord(char) for char in "\x00 \r\n"])
+        pdf.fonts[key] = font
+
+
+def _ensure_template():
+    if _template is None:
+        _init_worker(load_profile())
+    return _template
+
+
+def receipt_lines(bill):
+    """Body of the thermal receipt (everything below the shop header)."""
+    t = _ensure_template()
+    width, rule = t["width"], t["rule"]
+    when = datetime.fromtimestamp(bill["ts"]).strftime("%d-%m-%Y %H:%M")
+    lines = [rule, f"Bill: {bill['bill_no']}", f"Date: {when}"]
+    if bill["customer"] or bill["phone"]:
+        lines.append(f"Customer: {bill['customer'] or ''} {bill['phone'] or ''}".rstrip())
+    lines.append(rule)
+    lines.append(f"{'Item':<{width - 18}}{'Qty':>5}{'Amount':>13}")
+    for code, name, qty, total, discount in bill["lines"]:
+        lines.append(f"{name[:width - 18]:<{width - 18}}{qty:>5}{total:>13.2f}")
+    lines.append(rule)
+    if bill["discount"]:
+        lines.append(f"{'Discount':<{width - 13}}{-bill['discount']:>13.2f}")
+    lines.append(f"{'TOTAL Rs.':<{width - 13}}{bill['total']:>13.2f}")
+    taxable, cgst, sgst = gst_split(bill["total"], t["profile"]["gst_rate"])
+    half = t["profile"]["gst_rate"] / 2
+    lines.append(f"{'Incl. CGST ' + f'{half:g}%':<{width - 13}}{cgst:>13.2f}")
+    lines.append(f"{'Incl. SGST ' + f'{half:g}%':<{width - 13}}{sgst:>13.2f}")
+    lines.append(f"Payment: {bill['payment'] or 'Cash'}   Billed by: {bill['user'] or ''}")
+    lines.append(rule)
+    lines.append(t["profile"]["footer"].center(width))
+    return lines
+
+
+def receipt_text(bill):
+    t = _ensure_template()
+    return "\n".join(t["text_header"] + receipt_lines(bill)) + "\n"
+
+
+def receipt_escpos(bill):
+    t = _ensure_template()
+    body = "\n".join(receipt_lines(bill)).encode("ascii", "replace")
+    return t["escpos_header"] + body + ESC_CUT
+
+
+def invoice_pdf(bill, path):
+    from fpdf import FPDF
+    t = _ensure_template()
+    profile = t["profile"]
+    pdf = FPDF()
+    lost = []
+    if t["fonts"]:
+        family, text = "Shop", str
+        _add_fonts(pdf, t["fonts"])
+        if t["shaping"]:
+            # Joins Tamil and Devanagari vowel signs and conjuncts
+            pdf.set_text_shaping(True)
+    else:
+        family = "Helvetica"
+
+        def text(value):
+            plain = latin1(value)
+            if "?" in plain and plain != value:
+                lost.append(value)
+            return plain
+
+    def cell(w, h, value="", border=0, align="L", fill=False, newline=False):
+        pdf.cell(w, h, text(value), border=border, align=align, fill=fill,
+                 new_x="LMARGIN" if newline else "RIGHT", new_y="NEXT" if newline else "TOP")
+
+    pdf.add_page()
+    pdf.set_font(family, "B", 16)
+    cell(190, 9, "TAX INVOICE", align="C", newline=True)
+    pdf.set_font(family, "B", 12)
+    cell(190, 7, profile["name"], align="C", newline=True)
+    pdf.set_font(family, "", 9)
+    for line in (profile["address"], profile["phone"], f"GSTIN: {profile['gstin']}" if profile["gstin"] else ""):
+        if line:
+            cell(190, 5, line, align="C", newline=True)
+    pdf.ln(4)
+
+    when = datetime.fromtimestamp(bill["ts"]).strftime("%d-%m-%Y %H:%M")
+    pdf.set_font(family, "", 10)
+    cell(95, 6, f"Invoice No: {bill['bill_no']}")
+    cell(95, 6, f"Date: {when}", align="R", newline=True)
+    cell(95, 6, f"Customer: {bill['customer'] or 'Walk-in'}")
+    cell(95, 6, f"Phone: {bill['phone'] or '-'}", align="R", newline=True)
+    if bill["address"]:
+        cell(190, 6, f"Address: {bill['address']}", newline=True)
+    pdf.ln(3)
+
+    rate = profile["gst_rate"]
+    cols = ["#", "Item", "HSN", "Qty", "Rate", "Taxable", "GST", "Amount"]
+    w = [8, 62, 16, 12, 22, 24, 20, 26]
+    pdf.set_fill_color(230, 230, 230)
+    pdf.set_font(family, "B", 9)
+    for i, col in enumerate(cols):
+        cell(w[i], 8, col, 1, "C", True)
+    pdf.ln()
+    pdf.set_font(family, "", 9)
+    taxable_sum = tax_sum = 0.0
+    for n, (code, name, qty, total, discount) in enumerate(bill["lines"], 1):
+        taxable, cgst, sgst = gst_split(total, rate)
+        taxable_sum += taxable
+        tax_sum += cgst + sgst
+        row = [str(n), name[:38], profile["hsn"], str(qty), f"{total / qty:.2f}" if qty else "-",
+               f"{taxable:.2f}", f"{cgst + sgst:.2f}", f"{total:.2f}"]
+        for i, value in enumerate(row):
+            cell(w[i], 7, value, 1, "L" if i == 1 else "R")
+        pdf.ln()
+
+    pdf.ln(3)
+    pdf.set_font(family, "", 10)
+    summary = [("Taxable value", taxable_sum), (f"CGST @ {rate / 2:g}%", tax_sum / 2), (f"SGST @ {rate / 2:g}%", tax_sum / 2)]
+    if bill["discount"]:
+        summary.append(("Discount", -bill["discount"]))
+    for label, value in summary:
+        cell(150, 6, label, align="R")
+        cell(40, 6, f"Rs. {value:.2f}", align="R", newline=True)
+    pdf.set_font(family, "B", 12)
+    cell(150, 8, "Grand Total", align="R")
+    cell(40, 8, f"Rs. {bill['total']:.2f}", align="R", newline=True)
+    pdf.ln(6)
+    pdf.set_font(family, "I", 9)
+    cell(190, 5, f"Payment: {bill['payment'] or 'Cash'}   Billed by: {bill['user'] or ''}", newline=True)
+    cell(190, 5, profile["footer"], align="C", newline=True)
+    missing = "".join(sorted({chr(c) for font in pdf.fonts.values() for c in getattr(font, "missing_glyphs", ())}))
+    pdf.output(path)
+    if lost:
+        logging.error(f"RECEIPTS: invoice {bill['bill_no']} printed {lost[0]!r} with '?' for characters "
+                      f"the built-in PDF font lacks; set \"font\" in shop_profile.json to a .ttf that has them")
+    if missing:
+        logging.error(f"RECEIPTS: invoice {bill['bill_no']} is missing {missing!r}: {t['font']} has no glyphs for "
+                      f"them; set \"font\" in shop_profile.json to a .ttf that has them")
+
+
+def render_bill(bill, directory):
+    """Writes <bill>.pdf, <bill>.txt and <bill>.prn (ESC/POS); returns the paths."""
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, safe_name(bill["bill_no"]))
+    invoice_pdf(bill, base + ".pdf")
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(receipt_text(bill))
+    with open(base + ".prn", "wb") as f:
+        f.write(receipt_escpos(bill))
+    return [base + ".pdf", base + ".txt", base + ".prn"]
+
+
+# --- App side ---
+
+class ReceiptPrinter:
+    """Submits bills to the rendering pool; every call returns Futures."""
+
+    def __init__(self, db, directory=RECEIPT_DIR, workers=2):
+        self.db = db
+        self.directory = directory
+        self.workers = workers
+        self._pool = None
+        atexit.register(self.close)
+
+    def start(self):
+        """Spawns the workers ahead of the first checkout (process start-up is slow on Windows)."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(load_profile(),))
+            for _ in range(self.workers):
+                self._pool.submit(os.getpid)
+        return self
+
+    def render(self, bill_no, directory=None):
+        """Renders one committed bill in the background; the Future yields its file paths."""
+        bill = self.db.sales.bill(bill_no)
+        if bill is None:
+            raise KeyError(f"Bill {bill_no} not found")
+        future = self.start()._pool.submit(render_bill, bill, directory or self.directory)
+        future.add_done_callback(lambda f: self._log(bill_no, f))
+        return future
+
+    def reprint(self, bill_nos, folder):
+        """Re-renders many bills in parallel into a subfolder; returns the Futures."""
+        directory = os.path.join(self.directory, folder)
+        return [self.render(bill_no, directory) for bill_no in bill_nos]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _log(self, bill_no, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logging.error(f"RECEIPT FAILED for {bill_no}: {future.exception()}")
@@ -1,10 +1,12 @@
 import customtkinter as ctk
-from tkinter import ttk, messagebox
+from tkinter import messagebox
 import os
 import csv
-import logging
 from datetime import datetime
 from fpdf import FPDF
+from database import day_range
+from query_scheduler import QueryScheduler
+from virtual_table import VirtualTable
 
 class ReportsModule:
     def __init__(self, main_view, db):
@@ -29,12 +31,11 @@ class ReportsModule:
         ctk.CTkLabel(filter_frame, text="Bill ID:").grid(row=0, column=0, padx=5)
         self.search_bill = ctk.CTkEntry(filter_frame, placeholder_text="Search ID...", width=120)
         self.search_bill.grid(row=0, column=1, padx=5)
-        self.search_bill.bind("<KeyRelease>", lambda e: self.refresh_data())
+        self.search_bill.bind("<KeyRelease>", lambda e: self.refresh_data(debounce=True))
 
         # 2. Category Filter
         ctk.CTkLabel(filter_frame, text="Category:").grid(row=0, column=2, padx=5)
-        self.db.cursor.execute("SELECT name FROM categories")
-        categories = ["All"] + [r[0] for r in self.db.cursor.fetchall()]
+        categories = ["All"] + self.db.categories.names()
         self.cat_filter = ctk.CTkComboBox(filter_frame, values=categories, width=130, command=lambda x: self.refresh_data())
         self.cat_filter.set("All")
         self.cat_filter.grid(row=0, column=3, padx=5)
@@ -57,11 +58,12 @@ class ReportsModule:
 
         # --- Treeview Table ---
         columns = ("Bill ID", "Item Name", "Category", "Qty", "Total", "Date/Time")
-        self.tree = ttk.Treeview(self.main_view, columns=columns, show='headings')
-        for col in columns:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=130, anchor="center")
-        self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+        # Newest first; only the lines scrolled to are fetched
+        self.table = VirtualTable(self.main_view, self.db, columns, self.db.sales.report_page,
+                                  sort=5, desc=True, width=130)
+        self.tree = self.table.tree
+        self.table.pack(fill="both", expand=True, padx=20, pady=10)
+        self.totals = QueryScheduler(self.tree, self.db)
 
         # --- Action Footer ---
         action_frame = ctk.CTkFrame(self.main_view, fg_color="transparent")
@@ -72,12 +74,14 @@ class ReportsModule:
 
         ctk.CTkButton(action_frame, text="📄 View PDF", fg_color="#34495e", command=self.export_pdf).pack(side="right", padx=5)
         ctk.CTkButton(action_frame, text="📊 Export CSV", fg_color="#27ae60", command=self.export_csv).pack(side="right", padx=5)
+        ctk.CTkButton(action_frame, text="🗄️ Archive Old Seasons", fg_color="#7f8c8d", command=self.archive_seasons).pack(side="right", padx=5)
+        ctk.CTkButton(action_frame, text="🔢 Bill No. Gaps", fg_color="#7f8c8d", command=self.show_number_gaps).pack(side="right", padx=5)
+        ctk.CTkButton(action_frame, text="🧾 Reprint Day", fg_color="#34495e", command=self.reprint_day).pack(side="right", padx=5)
 
         self.refresh_data()
 
     def get_available_dates(self):
-        self.db.cursor.execute("SELECT DISTINCT date(date) FROM sales ORDER BY date DESC")
-        dates = [row[0] for row in self.db.cursor.fetchall()]
+        dates = self.db.sales.days()
         return dates if dates else ["No Sales"]
 
     def reset_filters(self):
@@ -87,37 +91,94 @@ class ReportsModule:
         self.date_to.set("Select Date")
         self.refresh_data()
 
-    def refresh_data(self):
-        """Dynamic database query based on filters"""
+    def filters(self):
+        """(bill search, category, ts range) as SalesRepo.report() takes them
+
+        Raises ValueError for a date range spanning too many archived seasons.
+        """
         bill_val = self.search_bill.get().strip()
         cat_val = self.cat_filter.get()
         d_from = self.date_from.get()
         d_to = self.date_to.get()
 
-        query = "SELECT bill_id, item_name, category, quantity, total, date FROM sales WHERE 1=1"
-        params = []
-
-        if bill_val:
-            query += " AND bill_id LIKE ?"
-            params.append(f"%{bill_val}%")
-        if cat_val != "All":
-            query += " AND category = ?"
-            params.append(cat_val)
+        ts_range = None
         if d_from != "Select Date" and d_to != "Select Date":
-            query += " AND date(date) BETWEEN ? AND ?"
-            params.extend([d_from, d_to])
+            ts_range = day_range(d_from, d_to)
+            self.db.archive.check_range(*ts_range)
+        return bill_val, None if cat_val == "All" else cat_val, ts_range
 
-        query += " ORDER BY date DESC"
-        
-        for i in self.tree.get_children(): self.tree.delete(i)
-        self.db.cursor.execute(query, params)
-        rows = self.db.cursor.fetchall()
-        
-        total_rev = 0
-        for row in rows:
-            self.tree.insert("", "end", values=row)
-            total_rev += row[4]
-        self.revenue_lbl.configure(text=f"Total Revenue: ₹{total_rev:.2f}")
+    def refresh_data(self, debounce=False):
+        """Dynamic database query based on filters, run off the UI thread"""
+        # Reports run on a read-only connection so they never hold up billing
+        try:
+            filters = self.filters()
+        except ValueError as e:
+            messagebox.showerror("Date Range", str(e))
+            return
+        self.table.load(*filters, debounce=debounce)
+        # Revenue covers every matching line, not just the pages loaded so far
+        self.totals.schedule(self.db.sales.report_summary, self.show_totals, *filters,
+                             delay=None if debounce else 0)
+
+    def show_totals(self, summary):
+        lines, revenue = summary
+        self.revenue_lbl.configure(text=f"Total Revenue: ₹{revenue:.2f}  ({lines} lines)")
+
+    def archive_seasons(self):
+        """Moves closed seasons to archive files; they stay reachable by date range"""
+        years = self.db.archive.closed_seasons()
+        if not years:
+            messagebox.showinfo("Archive", "No closed seasons to archive.")
+            return
+        if not messagebox.askyesno("Confirm", f"Move sales from {', '.join(map(str, years))} into archive files?"):
+            return
+        future = self.db.archive.archive_in_background()
+        self.main_view.after(100, self.poll_archive, future)
+
+    def poll_archive(self, future):
+        if not future.done():
+            self.main_view.after(100, self.poll_archive, future)
+            return
+        try:
+            moved = future.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Archive failed: {e}")
+            return
+        summary = "\n".join(f"{year}: {bills} bills, {lines} lines" for year, (bills, lines) in moved.items())
+        messagebox.showinfo("Archive", f"Archived seasons:\n{summary}")
+        if self.tree.winfo_exists(): self.render()
+
+    def show_number_gaps(self):
+        """Bill numbers claimed by a counter that never became a saved bill"""
+        gaps = self.db.bill_numbers.gaps()
+        if not gaps:
+            messagebox.showinfo("Bill Numbers", "No gaps: every issued bill number has a saved bill.")
+            return
+        shown = "\n".join(gaps[:40]) + (f"\n... and {len(gaps) - 40} more" if len(gaps) > 40 else "")
+        messagebox.showwarning("Bill Numbers", f"{len(gaps)} unused bill number(s):\n{shown}")
+
+    def reprint_day(self):
+        """Re-renders invoices and receipts for the 'From' date (default today) in parallel"""
+        day = self.date_from.get()
+        if day in ("Select Date", "No Sales"):
+            day = datetime.now().strftime("%Y-%m-%d")
+        bill_nos = self.db.sales.bills_between(*day_range(day, day))
+        if not bill_nos:
+            messagebox.showinfo("Reprint", f"No bills on {day}.")
+            return
+        futures = self.db.receipts.reprint(bill_nos, day)
+        self.main_view.after(100, self.poll_reprint, futures, day)
+
+    def poll_reprint(self, futures, day):
+        if not all(f.done() for f in futures):
+            self.main_view.after(100, self.poll_reprint, futures, day)
+            return
+        failed = sum(1 for f in futures if f.exception() is not None)
+        folder = os.path.join(self.db.receipts.directory, day)
+        if failed:
+            messagebox.showerror("Reprint", f"{len(futures) - failed} bills rendered, {failed} failed (see app.log).\nFolder: {folder}")
+        else:
+            messagebox.showinfo("Reprint", f"{len(futures)} bills rendered to {folder}")
 
     def generate_filename(self, ext):
         """Generates filename based on Bill ID or Date Range"""
@@ -135,7 +196,12 @@ class ReportsModule:
         return f"exports/{name}{ext}"
 
     def export_pdf(self):
-        items = self.tree.get_children()
+        # Exports read the whole filtered report, not just the rows scrolled into the table
+        try:
+            items = self.db.sales.report(*self.filters())
+        except ValueError as e:
+            messagebox.showerror("Date Range", str(e))
+            return
         if not items:
             messagebox.showwarning("Empty", "No data to export.")
             return
@@ -163,8 +229,7 @@ class ReportsModule:
             # Table Rows
             pdf.set_font("Arial", '', 9)
             grand_total = 0
-            for item_id in items:
-                v = self.tree.item(item_id)['values']
+            for v in items:
                 pdf.cell(w[0], 8, str(v[0]), 1)
                 pdf.cell(w[1], 8, str(v[1]), 1)
                 pdf.cell(w[2], 8, str(v[2]), 1)
@@ -186,7 +251,11 @@ class ReportsModule:
             messagebox.showerror("Error", f"PDF Failed: {e}")
 
     def export_csv(self):
-        items = self.tree.get_children()
+        try:
+            items = self.db.sales.report(*self.filters())
+        except ValueError as e:
+            messagebox.showerror("Date Range", str(e))
+            return
         if not items: return
         
         file_path = self.generate_filename(".csv")
@@ -194,8 +263,7 @@ class ReportsModule:
             with open(file_path, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
                 writer.writerow(["Bill ID", "Item", "Category", "Qty", "Total", "Timestamp"])
-                for item_id in items:
-                    writer.writerow(self.tree.item(item_id)['values'])
+                writer.writerows(items)
             messagebox.showinfo("Success", f"Saved to {file_path}")
         except Exception as e:
             messagebox.showerror("Error", f"CSV Failed: {e}")
\ No newline at end of file
@@ -0,0 +1,821 @@
+"""Data-access layer: every SQL statement the screens run lives here.
+
+Statements are module constants, so each one is compiled once per connection
+and then served from sqlite3's prepared-statement cache (cached_statements
+in database.ConnectionManager). Reads use the calling thread's read-only
+connection; writes use the writer connection and commit per call. Bulk
+methods take lists of rows and issue a single executemany. Once a write
+has committed, the rows it changed are published on db.changes.
+"""
+import time
+
+from archive import MAX_ATTACHED
+from change_bus import DELETE, RELOAD, UPSERT
+from search_index import ProductSearchIndex
+from customer_index import CustomerIndex
+from pricing import PriceBook
+
+
+class InsufficientStock(Exception):
+    """Checkout lines the shelf cannot cover; `lines` holds (code, name, wanted, available)."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        super().__init__("Insufficient stock for " + ", ".join(f"{name} ({available} left, {wanted} wanted)"
+                                                                for code, name, wanted, available in lines))
+
+
+class Repo:
+    def __init__(self, db):
+        self.db = db
+
+    def read(self, sql, params=()):
+        return self.db.reader().execute(sql, params)
+
+    def write(self, sql, params=()):
+        return self.transact(lambda conn: conn.execute(sql, params))
+
+    def write_many(self, sql, rows):
+        return self.transact(lambda conn: conn.executemany(sql, rows))
+
+    def transact(self, work):
+        """Runs work(conn) on the writer connection and commits it as one transaction."""
+        conn = self.db.conn
+        # A failed batch must not leave half its rows pending on the shared writer
+        try:
+            result = work(conn)
+            self.db.changes.before_commit()
+            conn.commit()
+            self.db.changes.committed()
+        except Exception:
+            conn.rollback()
+            raise
+        return result
+
+
+def keyset_page(query, keys, desc=False, after=None, limit=200):
+    """Turns a listing query into one page of a keyset-paginated listing.
+
+    `query` selects the visible columns, then the sort value as _sort, then
+    the columns named in `keys`, which make a row unique. `after` is those
+    trailing (sort, *keys) values of the last row already shown; the page
+    continues right after it, so page 500 costs the same as page 1 (unlike
+    OFFSET). NULL sort values come first ascending and last descending, as
+    in SQLite's ORDER BY. Returns (sql, params).
+    """
+    direction, cmp = ("DESC", "<") if desc else ("ASC", ">")
+    key_cols = ", ".join(keys)
+    marks = ", ".join("?" * len(keys))
+    where, params = "", []
+    if after is not None:
+        value, key = after[0], list(after[1:])
+        if value is None:
+            where = f"WHERE _sort IS NULL AND ({key_cols}) {cmp} ({marks})"
+            if not desc:
+                where += " OR _sort IS NOT NULL"
+            params = key
+        else:
+            where = f"WHERE (_sort, {key_cols}) {cmp} (?, {marks})"
+            if desc:
+                where += " OR _sort IS NULL"
+            params = [value] + key
+    order = ", ".join(f"{col} {direction}" for col in ["_sort"] + list(keys))
+    return f"SELECT * FROM ({query}) {where} ORDER BY {order} LIMIT ?", params + [limit]
+
+
+class ProductRepo(Repo):
+    COLUMNS = "product_code, name, category, price, stock, discount_percent, sold_qty"
+
+    SEARCH = "SELECT name, stock FROM inventory WHERE (name LIKE ? OR product_code LIKE ?) ORDER BY name ASC LIMIT ?"
+    SEARCH_IN_CATEGORY = "SELECT name, stock FROM inventory WHERE (name LIKE ? OR product_code LIKE ?) AND category = ? ORDER BY name ASC LIMIT ?"
+    BY_NAME = "SELECT product_code, name, category, price, stock FROM inventory WHERE name=?"
+    BY_CODE = "SELECT product_code, name, category, price, stock FROM inventory WHERE product_code=?"
+    LIST = f"SELECT {COLUMNS} FROM inventory WHERE name LIKE ? OR product_code LIKE ?"
+    # Paged listing: {sort} is one of SORTS, the column the table is sorted on
+    PAGE = f"SELECT {COLUMNS}, {{sort}} AS _sort, product_code AS _key FROM inventory WHERE name LIKE ? OR product_code LIKE ?"
+    SORTS = COLUMNS.split(", ")
+    ROWS = f"SELECT {COLUMNS}, NULL AS _sort, product_code AS _key FROM inventory WHERE product_code IN ({{marks}})"
+    ALL = f"SELECT {COLUMNS} FROM inventory"
+    # Product details only: stock changes go through the ledger (StockRepo.move)
+    UPSERT = """
+        INSERT INTO inventory (product_code, name, category, price, stock, discount_percent)
+        VALUES (?, ?, ?, ?, 0, ?)
+        ON CONFLICT(product_code)
+        DO UPDATE SET name=excluded.name, category=excluded.category,
+                      price=excluded.price, discount_percent=excluded.discount_percent
+    """
+    # CSV imports keep an existing product's category; their stock is added as an import move
+    UPSERT_IMPORT = """
+        INSERT INTO inventory (product_code, name, category, price, stock, discount_percent)
+        VALUES (?, ?, ?, ?, 0, ?)
+        ON CONFLICT(product_code) DO UPDATE SET
+        name=excluded.name, price=excluded.price, discount_percent=excluded.discount_percent
+    """
+    IMPORT_ROWS = "SELECT product_code, name, category, price, stock, discount_percent FROM inventory WHERE product_code IN ({marks})"
+    # The stock guard makes the decrement itself the final check, whatever the cart saw earlier
+    APPLY_SALE = "UPDATE inventory SET stock=stock-?, sold_qty=sold_qty+? WHERE product_code=? AND stock >= ?"
+    STOCK = "SELECT name, stock FROM inventory WHERE product_code=?"
+    # Manual corrections may not take stock below zero
+    ADJUST_STOCK = "UPDATE inventory SET stock=stock+? WHERE product_code=? AND stock+? >= 0"
+    STOCK_VALUE = "SELECT SUM(price * stock) FROM inventory"
+    LOW_STOCK_COUNT = "SELECT COUNT(*) FROM inventory WHERE stock < ?"
+    TOTAL_SOLD = "SELECT SUM(sold_qty) FROM inventory"
+    SOLD_BY_CATEGORY = "SELECT category, SUM(sold_qty) as total FROM inventory GROUP BY category ORDER BY total DESC"
+    TOP_SELLERS = "SELECT name, sold_qty FROM inventory ORDER BY sold_qty DESC LIMIT ?"
+
+    INDEX_ROWS = "SELECT product_code, name, category, price, stock FROM inventory"
+
+    _index = None
+
+    @property
+    def index(self):
+        """In-memory search index, built on first use and kept current by the writes below."""
+        if self._index is None:
+            self._index = ProductSearchIndex(self.read(self.INDEX_ROWS).fetchall())
+        return self._index
+
+    def refresh_index(self, codes):
+        """Re-reads the given products into the search index (and price book) after they changed.
+
+        Every write to inventory, here or in a writer-thread job, ends up
+        here once committed, so this is also where the change is published.
+        """
+        self.db.price_rules.refresh_products(codes)
+        if self._index is not None:
+            for code in codes:
+                row = self.get_by_code(code)
+                if row is None:
+                    self._index.remove(code)
+                else:
+                    self._index.upsert(row)
+        self.db.changes.publish("inventory", list(codes))
+
+    def reload(self, changes):
+        """Change-bus subscriber: another process changed inventory, so the caches are rebuilt."""
+        if any(change.op == RELOAD for change in changes):
+            self._index = None
+            self.db.price_rules.reload()
+
+    def rows(self, codes):
+        """page()-shaped rows for these codes, for updating a table in place."""
+        found = []
+        codes = list(codes)
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            found += self.read(self.ROWS.format(marks=",".join("?" * len(chunk))), chunk).fetchall()
+        return found
+
+    def search(self, text, category=None, limit=50):
+        """(name, stock) rows whose name or code contains `text`."""
+        pattern = f"%{text}%"
+        if category:
+            return self.read(self.SEARCH_IN_CATEGORY, (pattern, pattern, category, limit)).fetchall()
+        return self.read(self.SEARCH, (pattern, pattern, limit)).fetchall()
+
+    def get_by_name(self, name):
+        return self.read(self.BY_NAME, (name,)).fetchone()
+
+    def get_by_code(self, code):
+        return self.read(self.BY_CODE, (code,)).fetchone()
+
+    def list(self, text=""):
+        pattern = f"%{text}%"
+        return self.read(self.LIST, (pattern, pattern)).fetchall()
+
+    def all(self):
+        return self.read(self.ALL).fetchall()
+
+    def page(self, text="", sort=1, desc=False, after=None, limit=200):
+        """One keyset page of list(text), sorted on column number `sort`."""
+        pattern = f"%{text}%"
+        sql, params = keyset_page(self.PAGE.format(sort=self.SORTS[sort]), ["_key"], desc, after, limit)
+        return self.read(sql, [pattern, pattern] + params).fetchall()
+
+    def upsert(self, code, name, category, price, stock, discount):
+        """Saves a product; `stock` is the counted stock, booked as the difference from the current one."""
+        def save(conn):
+            # IMMEDIATE: a checkout must not land between reading the stock and booking the difference
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(self.STOCK, (code,)).fetchone()
+            conn.execute(self.UPSERT, (code, name, category, price, discount))
+            kind = "receipt" if row is None else "adjustment"
+            self.db.stock.move(conn, [(code, kind, stock - (row[1] if row else 0), "manual edit")])
+        self.transact(save)
+        self.refresh_index([code])
+
+    def bulk_import(self, rows, conn=None, ref=None):
+        """rows: (code, name, category, price, stock, discount); stock is added as an import move.
+
+        Given `conn` (a job on the writer thread) the rows join its
+        transaction, and the caller refreshes the index once it commits.
+        """
+        def save(conn):
+            conn.executemany(self.UPSERT_IMPORT, [(code, name, cat, price, disc)
+                                                  for code, name, cat, price, stock, disc in rows])
+            self.db.stock.move(conn, [(row[0], "import", row[4], ref) for row in rows])
+        if conn is not None:
+            save(conn)
+            return
+        self.transact(save)
+        self.refresh_index({row[0] for row in rows})
+
+    def import_rows(self, codes):
+        """Current (code, name, category, price, stock, discount) of these codes, for import diffs."""
+        marks = ",".join("?" * len(codes))
+        return self.read(self.IMPORT_ROWS.format(marks=marks), list(codes)).fetchall()
+
+    def adjust_stock(self, code, delta, kind="adjustment", ref=None):
+        """Adds delta to a product's stock, booked as a `kind` move; returns the new stock."""
+        def save(conn):
+            changed = conn.execute(self.ADJUST_STOCK, (delta, code, delta)).rowcount
+            if changed:
+                self.db.stock.record(conn, [(code, kind, delta, ref)])
+            return changed
+        if self.transact(save) != 1:
+            row = self.get_by_code(code)
+            if row is None:
+                raise KeyError(code)
+            raise ValueError(f"{row[1]} has only {row[4]} in stock")
+        self.refresh_index([code])
+        return self.get_by_code(code)[4]
+
+    def apply_sale(self, conn, lines, ref=None):
+        """lines: (product_code, qty). Runs on the caller's (writer) connection.
+
+        All lines are decremented in one guarded batch and booked as sale
+        moves referencing the bill. If any product no longer has enough
+        stock the whole batch is undone and InsufficientStock lists exactly
+        the lines that failed.
+        """
+        conn.execute("SAVEPOINT apply_sale")
+        try:
+            cur = conn.executemany(self.APPLY_SALE, [(qty, qty, code, qty) for code, qty in lines])
+            if cur.rowcount == len(lines):
+                self.db.stock.record(conn, [(code, "sale", -qty, ref) for code, qty in lines])
+                return
+            conn.execute("ROLLBACK TO apply_sale")
+            # Slow path, failures only: find the short lines against the restored stock
+            short = []
+            for code, qty in lines:
+                row = conn.execute(self.STOCK, (code,)).fetchone()
+                if row is None or row[1] < qty:
+                    short.append((code, row[0] if row else code, qty, row[1] if row else 0))
+            raise InsufficientStock(short)
+        finally:
+            conn.execute("RELEASE apply_sale")
+
+    def stock_value(self):
+        return self.read(self.STOCK_VALUE).fetchone()[0] or 0.0
+
+    def low_stock_count(self, threshold=10):
+        return self.read(self.LOW_STOCK_COUNT, (threshold,)).fetchone()[0]
+
+    def total_sold(self):
+        return self.read(self.TOTAL_SOLD).fetchone()[0] or 0
+
+    def sold_by_category(self):
+        return self.read(self.SOLD_BY_CATEGORY).fetchall()
+
+    def top_sellers(self, limit=5):
+        return self.read(self.TOP_SELLERS, (limit,)).fetchall()
+
+
+class StockRepo(Repo):
+    """The stock ledger: every change to inventory.stock as a signed move.
+
+    inventory.stock is the materialized total of a product's moves and is
+    only changed together with a move, in the same transaction. Snapshots
+    store every product's total as of one move, so "stock on date X" and
+    reconciliation start from the nearest snapshot and add up only the
+    moves after it.
+    """
+
+    KINDS = ("opening", "receipt", "sale", "adjustment", "return", "import")
+    MOVE = "INSERT INTO stock_moves (product_code, ts, kind, qty, ref) VALUES (?,?,?,?,?)"
+    ADD = "UPDATE inventory SET stock=stock+? WHERE product_code=?"
+    HISTORY = """
+        SELECT id, datetime(ts, 'unixepoch', 'localtime'), kind, qty, ref
+        FROM stock_moves WHERE product_code=? ORDER BY id DESC LIMIT ?"""
+    LAST_MOVE = "SELECT COALESCE(MAX(id), 0) FROM stock_moves"
+    LATEST_SNAPSHOT = "SELECT id, ts, last_move_id FROM stock_snapshots ORDER BY id DESC LIMIT 1"
+    SNAPSHOT_AT = "SELECT id, ts, last_move_id FROM stock_snapshots WHERE ts <= ? ORDER BY id DESC LIMIT 1"
+    # A snapshot's lines plus the moves after it: {snapshot} is the id, {moves} a condition on them
+    TOTALS = """
+        SELECT product_code, SUM(stock) AS stock FROM (
+            SELECT product_code, stock FROM stock_snapshot_lines WHERE snapshot_id = ?
+            UNION ALL
+            SELECT product_code, SUM(qty) FROM stock_moves WHERE id > ? AND {moves} GROUP BY product_code
+        ) GROUP BY product_code"""
+    PRODUCT_TOTAL = """
+        SELECT COALESCE((SELECT stock FROM stock_snapshot_lines WHERE snapshot_id = ? AND product_code = ?), 0)
+             + COALESCE((SELECT SUM(qty) FROM stock_moves WHERE product_code = ? AND id > ? AND ts <= ?), 0)"""
+    ADD_SNAPSHOT = "INSERT INTO stock_snapshots (ts, last_move_id) VALUES (?, ?)"
+    SNAPSHOT_LINES = """
+        INSERT INTO stock_snapshot_lines (snapshot_id, product_code, stock)
+        SELECT ?, product_code, stock FROM ({totals}) WHERE stock != 0"""
+    RECONCILE = """
+        SELECT i.product_code, i.name, i.stock, COALESCE(l.stock, 0)
+        FROM inventory i LEFT JOIN ({totals}) l ON l.product_code = i.product_code
+        WHERE i.stock != COALESCE(l.stock, 0) ORDER BY i.product_code"""
+    OLD_SNAPSHOTS = "SELECT id FROM stock_snapshots ORDER BY id DESC LIMIT -1 OFFSET ?"
+    DROP_SNAPSHOT_LINES = "DELETE FROM stock_snapshot_lines WHERE snapshot_id=?"
+    DROP_SNAPSHOT = "DELETE FROM stock_snapshots WHERE id=?"
+
+    def record(self, conn, moves):
+        """Books (code, kind, qty, ref) moves whose stock change the caller already made."""
+        ts = int(time.time())
+        conn.executemany(self.MOVE, [(code, ts, kind, qty, ref) for code, kind, qty, ref in moves if qty])
+
+    def move(self, conn, moves):
+        """Books (code, kind, qty, ref) moves and applies them to inventory.stock."""
+        moves = [move for move in moves if move[2]]
+        self.record(conn, moves)
+        conn.executemany(self.ADD, [(qty, code) for code, kind, qty, ref in moves])
+
+    def history(self, code, limit=200):
+        """(id, time, kind, qty, ref) of a product's latest moves, newest first."""
+        return self.read(self.HISTORY, (code, limit)).fetchall()
+
+    def _base(self, ts=None, conn=None):
+        """(snapshot id, last move id) to start from: the latest snapshot, or the one in force at ts."""
+        conn = conn or self.db.reader()
+        row = conn.execute(self.LATEST_SNAPSHOT if ts is None else self.SNAPSHOT_AT, () if ts is None else (ts,)).fetchone()
+        return (row[0], row[2]) if row else (0, 0)
+
+    def as_of(self, ts):
+        """{product_code: stock} at epoch time ts (products with stock only)."""
+        snapshot, last = self._base(ts)
+        rows = self.read(self.TOTALS.format(moves="ts <= ?"), (snapshot, last, ts)).fetchall()
+        return {code: stock for code, stock in rows if stock}
+
+    def product_as_of(self, code, ts):
+        snapshot, last = self._base(ts)
+        return self.read(self.PRODUCT_TOTAL, (snapshot, code, code, last, ts)).fetchone()[0]
+
+    def reconcile(self):
+        """(code, name, stock column, ledger total) of every product where the two disagree."""
+        snapshot, last = self._base()
+        return self.read(self.RECONCILE.format(totals=self.TOTALS.format(moves="1")), (snapshot, last)).fetchall()
+
+    def moves_since_snapshot(self):
+        """(moves booked since the latest snapshot, that snapshot's ts or None)."""
+        row = self.read(self.LATEST_SNAPSHOT).fetchone()
+        return self.read(self.LAST_MOVE).fetchone()[0] - (row[2] if row else 0), row[1] if row else None
+
+    def snapshot(self, conn, keep=30):
+        """Snapshots the ledger totals on the writer thread; returns the id, or None if nothing moved.
+
+        Built from the previous snapshot plus the moves since, so it holds
+        what the ledger says even if inventory.stock has drifted. Only the
+        latest `keep` snapshots are kept.
+        """
+        previous, last = self._base(conn=conn)
+        newest = conn.execute(self.LAST_MOVE).fetchone()[0]
+        if previous and newest == last:
+            return None
+        snapshot_id = conn.execute(self.ADD_SNAPSHOT, (int(time.time()), newest)).lastrowid
+        conn.execute(self.SNAPSHOT_LINES.format(totals=self.TOTALS.format(moves="id <= ?")),
+                     (snapshot_id, previous, last, newest))
+        for (old,) in conn.execute(self.OLD_SNAPSHOTS, (keep,)).fetchall():
+            conn.execute(self.DROP_SNAPSHOT_LINES, (old,))
+            conn.execute(self.DROP_SNAPSHOT, (old,))
+        return snapshot_id
+
+
+class SalesRepo(Repo):
+    REPORT_COLUMNS = """
+        SELECT b.bill_no, COALESCE(i.name, l.product_code), COALESCE(c.name, i.category),
+               l.quantity, l.total, datetime(b.ts, 'unixepoch', 'localtime')"""
+    REPORT_FROM = """
+        FROM {src}bills b
+        JOIN {src}bill_lines l ON l.bill_id = b.id
+        LEFT JOIN inventory i ON i.product_code = l.product_code
+        LEFT JOIN categories c ON c.id = l.category_id
+        WHERE 1=1"""
+    REPORT = REPORT_COLUMNS + REPORT_FROM
+    REPORT_HOT = REPORT.format(src="")
+    # Paged report: sorted on one of REPORT_SORTS, lines kept unique by (bill id, line no, source);
+    # the source tells a live bill from an archived one with the same id
+    REPORT_PAGE = (REPORT_COLUMNS + ", {sort} AS _sort, b.id AS _key, l.line_no AS _line, '{src}' AS _src"
+                   + REPORT_FROM)
+    REPORT_KEYS = ["_key", "_line", "_src"]
+    REPORT_SORTS = ("b.bill_no", "COALESCE(i.name, l.product_code)", "COALESCE(c.name, i.category)",
+                    "l.quantity", "l.total", "b.ts")
+    REPORT_SUMMARY = "SELECT COUNT(*) AS n, SUM(l.total) AS t" + REPORT_FROM
+    REPORT_BILL = " AND b.bill_no LIKE ?"
+    REPORT_CATEGORY = " AND l.category_id IN (SELECT id FROM categories WHERE name = ?)"
+    REPORT_RANGE = " AND b.ts >= ? AND b.ts < ?"
+    REPORT_ORDER = " ORDER BY b.ts DESC"
+    DAYS = "SELECT DISTINCT date(ts, 'unixepoch', 'localtime') AS day FROM bills ORDER BY day DESC"
+    CUSTOMER_HISTORY = "SELECT bill_no, total, ts FROM bills WHERE customer_phone=? ORDER BY ts DESC"
+    BILL_HEADER = """
+        SELECT b.bill_no, b.ts, b.customer_phone, c.name, c.address, b.created_by,
+               b.payment_mode, b.total, b.discount_amount
+        FROM bills b LEFT JOIN customers c ON c.phone = b.customer_phone
+        WHERE b.bill_no=?"""
+    BILL_LINES = """
+        SELECT l.product_code, COALESCE(i.name, l.product_code), l.quantity, l.total, l.discount_amount
+        FROM bills b
+        JOIN bill_lines l ON l.bill_id = b.id
+        LEFT JOIN inventory i ON i.product_code = l.product_code
+        WHERE b.bill_no=? ORDER BY l.line_no"""
+    BILLS_BETWEEN = "SELECT bill_no FROM bills WHERE ts >= ? AND ts < ? ORDER BY ts"
+    BILL_KEY = "SELECT id FROM bills WHERE bill_no=?"
+    INSERT_BILL = """
+        INSERT INTO bills (bill_no, ts, customer_phone, created_by, total, discount_amount)
+        VALUES (?,?,?,?,?,?)
+    """
+    INSERT_LINES = """
+        INSERT INTO bill_lines (bill_id, line_no, product_code, category_id, quantity, total, discount_amount)
+        VALUES (?,?,?,(SELECT id FROM categories WHERE name=?),?,?,?)
+    """
+
+    def _report_sources(self, bill_like, category, ts_range):
+        """(reader, schema prefixes, WHERE additions, params) for a filtered report.
+
+        Without a date range only the live (current season) tables are read;
+        a range reaching archived seasons attaches those years to the reader.
+        """
+        where, params = "", []
+        if bill_like:
+            where += self.REPORT_BILL
+            params.append(f"%{bill_like}%")
+        if category:
+            where += self.REPORT_CATEGORY
+            params.append(category)
+        if ts_range:
+            # Epoch range on the bill header so idx_bills_ts can be used
+            where += self.REPORT_RANGE
+            params.extend(ts_range)
+        conn = self.db.reader()
+        archived = self.db.archive.attach(conn, self.db.archive.check_range(*ts_range)) if ts_range else []
+        return conn, [""] + [f"{name}." for name in archived], where, params
+
+    def report(self, bill_like=None, category=None, ts_range=None):
+        """Sales lines for the Reports screen (and its exports), newest first."""
+        conn, sources, where, params = self._report_sources(bill_like, category, ts_range)
+        if len(sources) == 1:
+            return conn.execute(self.REPORT_HOT + where + self.REPORT_ORDER, params).fetchall()
+        parts = [self.REPORT.format(src=src) + where for src in sources]
+        return conn.execute(" UNION ALL ".join(parts) + " ORDER BY 6 DESC", params * len(parts)).fetchall()
+
+    def report_page(self, bill_like=None, category=None, ts_range=None, sort=5, desc=True, after=None, limit=200):
+        """One keyset page of report(), sorted on column number `sort`."""
+        conn, sources, where, params = self._report_sources(bill_like, category, ts_range)
+        query = " UNION ALL ".join(self.REPORT_PAGE.format(src=src, sort=self.REPORT_SORTS[sort]) + where
+                                   for src in sources)
+        sql, page_params = keyset_page(query, self.REPORT_KEYS, desc, after, limit)
+        return conn.execute(sql, params * len(sources) + page_params).fetchall()
+
+    def report_summary(self, bill_like=None, category=None, ts_range=None):
+        """(lines, revenue) of the whole filtered report, without fetching it."""
+        conn, sources, where, params = self._report_sources(bill_like, category, ts_range)
+        parts = " UNION ALL ".join(self.REPORT_SUMMARY.format(src=src) + where for src in sources)
+        lines, revenue = conn.execute(f"SELECT SUM(n), SUM(t) FROM ({parts})", params * len(sources)).fetchone()
+        return lines or 0, round(revenue or 0.0, 2)
+
+    def days(self):
+        """Sale days, newest first, including archived seasons."""
+        days = {row[0] for row in self.read(self.DAYS)}
+        days.update(self.db.archive.days())
+        return sorted(days, reverse=True)
+
+    def bill(self, bill_no):
+        """One bill with its lines as a plain dict (what receipts are rendered from), or None."""
+        head = self.read(self.BILL_HEADER, (bill_no,)).fetchone()
+        if head is None:
+            return None
+        keys = ("bill_no", "ts", "phone", "customer", "address", "user", "payment", "total", "discount")
+        bill = dict(zip(keys, head))
+        bill["lines"] = self.read(self.BILL_LINES, (bill_no,)).fetchall()
+        return bill
+
+    def bills_between(self, ts_from, ts_to):
+        """Bill numbers in an epoch range [ts_from, ts_to), in order."""
+        return [row[0] for row in self.read(self.BILLS_BETWEEN, (ts_from, ts_to))]
+
+    def bill_key(self, bill_no, conn=None):
+        """Key of an existing bill, or None; pass the writer connection inside a transaction."""
+        row = (conn or self.db.reader()).execute(self.BILL_KEY, (bill_no,)).fetchone()
+        return row[0] if row else None
+
+    def customer_history(self, phone):
+        return self.read(self.CUSTOMER_HISTORY, (phone,)).fetchall()
+
+    def insert_bill(self, conn, bill_no, ts, phone, user, lines):
+        """Header plus all lines in one executemany. lines: cart rows
+        (code, name, category, price, qty, net total, discount); bills
+        journaled before pricing have no discount. Returns the bill key."""
+        lines = [tuple(line[:6]) + ((line[6] if len(line) > 6 else 0.0),) for line in lines]
+        cur = conn.execute(self.INSERT_BILL, (bill_no, ts, phone, user, round(sum(line[5] for line in lines), 2),
+                                              round(sum(line[6] for line in lines), 2)))
+        bill_key = cur.lastrowid
+        conn.executemany(self.INSERT_LINES, [
+            (bill_key, line_no, code, cat, qty, total, discount)
+            for line_no, (code, name, cat, price, qty, total, discount) in enumerate(lines, 1)
+        ])
+        return bill_key
+
+
+class PriceRuleRepo(Repo):
+    LIST = "SELECT id, product_code, category, min_qty, discount_percent FROM price_rules ORDER BY category, product_code, min_qty"
+    INSERT = "INSERT INTO price_rules (product_code, category, min_qty, discount_percent) VALUES (?,?,?,?)"
+    DELETE = "DELETE FROM price_rules WHERE id=?"
+    BOOK_ROWS = "SELECT product_code, category, price, discount_percent FROM inventory"
+    BOOK_ROW = "SELECT product_code, category, price, discount_percent FROM inventory WHERE product_code=?"
+
+    _book = None
+
+    @property
+    def book(self):
+        """In-memory price book for the billing cart, built on first use."""
+        if self._book is None:
+            self._book = PriceBook(self.read(self.BOOK_ROWS).fetchall(), self.list())
+        return self._book
+
+    def refresh_products(self, codes):
+        if self._book is None:
+            return
+        for code in codes:
+            row = self.read(self.BOOK_ROW, (code,)).fetchone()
+            if row is None:
+                self._book.remove_product(code)
+            else:
+                self._book.upsert_product(*row)
+
+    def reload(self):
+        """Re-reads the whole price book (another process changed prices or rules)."""
+        if self._book is not None:
+            self._book.reload(self.read(self.BOOK_ROWS).fetchall(), self.list())
+
+    def list(self):
+        return self.read(self.LIST).fetchall()
+
+    def add(self, product_code, category, min_qty, percent):
+        """One rule; leave product_code and category empty for a whole-bill slab."""
+        rule_id = self.write(self.INSERT, (product_code or None, category or None, min_qty, percent)).lastrowid
+        if self._book is not None:
+            self._book.set_rules(self.list())
+        self.db.changes.publish("price_rules", [rule_id])
+        return rule_id
+
+    def delete(self, rule_id):
+        self.write(self.DELETE, (rule_id,))
+        if self._book is not None:
+            self._book.set_rules(self.list())
+        self.db.changes.publish("price_rules", [rule_id], DELETE)
+
+
+class SequenceRepo(Repo):
+    ENSURE = "INSERT OR IGNORE INTO bill_sequences (scope, next_no) VALUES (?, 1)"
+    NEXT = "SELECT next_no FROM bill_sequences WHERE scope=?"
+    ADVANCE = "UPDATE bill_sequences SET next_no=next_no+? WHERE scope=?"
+    ADD_BLOCK = "INSERT INTO bill_blocks (scope, first_no, last_no, terminal, allocated_at) VALUES (?,?,?,?,?)"
+    TRIM_BLOCK = "UPDATE bill_blocks SET last_no=? WHERE scope=? AND first_no=?"
+    DROP_BLOCK = "DELETE FROM bill_blocks WHERE scope=? AND first_no=?"
+    # Hands an untouched tail back, unless another terminal claimed a block after it
+    REWIND = "UPDATE bill_sequences SET next_no=? WHERE scope=? AND next_no=?"
+    BLOCKS = "SELECT scope, first_no, last_no FROM bill_blocks ORDER BY scope, first_no"
+    # A range on the unique bill_no index, not LIKE: '_' and '%' in a prefix are not wildcards here
+    ISSUED = "SELECT bill_no FROM {schema}bills WHERE bill_no >= ? AND bill_no < ?"
+
+    def claim(self, scope, size, terminal, ts, conn=None):
+        """Reserves the next `size` numbers of a series; returns (first, last).
+
+        With `conn` (a write-queue job) it runs inside that transaction.
+        """
+        if conn is not None:
+            return self._claim(conn, scope, size, terminal, ts)
+        conn = self.db.conn
+        try:
+            # IMMEDIATE: two terminals claiming at once must not read the same next_no
+            conn.execute("BEGIN IMMEDIATE")
+            block = self._claim(conn, scope, size, terminal, ts)
+            self.db.changes.before_commit()
+            conn.commit()
+            self.db.changes.committed()
+        except Exception:
+            conn.rollback()
+            raise
+        return block
+
+    def _claim(self, conn, scope, size, terminal, ts):
+        conn.execute(self.ENSURE, (scope,))
+        first = conn.execute(self.NEXT, (scope,)).fetchone()[0]
+        conn.execute(self.ADVANCE, (size, scope))
+        conn.execute(self.ADD_BLOCK, (scope, first, first + size - 1, terminal, ts))
+        return first, first + size - 1
+
+    def trim(self, scope, first, last, used_last):
+        """Returns a block's unissued tail to the series when nothing was claimed after it.
+
+        Otherwise the block keeps its full range, so the skipped numbers are
+        reported as gaps instead of silently vanishing from the series.
+        """
+        conn = self.db.conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute(self.REWIND, (used_last + 1, scope, last + 1)).rowcount:
+                if used_last < first:
+                    conn.execute(self.DROP_BLOCK, (scope, first))
+                else:
+                    conn.execute(self.TRIM_BLOCK, (used_last, scope, first))
+            self.db.changes.before_commit()
+            conn.commit()
+            self.db.changes.committed()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def blocks(self):
+        return self.read(self.BLOCKS).fetchall()
+
+    def issued(self, scope):
+        """Bill numbers already used in a series, archived seasons included."""
+        # Every number starting "scope-" sorts from "scope-" up to "scope." ('.' follows '-')
+        params = (f"{scope}-", f"{scope}.")
+        conn = self.db.reader()
+        issued = [row[0] for row in conn.execute(self.ISSUED.format(schema=""), params)]
+        years = self.db.archive.years()
+        for i in range(0, len(years), MAX_ATTACHED):
+            for name in self.db.archive.attach(conn, years[i:i + MAX_ATTACHED]):
+                issued.extend(row[0] for row in conn.execute(self.ISSUED.format(schema=f"{name}."), params))
+        return issued
+
+
+class CustomerRepo(Repo):
+    GET = "SELECT name, address FROM customers WHERE phone=?"
+    LIST = "SELECT phone, name, address FROM customers ORDER BY name ASC"
+    PAGE = "SELECT phone, name, address, {sort} AS _sort, phone AS _key FROM customers"
+    SORTS = ("phone", "name", "address")
+    ROWS = "SELECT phone, name, address, NULL AS _sort, phone AS _key FROM customers WHERE phone IN ({marks})"
+    ALL = "SELECT phone, name, address FROM customers"
+    UPSERT = """
+        INSERT INTO customers (phone, name, address)
+        VALUES (?, ?, ?)
+        ON CONFLICT(phone)
+        DO UPDATE SET name=excluded.name, address=excluded.address
+    """
+    DELETE = "DELETE FROM customers WHERE phone=?"
+    PHONES = "SELECT phone FROM customers"
+
+    _index = None
+
+    @property
+    def index(self):
+        """Phone-prefix index for billing, built on first use and kept current by the writes below."""
+        if self._index is None:
+            self._index = CustomerIndex([row[0] for row in self.read(self.PHONES)], self.get)
+        return self._index
+
+    def refresh_index(self, phones):
+        """Re-reads customers into the index after a write made elsewhere (e.g. a checkout)."""
+        if self._index is not None:
+            for phone in phones:
+                if self.get(phone) is None:
+                    self._index.remove(phone)
+                else:
+                    self._index.upsert(phone)
+        self.db.changes.publish("customers", list(phones))
+
+    def reload(self, changes):
+        """Change-bus subscriber: another process changed customers, so the index is rebuilt."""
+        if any(change.op == RELOAD for change in changes):
+            self._index = None
+
+    def rows(self, phones):
+        """page()-shaped rows for these phones, for updating a table in place."""
+        phones = list(phones)
+        return self.read(self.ROWS.format(marks=",".join("?" * len(phones))), phones).fetchall() if phones else []
+
+    def get(self, phone):
+        return self.read(self.GET, (phone,)).fetchone()
+
+    def list(self):
+        return self.read(self.LIST).fetchall()
+
+    def page(self, sort=1, desc=False, after=None, limit=200):
+        """One keyset page of the customer list, sorted on column number `sort`."""
+        sql, params = keyset_page(self.PAGE.format(sort=self.SORTS[sort]), ["_key"], desc, after, limit)
+        return self.read(sql, params).fetchall()
+
+    def all(self):
+        return self.read(self.ALL).fetchall()
+
+    def upsert(self, phone, name, address, conn=None):
+        """Saves one customer; pass `conn` to run inside a writer-thread job
+        (the caller then refreshes the index once the job has committed)."""
+        if conn is not None:
+            conn.execute(self.UPSERT, (phone, name, address))
+        else:
+            self.write(self.UPSERT, (phone, name, address))
+            self.refresh_index([phone])
+
+    def delete(self, phone):
+        self.write(self.DELETE, (phone,))
+        if self._index is not None:
+            self._index.remove(phone)
+        self.db.changes.publish("customers", [phone], DELETE)
+
+
+class ParkedBillRepo(Repo):
+    PARK = """
+        INSERT INTO parked_bills (ts, parked_by, customer_phone, customer_name, customer_address, cart)
+        VALUES (?,?,?,?,?,?)
+    """
+    LIST = "SELECT id, ts, parked_by, customer_phone, customer_name, cart FROM parked_bills ORDER BY id"
+    GET = "SELECT customer_phone, customer_name, customer_address, cart FROM parked_bills WHERE id=?"
+    DELETE = "DELETE FROM parked_bills WHERE id=?"
+
+    def park(self, ts, user, customer, cart_json):
+        """Stores a suspended bill; returns its parking number."""
+        parked_id = self.write(self.PARK, (ts, user, *customer, cart_json)).lastrowid
+        self.db.changes.publish("parked_bills", [parked_id])
+        return parked_id
+
+    def list(self):
+        return self.read(self.LIST).fetchall()
+
+    def take(self, parked_id):
+        """Removes a parked bill and returns (phone, name, address, cart_json), or None."""
+        row = self.read(self.GET, (parked_id,)).fetchone()
+        # Only the caller whose delete succeeds gets the bill back
+        if row is None or self.write(self.DELETE, (parked_id,)).rowcount != 1:
+            return None
+        self.db.changes.publish("parked_bills", [parked_id], DELETE)
+        return row
+
+
+class CategoryRepo(Repo):
+    NAMES = "SELECT name FROM categories"
+    LIST = "SELECT cat_code, name, description FROM categories"
+    UPSERT = """
+        INSERT INTO categories (cat_code, name, description) VALUES (?, ?, ?)
+        ON CONFLICT(cat_code) DO UPDATE SET name=excluded.name, description=excluded.description
+    """
+    # CSV imports only rename existing categories, keeping their description
+    UPSERT_IMPORT = "INSERT INTO categories (cat_code, name, description) VALUES (?,?,?) ON CONFLICT(cat_code) DO UPDATE SET name=excluded.name"
+    DELETE = "DELETE FROM categories WHERE cat_code=?"
+    IMPORT_ROWS = "SELECT cat_code, name, description FROM categories WHERE cat_code IN ({marks})"
+
+    def names(self):
+        return [row[0] for row in self.read(self.NAMES)]
+
+    def list(self):
+        return self.read(self.LIST).fetchall()
+
+    def upsert(self, code, name, description):
+        self.write(self.UPSERT, (code, name, description))
+        self.db.changes.publish("categories", [code])
+
+    def bulk_import(self, rows, conn=None):
+        """rows: (cat_code, name, description); with `conn` the caller commits and publishes."""
+        if conn is not None:
+            conn.executemany(self.UPSERT_IMPORT, rows)
+            return
+        self.write_many(self.UPSERT_IMPORT, rows)
+        self.db.changes.publish("categories", [row[0] for row in rows])
+
+    def import_rows(self, codes):
+        """Current (cat_code, name, description) of these codes, for import diffs."""
+        marks = ",".join("?" * len(codes))
+        return self.read(self.IMPORT_ROWS.format(marks=marks), list(codes)).fetchall()
+
+    def delete(self, code):
+        self.write(self.DELETE, (code,))
+        self.db.changes.publish("categories", [code], DELETE)
+
+
+class UserRepo(Repo):
+    ROLE = "SELECT role FROM users WHERE username=? AND password=?"
+    LIST = "SELECT username, role FROM users"
+    PAGE = "SELECT username, role, {sort} AS _sort, id AS _key FROM users"
+    SORTS = ("username", "role")
+    UPSERT = """
+        INSERT INTO users (username, password, role)
+        VALUES (?, ?, ?)
+        ON CONFLICT(username)
+        DO UPDATE SET password=excluded.password, role=excluded.role
+    """
+    DELETE = "DELETE FROM users WHERE username=?"
+
+    def authenticate(self, username, password):
+        """Returns the user's role, or None for bad credentials."""
+        row = self.read(self.ROLE, (username, password)).fetchone()
+        return row[0] if row else None
+
+    def list(self):
+        return self.read(self.LIST).fetchall()
+
+    def page(self, sort=0, desc=False, after=None, limit=200):
+        """One keyset page of the user list, sorted on column number `sort`."""
+        sql, params = keyset_page(self.PAGE.format(sort=self.SORTS[sort]), ["_key"], desc, after, limit)
+        return self.read(sql, params).fetchall()
+
+    def upsert(self, username, password, role):
+        self.write(self.UPSERT, (username, password, role))
+        self.db.changes.publish("users", [username])
+
+    def delete(self, username):
+        self.write(self.DELETE, (username,))
+        self.db.changes.publish("users", [username], DELETE)
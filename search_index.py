@@ -0,0 +1,176 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+
+def fold(text):
+    """Case and whitespace folding used for both indexed text and queries."""
+    return " ".join(str(text or "").lower().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductSearchIndex:
+    """In-memory prefix/trigram index over product names and codes.
+
+    Rows are (product_code, name, category, price, stock). The index is built
+    once from inventory and then kept current with upsert/remove/set_stock,
+    so search-as-you-type never touches the database.
+
+    Results come in tiers, each in name order, and the search stops as soon
+    as `limit` rows are found: exact code, code prefix, name prefix, word
+    prefix (all bisect ranges over sorted keys), then substring matches
+    (trigram posting-list intersection) and finally fuzzy matches sharing at
+    least half the query's trigrams, which absorbs a typo or two.
+    """
+
+    def __init__(self, rows=()):
+        self._lock = threading.RLock()
+        self.load(rows)
+
+    def load(self, rows):
+        with self._lock:
+            self._rows = {}
+            self._keys = {}
+            self._code_keys = {}
+            self._codes = []
+            self._names = []
+            self._words = []
+            self._grams = defaultdict(set)
+            for row in rows:
+                self._add(tuple(row), bulk=True)
+            self._codes.sort()
+            self._names.sort()
+            self._words.sort()
+
+    def __len__(self):
+        return len(self._rows)
+
+    # --- Maintenance ---
+
+    def upsert(self, row):
+        row = tuple(row)
+        with self._lock:
+            if row[0] in self._rows:
+                self._remove(row[0])
+            self._add(row)
+
+    def remove(self, code):
+        with self._lock:
+            if code in self._rows:
+                self._remove(code)
+
+    def set_stock(self, code, stock):
+        with self._lock:
+            row = self._rows.get(code)
+            if row is not None:
+                self._rows[code] = row[:4] + (stock,)
+
+    def _entries(self, code, name_key, code_key):
+        words = {(w, name_key, code) for w in name_key.split()[1:]}
+        return (code_key, code), (name_key, code), words
+
+    def _add(self, row, bulk=False):
+        code = row[0]
+        name_key, code_key = fold(row[1]), fold(code)
+        self._rows[code] = row
+        self._keys[code] = (name_key, code_key)
+        self._code_keys[code_key] = code
+        code_entry, name_entry, words = self._entries(code, name_key, code_key)
+        if bulk:
+            self._codes.append(code_entry)
+            self._names.append(name_entry)
+            self._words.extend(words)
+        else:
+            insort(self._codes, code_entry)
+            insort(self._names, name_entry)
+            for entry in words:
+                insort(self._words, entry)
+        for gram in trigrams(f" {name_key} ") | trigrams(f" {code_key} "):
+            self._grams[gram].add(code)
+
+    def _remove(self, code):
+        name_key, code_key = self._keys.pop(code)
+        del self._rows[code]
+        if self._code_keys.get(code_key) == code:
+            del self._code_keys[code_key]
+        code_entry, name_entry, words = self._entries(code, name_key, code_key)
+        for sorted_list, entry in [(self._codes, code_entry), (self._names, name_entry)] + [(self._words, w) for w in words]:
+            i = bisect_left(sorted_list, entry)
+            if i < len(sorted_list) and sorted_list[i] == entry:
+                del sorted_list[i]
+        for gram in trigrams(f" {name_key} ") | trigrams(f" {code_key} "):
+            postings = self._grams.get(gram)
+            if postings is not None:
+                postings.discard(code)
+                if not postings:
+                    del self._grams[gram]
+
+    # --- Lookup ---
+
+    def get(self, code):
+        """Exact product_code lookup (hash), case/whitespace-insensitive fallback."""
+        row = self._rows.get(code)
+        if row is None and code:
+            row = self._rows.get(self._code_keys.get(fold(code)))
+        return row
+
+    def search(self, text, category=None, limit=50):
+        """Ranked rows matching `text`, optionally within one category."""
+        q = fold(text)
+        results, seen = [], set()
+
+        def wanted(code):
+            return code not in seen and (not category or self._rows[code][2] == category)
+
+        def take(code):
+            if wanted(code):
+                seen.add(code)
+                results.append(self._rows[code])
+            return len(results) >= limit
+
+        def take_prefix(sorted_list):
+            i = bisect_left(sorted_list, (q,))
+            while i < len(sorted_list) and sorted_list[i][0].startswith(q):
+                if take(sorted_list[i][-1]):
+                    return True
+                i += 1
+            return False
+
+        with self._lock:
+            if not q:
+                for _, code in self._names:
+                    if take(code):
+                        break
+                return results
+            if q in self._code_keys and take(self._code_keys[q]):
+                return results
+            if take_prefix(self._codes) or take_prefix(self._names) or take_prefix(self._words):
+                return results
+            if len(q) < 3:
+                return results
+
+            # Substring: every query trigram must be present
+            q_grams = trigrams(q)
+            postings = [self._grams.get(g, set()) for g in q_grams]
+            keys = self._keys
+            # Filter before ranking so the top N are all in the category
+            matches = [c for c in set.intersection(*postings)
+                       if wanted(c) and (q in keys[c][0] or q in keys[c][1])]
+            for code in heapq.nsmallest(limit - len(results), matches, key=lambda c: keys[c][0]):
+                if take(code):
+                    return results
+
+            # Fuzzy: typos break some trigrams, so rank by how many survive
+            counts = Counter()
+            for posting in postings:
+                counts.update(posting)
+            needed = max(1, (len(q_grams) + 1) // 2)
+            fuzzy = [c for c, n in counts.items() if n >= needed and wanted(c)]
+            for code in heapq.nsmallest(limit - len(results), fuzzy, key=lambda c: (-counts[c], keys[c][0])):
+                if take(code):
+                    break
+        return results
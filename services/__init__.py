@@ -0,0 +1,8 @@
+"""Business logic with no Tk dependency, shared by the screens, scripts and load tests.
+
+    from database import db
+    from services import BillingService
+    BillingService(db).create_bill([("SKY001", 2)], user="admin")
+"""
+from services.billing import BillingService, save_bill
+from services.inventory import InventoryService
@@ -0,0 +1,201 @@
+"""Billing without a screen: search, cart, customers, parking and checkout.
+
+BillingService is what the billing terminal calls; scripts and load tests
+can drive it directly with nothing but a Database (and, in multi-counter
+mode, a terminals.CounterClient).
+"""
+import logging
+import time
+
+from cart import Cart
+from repositories import InsufficientStock
+
+WALK_IN = ("", "", "")
+
+
+class BillingService:
+    """Billing operations on one cart at a time.
+
+    Products come from this process's search index, or from the stock
+    daemon when `counter` is set; in that mode every cart change is also
+    reserved against the other counters. Carts are cart.Cart objects owned
+    by the caller; new_cart() prices them from the price book, so each line
+    carries its discount and net amount. Customers are (phone, name,
+    address) tuples.
+    """
+
+    def __init__(self, db, counter=None):
+        self.db = db
+        self.counter = counter
+
+    # --- Products ---
+
+    def search_products(self, query, category=None, limit=50):
+        """(code, name, category, price, stock) rows matching `query`, best first."""
+        if self.counter:
+            return self.counter.search(query, category, limit)
+        return self.db.products.index.search(query, category, limit)
+
+    def lookup(self, code):
+        """One product row by code (scanner input is matched loosely), or None."""
+        return self.counter.get(code) if self.counter else self.db.products.index.get(code)
+
+    def hold(self, code, qty):
+        """Reserves qty units (the line's new total) against the other counters."""
+        if not self.counter:
+            return True
+        try:
+            return self.counter.reserve(code, qty)
+        except Exception as e:
+            logging.error(f"STOCK DAEMON UNAVAILABLE: {e}")
+            return False
+
+    def release(self):
+        """Gives back everything this counter holds (the cart was parked or emptied)."""
+        if not self.counter:
+            return
+        try:
+            self.counter.release()
+        except Exception as e:
+            logging.error(f"STOCK DAEMON UNAVAILABLE: {e}")
+
+    def sync(self, cart):
+        """Re-reserves a whole cart; returns the (code, name, wanted, available) lines that did not fit."""
+        return self.counter.sync(cart.lines()) if self.counter else []
+
+    # --- Cart ---
+
+    def add_item(self, cart, code, qty=1):
+        """Adds qty of a product to the cart and returns its line.
+
+        Raises ValueError for a quantity below 1, KeyError for an unknown
+        code and InsufficientStock when the shelf (less other counters'
+        carts) cannot cover the line's new total.
+        """
+        qty = int(qty)
+        if qty <= 0:
+            raise ValueError("Enter a valid quantity")
+        row = self.lookup(code)
+        if row is None:
+            raise KeyError(code)
+        p_code, p_name, p_cat, p_price, p_stock = row
+        wanted = cart.qty(p_code) + qty
+        if wanted > p_stock or not self.hold(p_code, wanted):
+            raise InsufficientStock([(p_code, p_name, wanted, p_stock)])
+        return cart.add(p_code, p_name, p_cat, p_price, qty)
+
+    def remove_item(self, cart, code):
+        cart.remove(code)
+        self.hold(code, 0)
+
+    def new_cart(self, lines=()):
+        """An empty (or restored) cart priced from the shared price book."""
+        return Cart(lines, self.db.price_rules.book)
+
+    def build_cart(self, lines):
+        """A Cart from (code, qty) pairs, checked like add_item."""
+        cart = self.new_cart()
+        for code, qty in lines:
+            self.add_item(cart, code, qty)
+        return cart
+
+    # --- Customers ---
+
+    def suggest_customers(self, text, limit=8):
+        """(phone, name, address) of customers whose number starts with `text`."""
+        return self.db.customers.index.suggest(text, limit)
+
+    def find_customer(self, text):
+        """(phone, name, address) for a full phone number, or None."""
+        return self.db.customers.index.find(text)
+
+    # --- Parked bills ---
+
+    def parked(self):
+        """(id, ts, user, phone, name, cart_json) of the suspended bills."""
+        return self.db.parked.list()
+
+    def park(self, cart, customer, user):
+        """Suspends a cart; returns its parking number."""
+        pid = self.db.parked.park(int(time.time()), user, tuple(customer), cart.to_json())
+        logging.info(f"BILL PARKED: #{pid} with {len(cart)} lines by {user}")
+        self.release()
+        return pid
+
+    def resume(self, parked_id):
+        """Takes a parked bill back: (customer, cart), or None if someone already did."""
+        row = self.db.parked.take(parked_id)
+        if row is None:
+            return None
+        phone, name, addr, cart_json = row
+        # Priced again: rules or prices may have changed while it was parked
+        return (phone, name, addr), Cart.from_json(cart_json, self.db.price_rules.book)
+
+    # --- Checkout ---
+
+    def submit_bill(self, cart, customer, user):
+        """Journals the bill and queues its commit; returns (bill_no, Future).
+
+        The Future raises InsufficientStock if the bill was rejected; pass
+        the outcome to bill_saved() or bill_rejected().
+        """
+        if cart.stale():
+            cart.reprice()
+        bill_no = self.db.bill_numbers.next()
+        future = self.db.journal.submit(bill_no, int(time.time()), user, tuple(customer), cart.lines())
+        return bill_no, future
+
+    def bill_saved(self, bill_no, cart, customer):
+        """After a commit: refreshes the caches it touched and queues the receipt."""
+        self.db.products.refresh_index(cart.codes())
+        if customer[0]:
+            self.db.customers.refresh_index([customer[0]])
+        self.db.changes.publish("bills", [bill_no])
+        try:
+            self.db.receipts.render(bill_no)
+        except Exception as e:
+            logging.error(f"RECEIPT NOT QUEUED for {bill_no}: {e}")
+
+    def bill_rejected(self, bill_no, error):
+        """After InsufficientStock: nothing was saved, so the number is reused."""
+        logging.warning(f"CHECKOUT REJECTED {bill_no}: {error}")
+        self.db.bill_numbers.give_back(bill_no)
+        self.db.products.refresh_index([line[0] for line in error.lines])
+
+    def create_bill(self, lines, customer=WALK_IN, user=None, timeout=None):
+        """Bills a Cart or (code, qty) pairs and waits for the commit; returns the bill number.
+
+        Raises InsufficientStock if stock ran out meanwhile (nothing is
+        saved). Any other error leaves the bill in the journal, which keeps
+        posting it.
+        """
+        cart = lines if isinstance(lines, Cart) else self.build_cart(lines)
+        if not cart:
+            raise ValueError("Cannot bill an empty cart")
+        bill_no, future = self.submit_bill(cart, customer, user)
+        try:
+            future.result(timeout)
+        except InsufficientStock as e:
+            self.bill_rejected(bill_no, e)
+            raise
+        self.bill_saved(bill_no, cart, customer)
+        return bill_no
+
+
+def save_bill(conn, db, bill_id, ts, user, customer, lines):
+    """Writes one whole bill. Runs on the writer thread inside its transaction.
+
+    Idempotent by bill number: a bill that is already saved (a journal
+    replay after a commit that did land) is left as it is.
+    """
+    existing = db.sales.bill_key(bill_id, conn)
+    if existing is not None:
+        return existing
+    phone, name, addr = customer
+    # 1. Update/Save Customer CRM
+    if phone and name:
+        db.customers.upsert(phone, name, addr, conn=conn)
+    # 2. Update Stock for every line in one batch
+    db.products.apply_sale(conn, [(line[0], line[4]) for line in lines], ref=bill_id)
+    # 3. Bill header and lines with customer and user info
+    return db.sales.insert_bill(conn, bill_id, ts, phone, user, lines)
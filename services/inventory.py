@@ -0,0 +1,131 @@
+"""Inventory without a screen: product search, edits, stock adjustments and CSV."""
+import csv
+import logging
+import time
+from datetime import datetime, timedelta
+
+from csv_import import CategoryImport, ProductImport
+
+# Moves the inventory screen and scripts may book; sales and imports book their own
+MANUAL_MOVES = ("receipt", "adjustment", "return")
+
+CSV_HEADER = ["product_code", "name", "category", "price", "stock", "discount_percent", "sold_qty"]
+
+
+class InventoryService:
+    """Product maintenance used by the inventory screen and by scripts."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def search_products(self, text=""):
+        """Full inventory rows (code, name, category, price, stock, disc %, sold) matching `text`."""
+        return self.db.products.list(text)
+
+    def product_page(self, text="", sort=1, desc=False, after=None, limit=100):
+        """One page of search_products(text) for a VirtualTable, sorted on column `sort`."""
+        return self.db.products.page(text, sort, desc, after, limit)
+
+    def product_rows(self, codes):
+        """product_page()-shaped rows of these codes, to redraw changed rows."""
+        return self.db.products.rows(codes)
+
+    def categories(self):
+        return self.db.categories.names()
+
+    def save_product(self, code, name, category, price, stock, discount=0):
+        """Creates or updates a product; returns its (upper-cased) code.
+
+        Numbers may be given as text, as typed into the form; ValueError is
+        raised for unparseable numbers or missing code/category.
+        """
+        code = str(code).strip().upper()
+        price, stock, discount = float(price), int(stock), float(discount or 0)
+        if not code or not category:
+            raise ValueError("Missing required fields")
+        self.db.products.upsert(code, name, category, price, stock, discount)
+        return code
+
+    def adjust_stock(self, code, delta, reason="", kind="adjustment"):
+        """Adds delta units (negative to write off) to a product; returns the new stock.
+
+        `kind` is how the stock ledger books it: "receipt" (goods in),
+        "return" (a customer brought items back) or "adjustment". Raises
+        KeyError for an unknown code and ValueError for another kind or if
+        the stock would go below zero.
+        """
+        if kind not in MANUAL_MOVES:
+            raise ValueError(f"Stock moves entered by hand are {', '.join(MANUAL_MOVES)}")
+        new_stock = self.db.products.adjust_stock(code, int(delta), kind, reason or None)
+        logging.info(f"STOCK ADJUSTED: {code} {int(delta):+d} ({kind}) -> {new_stock} {reason}".rstrip())
+        return new_stock
+
+    # --- Stock ledger ---
+
+    def stock_history(self, code, limit=200):
+        """(id, time, kind, qty, ref) of a product's stock moves, newest first."""
+        return self.db.stock.history(code, limit)
+
+    def stock_on(self, day):
+        """{code: stock} at the end of a local 'YYYY-MM-DD' day."""
+        end = datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)
+        return self.db.stock.as_of(int(time.mktime(end.timetuple())) - 1)
+
+    def reconcile_stock(self):
+        """(code, name, stock column, ledger total) of products whose stock disagrees with the ledger."""
+        return self.db.stock.reconcile()
+
+    def snapshot_stock(self):
+        """Snapshots the ledger now (on the writer thread); returns the snapshot id or None."""
+        return self.db.writes.submit(self.db.stock.snapshot).result()
+
+    # --- Price rules (see pricing.PriceBook) ---
+
+    def price_rules(self):
+        """(id, product_code, category, min_qty, discount_percent) rows."""
+        return self.db.price_rules.list()
+
+    def add_price_rule(self, product_code="", category="", min_qty=1, percent=0):
+        """Adds a discount rule for a product, a category, or (both empty) the whole bill.
+
+        Numbers may be given as text; ValueError for bad input.
+        """
+        product_code = str(product_code or "").strip().upper()
+        min_qty, percent = int(min_qty or 1), float(percent)
+        if product_code and category:
+            raise ValueError("A rule is for a product or a category, not both")
+        if min_qty < 1 or not 0 <= percent <= 100:
+            raise ValueError("Min qty must be 1 or more and discount 0-100%")
+        if product_code and self.db.products.get_by_code(product_code) is None:
+            raise ValueError(f"Unknown product {product_code}")
+        rule_id = self.db.price_rules.add(product_code, category, min_qty, percent)
+        logging.info(f"PRICE RULE ADDED: #{rule_id} {product_code or category or 'bill'} {min_qty}+ @ {percent}%")
+        return rule_id
+
+    def delete_price_rule(self, rule_id):
+        self.db.price_rules.delete(rule_id)
+        logging.info(f"PRICE RULE DELETED: #{rule_id}")
+
+    # --- CSV (see csv_import) ---
+
+    def product_import(self, path, dry_run=False, mapping=None, progress=None):
+        """A csv_import.ProductImport of `path`: run() it here or start() it on a worker thread."""
+        return ProductImport(self.db, path, dry_run=dry_run, mapping=mapping, progress=progress)
+
+    def category_import(self, path, dry_run=False, mapping=None, progress=None):
+        return CategoryImport(self.db, path, dry_run=dry_run, mapping=mapping, progress=progress)
+
+    def import_csv(self, path, dry_run=False):
+        """Imports an inventory CSV (stock is added); returns a csv_import.ImportResult."""
+        return self.product_import(path, dry_run).run()
+
+    def export_csv(self, path):
+        """Writes the whole inventory to a CSV; returns the number of rows (0 writes nothing)."""
+        rows = self.db.products.all()
+        if not rows:
+            return 0
+        with open(path, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(rows)
+        return len(rows)
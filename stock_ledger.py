@@ -0,0 +1,41 @@
+import logging
+import threading
+import time
+
+
+class SnapshotScheduler:
+    """Background thread: snapshots the stock ledger once `every_moves`
+    moves have piled up, or daily if anything moved, so stock history
+    queries never replay more than that."""
+
+    def __init__(self, db, interval=600, every_moves=5000, max_age=86400):
+        self.db = db
+        self.interval = interval
+        self.every_moves = every_moves
+        self.max_age = max_age
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stock-snapshot", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def due(self):
+        moves, ts = self.db.stock.moves_since_snapshot()
+        return moves >= self.every_moves or (moves > 0 and (ts is None or time.time() - ts >= self.max_age))
+
+    def _run(self):
+        while True:
+            try:
+                if self.due():
+                    snapshot_id = self.db.writes.submit(self.db.stock.snapshot).result()
+                    logging.info(f"STOCK SNAPSHOT: #{snapshot_id} taken")
+            except Exception as e:
+                logging.error(f"STOCK SNAPSHOT FAILED: {e}")
+            if self._stop.wait(self.interval):
+                return
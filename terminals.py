@@ -0,0 +1,329 @@
+"""Multi-counter billing: one stock daemon owns the database, counters talk to it.
+
+Run `python terminals.py` on the machine that holds cracker_shop.db, then
+start each counter with CRACKERSHOP_SERVER=127.0.0.1:8765 (and optionally
+CRACKERSHOP_COUNTER=<name>). Counters send search, reservation and checkout
+requests as one JSON object per line over a local socket; every checkout is
+committed by the daemon's single writer thread, so concurrent counters share
+group commits instead of queueing for SQLite's write lock.
+
+Items sitting in an open cart are reserved for a short TTL that the counter
+keeps renewing, so the stock every counter sees is what is really left.
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from repositories import InsufficientStock
+from services.billing import save_bill
+
+DEFAULT_ADDRESS = ("127.0.0.1", 8765)
+RESERVATION_TTL = 90
+
+
+def parse_address(text):
+    host, _, port = (text or "").rpartition(":")
+    return (host or DEFAULT_ADDRESS[0], int(port or DEFAULT_ADDRESS[1]))
+
+
+class Reservations:
+    """Quantities held by each counter's open cart, expiring after `ttl` seconds."""
+
+    def __init__(self, ttl=RESERVATION_TTL):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self._by_code = {}
+        self._by_terminal = {}
+        self._expires = {}
+
+    def reserved(self, code, exclude=None):
+        """Units of a product held by other counters' live carts."""
+        now = time.monotonic()
+        with self.lock:
+            return sum(qty for terminal, qty in self._by_code.get(code, {}).items()
+                       if terminal != exclude and self._expires.get(terminal, 0) > now)
+
+    def set(self, terminal, code, qty):
+        with self.lock:
+            held = self._by_terminal.setdefault(terminal, {})
+            if qty > 0:
+                held[code] = qty
+                self._by_code.setdefault(code, {})[terminal] = qty
+            else:
+                held.pop(code, None)
+                self._drop(code, terminal)
+            self.touch(terminal)
+
+    def hold(self, terminal, lines):
+        """Replaces everything a counter holds with `lines` ({code: qty})."""
+        with self.lock:
+            self.release(terminal)
+            for code, qty in lines.items():
+                self.set(terminal, code, qty)
+            self.touch(terminal)
+
+    def touch(self, terminal):
+        with self.lock:
+            self._expires[terminal] = time.monotonic() + self.ttl
+
+    def release(self, terminal, codes=None):
+        with self.lock:
+            held = self._by_terminal.get(terminal, {})
+            for code in list(held if codes is None else codes):
+                held.pop(code, None)
+                self._drop(code, terminal)
+            if not held:
+                self._by_terminal.pop(terminal, None)
+                self._expires.pop(terminal, None)
+
+    def expire(self):
+        """Drops carts whose counter stopped renewing them (crashed or unplugged)."""
+        now = time.monotonic()
+        with self.lock:
+            for terminal in [t for t, expires in self._expires.items() if expires <= now]:
+                logging.warning(f"COUNTER {terminal}: reservations expired")
+                self.release(terminal)
+
+    def _drop(self, code, terminal):
+        holders = self._by_code.get(code)
+        if holders is not None:
+            holders.pop(terminal, None)
+            if not holders:
+                del self._by_code[code]
+
+
+class StockServer(socketserver.ThreadingTCPServer):
+    """The stock daemon: the one process that writes the shop database."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, db, address=DEFAULT_ADDRESS, ttl=RESERVATION_TTL):
+        self.db = db
+        self.reservations = Reservations(ttl)
+        super().__init__(address, CounterHandler)
+
+    # --- Operations (one per request "op") ---
+
+    def available(self, terminal, row):
+        """A product row with stock reduced by what other counters hold."""
+        return row[:4] + (row[4] - self.reservations.reserved(row[0], exclude=terminal),)
+
+    def op_search(self, terminal, text, category=None, limit=50):
+        rows = self.db.products.index.search(text, category, limit)
+        # Stock comes from the database; another process may have edited inventory
+        return [self.available(terminal, self.db.products.get_by_code(row[0]) or row) for row in rows]
+
+    def op_get(self, terminal, code):
+        row = self.db.products.get_by_code(code)
+        if row is None:
+            # Scanned with different case/spacing: resolve the code through the index
+            match = self.db.products.index.get(code)
+            row = match and self.db.products.get_by_code(match[0])
+        return self.available(terminal, row) if row else None
+
+    def op_reserve(self, terminal, code, qty):
+        """Holds `qty` units (the cart's new total) if they are free; returns the units free."""
+        with self.reservations.lock:
+            row = self.db.products.get_by_code(code)
+            free = self.available(terminal, row)[4] if row else 0
+            if qty > free:
+                return {"reserved": False, "available": free}
+            self.reservations.set(terminal, code, qty)
+            return {"reserved": True, "available": free}
+
+    def op_hold(self, terminal, lines):
+        """Re-asserts a whole cart ({code: qty}); returns the lines that no longer fit."""
+        with self.reservations.lock:
+            self.reservations.release(terminal)
+            short = self.shortfalls(terminal, lines.items())
+            # Short lines hold only what is free, never more than the shelf has
+            free = {code: available for code, name, wanted, available in short}
+            self.reservations.hold(terminal, {code: min(qty, free.get(code, qty)) for code, qty in lines.items()})
+            return short
+
+    def op_release(self, terminal):
+        self.reservations.release(terminal)
+
+    def op_checkout(self, terminal, bill_no, ts, user, customer, lines):
+        existing = self.db.sales.bill_key(bill_no)
+        if existing is not None:
+            # A counter replaying its journal: the bill is already in
+            return existing
+        with self.reservations.lock:
+            short = self.shortfalls(terminal, [(line[0], line[4]) for line in lines])
+        if short:
+            raise InsufficientStock(short)
+        codes = [line[0] for line in lines]
+        bill_key = self.db.writes.submit(save_bill, self.db, bill_no, ts, user, tuple(customer),
+                                         [tuple(line) for line in lines]).result()
+        self.reservations.release(terminal, codes)
+        self.db.products.refresh_index(codes)
+        logging.info(f"COUNTER {terminal}: bill {bill_no} committed ({len(lines)} lines)")
+        return bill_key
+
+    def shortfalls(self, terminal, lines):
+        short = []
+        for code, qty in lines:
+            row = self.db.products.get_by_code(code)
+            free = self.available(terminal, row)[4] if row else 0
+            if qty > free:
+                short.append((code, row[1] if row else code, qty, free))
+        return short
+
+
+class CounterHandler(socketserver.StreamRequestHandler):
+    """One connected counter thread: JSON request per line, JSON reply per line."""
+
+    def handle(self):
+        server = self.server
+        for raw in self.rfile:
+            server.reservations.expire()
+            try:
+                request = json.loads(raw)
+                op = getattr(server, f"op_{request['op']}")
+                reply = {"ok": True, "result": op(request["terminal"], **request.get("args", {}))}
+            except InsufficientStock as e:
+                reply = {"ok": False, "error": str(e), "short": e.lines}
+            except sqlite3.OperationalError as e:
+                # Database locked or busy: the counter's journal retries these
+                reply = {"ok": False, "error": str(e), "retry": True}
+            except Exception as e:
+                logging.error(f"COUNTER REQUEST FAILED: {e}")
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+    def finish(self):
+        # Each connection has its own thread; its reader connection would outlive it
+        try:
+            super().finish()
+        finally:
+            self.server.db.manager.close_reader()
+
+
+class CounterClient:
+    """A billing counter's link to the stock daemon.
+
+    Each calling thread gets its own socket, so a checkout waiting on its
+    commit never holds up search-as-you-type. A heartbeat thread renews this
+    counter's reservations well inside their TTL.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, terminal=None, ttl=RESERVATION_TTL):
+        self.address = address
+        self.terminal = terminal or f"{socket.gethostname()}-{os.getpid()}"
+        self.held = {}
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="counter-checkout")
+        self._stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(ttl / 3,), name="counter-heartbeat", daemon=True).start()
+
+    def call(self, op, **args):
+        request = json.dumps({"op": op, "terminal": self.terminal, "args": args}).encode("utf-8") + b"\n"
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            try:
+                if conn is None:
+                    sock = socket.create_connection(self.address, timeout=30)
+                    conn = self._local.conn = (sock, sock.makefile("rb"))
+                conn[0].sendall(request)
+                line = conn[1].readline()
+                if not line:
+                    raise ConnectionError("stock daemon closed the connection")
+                break
+            except OSError:
+                # Daemon restarted: reconnect once, then give up
+                self._local.conn = None
+                if attempt:
+                    raise
+        reply = json.loads(line)
+        if reply["ok"]:
+            return reply["result"]
+        if "short" in reply:
+            raise InsufficientStock([tuple(line) for line in reply["short"]])
+        if reply.get("retry"):
+            raise sqlite3.OperationalError(reply["error"])
+        raise RuntimeError(reply["error"])
+
+    def search(self, text, category=None, limit=50):
+        return [tuple(row) for row in self.call("search", text=text, category=category, limit=limit)]
+
+    def get(self, code):
+        row = self.call("get", code=code)
+        return tuple(row) if row else None
+
+    def reserve(self, code, qty):
+        """Holds qty units for this cart; False when other counters got there first."""
+        result = self.call("reserve", code=code, qty=qty)
+        if result["reserved"]:
+            if qty > 0:
+                self.held[code] = qty
+            else:
+                self.held.pop(code, None)
+        return result["reserved"]
+
+    def sync(self, lines):
+        """Holds exactly the cart's lines; returns (code, name, wanted, available) that did not fit."""
+        self.held = {line[0]: line[4] for line in lines}
+        return [tuple(line) for line in self.call("hold", lines=self.held)]
+
+    def release(self):
+        self.held = {}
+        self.call("release")
+
+    def checkout(self, bill_no, ts, user, customer, lines):
+        """Commits a bill through the daemon; returns a Future like WriteQueue.submit."""
+        return self._executor.submit(self._checkout, bill_no, ts, user, customer, lines)
+
+    def _checkout(self, bill_no, ts, user, customer, lines):
+        bill_key = self.call("checkout", bill_no=bill_no, ts=ts, user=user, customer=list(customer),
+                             lines=[list(line) for line in lines])
+        for line in lines:
+            self.held.pop(line[0], None)
+        return bill_key
+
+    def close(self):
+        self._stop.set()
+
+    def _heartbeat(self, interval):
+        while not self._stop.wait(interval):
+            if self.held:
+                try:
+                    self.call("hold", lines=dict(self.held))
+                except Exception as e:
+                    logging.warning(f"COUNTER HEARTBEAT FAILED: {e}")
+
+
+def connect_from_env():
+    """A CounterClient when CRACKERSHOP_SERVER is set, else None (single-counter mode)."""
+    address = os.environ.get("CRACKERSHOP_SERVER")
+    if not address:
+        return None
+    return CounterClient(parse_address(address), os.environ.get("CRACKERSHOP_COUNTER"))
+
+
+def serve(address=DEFAULT_ADDRESS):
+    from database import db
+    server = StockServer(db, address)
+    # Counters edit inventory in their own processes; the daemon's search index must follow
+    db.changes.start()
+    logging.info(f"STOCK DAEMON listening on {address[0]}:{address[1]}")
+    print(f"Stock daemon listening on {address[0]}:{address[1]} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.changes.stop()
+        db.writes.close()
+
+
+if __name__ == "__main__":
+    serve(parse_address(os.environ.get("CRACKERSHOP_SERVER")))
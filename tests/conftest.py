@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app writes its database, logs, journal and exports to the cwd, from the
+# moment `database` is imported (test modules import it while being collected)
+os.chdir(tempfile.mkdtemp(prefix="crackershop-tests-"))
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A freshly migrated database of its own for one test."""
+    from database import Database
+    database = Database(str(tmp_path / "shop.db"))
+    database.journal.path = str(tmp_path / "journal" / os.path.basename(database.journal.path))
+    database.journal.rejected_path = str(tmp_path / "journal" / os.path.basename(database.journal.rejected_path))
+    yield database
+    database.bill_numbers.close()
+    database.journal.close()
+    database.writes.close()
+    database.manager.close()
+
+
+def add_product(db, code, stock, price=10.0, category="General"):
+    db.products.upsert(code, f"Item {code}", category, price, stock, 0)
+    db.products.refresh_index([code])
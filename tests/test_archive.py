@@ -0,0 +1,72 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import archive
+from conftest import add_product
+from database import day_range
+from services.billing import save_bill
+
+
+def bill(db, bill_no, ts, code="SKY001", qty=1):
+    lines = [(code, f"Item {code}", "General", 10.0, qty, 10.0 * qty, 0.0)]
+    return db.writes.submit(save_bill, db, bill_no, ts, "admin", ("", "", ""), lines).result()
+
+
+def test_archived_and_live_bills_keep_apart(db, tmp_path):
+    db.archive.directory = str(tmp_path / "archive")
+    add_product(db, "SKY001", 100)
+    last_year = datetime.now().year - 1
+    old_ts = int(time.mktime(datetime(last_year, 11, 1, 10).timetuple()))
+    old_keys = [bill(db, f"OLD-{n}", old_ts + n) for n in range(3)]
+    assert db.archive.archive_closed_seasons() == {last_year: (3, 3)}
+
+    # A new bill must not take an id an archived bill already has
+    new_key = bill(db, "NEW-1", int(time.time()))
+    assert new_key > max(old_keys)
+
+    ts_range = day_range(f"{last_year}-01-01", datetime.now().strftime("%Y-%m-%d"))
+    rows = db.sales.report_page(ts_range=ts_range, limit=50)
+    assert sorted(row[0] for row in rows) == ["NEW-1", "OLD-0", "OLD-1", "OLD-2"]
+    assert len({tuple(row[-3:]) for row in rows}) == 4
+
+
+def test_report_refuses_more_seasons_than_it_can_attach(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "MAX_ATTACHED", 1)
+    db.archive.directory = str(tmp_path / "archive")
+    add_product(db, "SKY001", 100)
+    year = datetime.now().year
+    for back in (1, 2):
+        bill(db, f"OLD-{back}", int(time.mktime(datetime(year - back, 6, 1).timetuple())))
+    db.archive.archive_closed_seasons()
+    ts_range = day_range(f"{year - 2}-01-01", f"{year}-12-31")
+    with pytest.raises(ValueError):
+        db.sales.report_page(ts_range=ts_range)
+    with pytest.raises(ValueError):
+        db.sales.report_summary(ts_range=ts_range)
+    assert len(db.sales.report_page(ts_range=day_range(f"{year - 1}-01-01", f"{year}-12-31"))) == 1
+
+
+def test_report_pages_keep_lines_of_colliding_ids(db, tmp_path):
+    # Bills archived before bill ids were AUTOINCREMENT can share an id with a live one
+    db.archive.directory = str(tmp_path / "archive")
+    add_product(db, "SKY001", 100)
+    last_year = datetime.now().year - 1
+    old_key = bill(db, "OLD-1", int(time.mktime(datetime(last_year, 6, 1).timetuple())))
+    db.archive.archive_closed_seasons()
+    db.writes.submit(lambda conn: conn.execute(
+        "INSERT INTO bills (id, bill_no, ts) VALUES (?, 'NEW-1', ?)", (old_key, int(time.time())))).result()
+    db.writes.submit(lambda conn: conn.execute(
+        "INSERT INTO bill_lines (bill_id, line_no, product_code, quantity, total) VALUES (?, 1, 'SKY001', 1, 10)",
+        (old_key,))).result()
+
+    ts_range = day_range(f"{last_year}-01-01", datetime.now().strftime("%Y-%m-%d"))
+    seen, after = [], None
+    while True:
+        rows = db.sales.report_page(ts_range=ts_range, after=after, limit=1)
+        if not rows:
+            break
+        seen.extend(row[0] for row in rows)
+        after = tuple(rows[-1][6:])
+    assert seen == ["NEW-1", "OLD-1"]
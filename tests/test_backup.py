@@ -0,0 +1,66 @@
+import os
+import shutil
+import sqlite3
+
+from backup import BackupManager
+from conftest import add_product
+from services import BillingService
+
+
+def codes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT product_code FROM inventory"))
+    finally:
+        conn.close()
+
+
+def test_full_and_differential_backups_restore(db, tmp_path):
+    add_product(db, "SKY001", 50)
+    backups = BackupManager(db, directory=str(tmp_path / "backups"))
+    full = backups.snapshot()
+    assert backups.verify(full)
+
+    add_product(db, "ROC001", 20)
+    bill_no = BillingService(db).create_bill([("SKY001", 2)], user="admin")
+    diff = backups.differential()
+    assert diff.endswith(".dbdiff") and backups.verify(diff)
+    assert os.path.getsize(diff) < os.path.getsize(full)
+
+    restored = backups.restore(diff, str(tmp_path / "restored.db"))
+    assert codes(restored) == ["ROC001", "SKY001"]
+    conn = sqlite3.connect(restored)
+    assert conn.execute("SELECT stock FROM inventory WHERE product_code='SKY001'").fetchone()[0] == 48
+    assert conn.execute("SELECT COUNT(*) FROM bills WHERE bill_no=?", (bill_no,)).fetchone()[0] == 1
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    conn.close()
+    assert codes(backups.restore(full, str(tmp_path / "full.db"))) == ["SKY001"]
+
+
+def test_damaged_snapshot_fails_verification(db, tmp_path):
+    add_product(db, "SKY001", 50)
+    backups = BackupManager(db, directory=str(tmp_path / "backups"))
+    damaged = str(tmp_path / "damaged.db")
+    shutil.copyfile(backups.snapshot(), damaged)
+    conn = sqlite3.connect(damaged)
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    root = conn.execute("SELECT rootpage FROM sqlite_master WHERE name='inventory'").fetchone()[0]
+    conn.close()
+    # Scribble over the inventory table's page
+    with open(damaged, "r+b") as f:
+        f.seek((root - 1) * page_size)
+        f.write(b"\xff" * 64)
+    assert not backups.verify(damaged)
+
+
+def test_rotation_drops_old_fulls_and_their_differentials(db, tmp_path):
+    add_product(db, "SKY001", 50)
+    backups = BackupManager(db, directory=str(tmp_path / "backups"), keep_full=1)
+    old_full = backups.snapshot()
+    add_product(db, "ROC001", 20)
+    old_diff = backups.differential()
+    new_full = backups.snapshot()
+    new_diff = backups.differential()
+    backups.rotate()
+    assert sorted(os.listdir(backups.directory)) == sorted(os.path.basename(p) for p in (new_full, new_diff))
+    assert not os.path.exists(old_full) and not os.path.exists(old_diff)
@@ -0,0 +1,72 @@
+import json
+import os
+import time
+
+from bill_journal import BillJournal
+from conftest import add_product
+
+
+def line(code, qty, price=10.0):
+    return [code, f"Item {code}", "General", price, qty, price * qty, 0.0]
+
+
+def wait_for(check, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.05)
+    return check()
+
+
+def test_short_bill_does_not_block_later_bills(db, tmp_path):
+    add_product(db, "SKY001", 5)
+    add_product(db, "ROC001", 5)
+    journal = BillJournal(db, "T1", directory=str(tmp_path / "journal"))
+    os.makedirs(os.path.dirname(journal.path))
+    # Two bills left over from a crash; the first one wants more than the shelf has
+    with open(journal.path, "w", encoding="utf-8") as f:
+        for bill_no, lines in (("T1-000001", [line("SKY001", 9)]), ("T1-000002", [line("ROC001", 2)])):
+            f.write(json.dumps({"bill": bill_no, "ts": int(time.time()), "user": "admin",
+                                "customer": ["", "", ""], "lines": lines}) + "\n")
+    journal.start()
+    try:
+        assert wait_for(lambda: not journal.pending())
+    finally:
+        journal.close()
+
+    assert db.sales.bill_key("T1-000002") is not None
+    assert db.sales.bill_key("T1-000001") is None
+    assert [r["bill"] for r in journal.rejected()] == ["T1-000001"]
+    assert "Insufficient stock" in journal.rejected()[0]["error"]
+    assert db.products.get_by_code("SKY001")[4] == 5
+    assert db.products.get_by_code("ROC001")[4] == 3
+
+    # The rejected bill stays out of the journal on the next start
+    again = BillJournal(db, "T1", directory=str(tmp_path / "journal"))
+    again._open()
+    assert again.pending() == []
+    again.close()
+
+
+def test_locked_database_is_retried(db, tmp_path):
+    add_product(db, "SKY001", 5)
+    journal = BillJournal(db, "T2", directory=str(tmp_path / "journal"))
+    # Give up on the lock quickly instead of the app's 5 seconds
+    db.writes.submit(lambda conn: conn.execute("PRAGMA busy_timeout=100")).result()
+    blocker = db.manager.connect()
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        future = journal.submit("T2-000001", int(time.time()), "admin", ("", "", ""), [line("SKY001", 1)])
+        assert future.exception(timeout=10) is not None
+        assert journal.pending() == ["T2-000001"]
+    finally:
+        blocker.rollback()
+        blocker.close()
+    journal.start()
+    try:
+        assert wait_for(lambda: not journal.pending())
+    finally:
+        journal.close()
+    assert db.sales.bill_key("T2-000001") is not None
+    assert journal.rejected() == []
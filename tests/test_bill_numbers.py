@@ -0,0 +1,77 @@
+import sqlite3
+import time
+from datetime import datetime
+
+from bill_numbers import BillNumberAllocator
+from conftest import add_product
+from services.billing import save_bill
+
+
+def test_numbers_come_from_memory_while_the_database_is_locked(db):
+    numbers = BillNumberAllocator(db, prefix="T", block_size=10).start()
+    numbers._claiming.result(timeout=5)
+    # A backup or archive holding the write lock
+    blocker = db.manager.connect()
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.monotonic()
+        # Stops short of the low-water mark, so nothing goes to the writer
+        issued = [numbers.next() for _ in range(8)]
+        assert time.monotonic() - start < 1
+        assert numbers._claiming is None
+    finally:
+        blocker.rollback()
+        blocker.close()
+    assert issued == [f"T-{n:06d}" for n in range(1, 9)]
+    numbers.close()
+
+
+def test_failed_claim_ahead_is_claimed_again(db, monkeypatch):
+    numbers = BillNumberAllocator(db, prefix="T", block_size=10).start()
+    numbers._claiming.result(timeout=5)
+    claim = db.sequences.claim
+    calls = []
+
+    def locked_once(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return claim(*args, **kwargs)
+
+    monkeypatch.setattr(db.sequences, "claim", locked_once)
+    issued = [numbers.next() for _ in range(11)]
+    # The claim made ahead at T-000009 failed; T-000011 came from a fresh claim
+    assert len(calls) == 2
+    assert issued == [f"T-{n:06d}" for n in range(1, 12)]
+    assert db.sequences.blocks() == [("T", 1, 10), ("T", 11, 20)]
+    numbers.close()
+
+
+def test_close_gives_back_the_block_claimed_ahead(db):
+    numbers = BillNumberAllocator(db, prefix="T", block_size=10).start()
+    for _ in range(9):
+        numbers.next()
+    numbers._claiming.result(timeout=5)
+    assert numbers.gaps() == [f"T-{n:06d}" for n in range(1, 10)]
+    numbers.close()
+    assert db.reader().execute("SELECT next_no FROM bill_sequences WHERE scope='T'").fetchone()[0] == 10
+    assert db.sequences.blocks() == [("T", 1, 9)]
+
+
+def test_gaps_count_archived_bills_as_issued(db, tmp_path):
+    db.archive.directory = str(tmp_path / "archive")
+    add_product(db, "SKY001", 100)
+    numbers = BillNumberAllocator(db, prefix="T_1", block_size=3).start()
+    other = BillNumberAllocator(db, prefix="TX1", block_size=3).start()
+    old_ts = int(time.mktime(datetime(datetime.now().year - 1, 6, 1).timetuple()))
+    lines = [("SKY001", "Item SKY001", "General", 10.0, 1, 10.0, 0.0)]
+    for n in range(3):
+        db.writes.submit(save_bill, db, numbers.next(), old_ts + n, "admin", ("", "", ""), lines).result()
+        # '_' in the prefix must not match this series
+        db.writes.submit(save_bill, db, other.next(), old_ts + n, "admin", ("", "", ""), lines).result()
+    numbers.close()
+    other.close()
+    assert numbers.gaps() == other.gaps() == []
+    db.archive.archive_closed_seasons()
+    assert numbers.gaps() == other.gaps() == []
+    assert sorted(db.sequences.issued("T_1")) == ["T_1-000001", "T_1-000002", "T_1-000003"]
@@ -0,0 +1,39 @@
+import sqlite3
+
+from change_bus import RELOAD
+from conftest import add_product
+
+
+def external_product(db, code):
+    # Another process: a counter editing inventory, or a script
+    conn = sqlite3.connect(db.manager.path)
+    conn.execute("INSERT INTO inventory (product_code, name, category, price, stock, discount_percent) "
+                 "VALUES (?, ?, 'General', 10, 5, 0)", (code, f"Item {code}"))
+    conn.commit()
+    conn.close()
+
+
+def test_commit_by_another_process_next_to_a_local_one_is_reported(db):
+    add_product(db, "SKY001", 10)
+    assert db.products.index.search("ZZZ001") == []
+    db.changes.interval = 3600
+    db.changes.start()
+    seen = []
+    db.changes.subscribe(None, seen.extend)
+
+    external_product(db, "ZZZ001")
+    # A local commit in the same polling interval must not hide it
+    add_product(db, "SKY002", 10)
+    seen.clear()
+    db.changes.publish_external()
+    assert {change.table for change in seen if change.op == RELOAD} >= {"inventory", "bills"}
+    # The search index (the stock daemon's too) is rebuilt with the new product
+    assert [row[0] for row in db.products.index.search("ZZZ001")] == ["ZZZ001"]
+
+    # Local commits alone are not taken for another process's
+    add_product(db, "SKY003", 10)
+    seen.clear()
+    db.changes._check()
+    db.changes.publish_external()
+    assert seen == []
+    db.changes.stop()
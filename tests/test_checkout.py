@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import add_product
+from repositories import InsufficientStock
+from services import BillingService
+from services.billing import save_bill
+
+
+def stock(db, code):
+    return db.products.get_by_code(code)[4]
+
+
+def test_oversold_bill_names_the_short_lines_and_saves_nothing(db):
+    for code, qty in (("SKY001", 5), ("ROC001", 2), ("FLW001", 10), ("BOM001", 3)):
+        add_product(db, code, qty)
+    service = BillingService(db)
+    cart = service.build_cart([("SKY001", 3), ("ROC001", 2), ("FLW001", 1), ("BOM001", 3)])
+    # Another counter sells first: two of the four lines no longer fit
+    db.products.adjust_stock("ROC001", -1, kind="sale")
+    db.products.adjust_stock("BOM001", -3, kind="sale")
+    moves = db.reader().execute("SELECT COUNT(*) FROM stock_moves").fetchone()[0]
+
+    with pytest.raises(InsufficientStock) as raised:
+        db.writes.submit(save_bill, db, "T-000001", 1760000000, "admin",
+                         ("9840000000", "Murugan", "Sivakasi"), cart.lines()).result()
+    assert raised.value.lines == [("ROC001", "Item ROC001", 2, 1), ("BOM001", "Item BOM001", 3, 0)]
+
+    # Rolled back as a whole: stock, ledger, bill and customer untouched
+    assert [stock(db, code) for code in ("SKY001", "ROC001", "FLW001", "BOM001")] == [5, 1, 10, 0]
+    assert db.reader().execute("SELECT COUNT(*) FROM stock_moves").fetchone()[0] == moves
+    assert db.sales.bill_key("T-000001") is None
+    assert db.customers.get("9840000000") is None
+
+
+def test_rejected_checkout_gives_its_bill_number_back(db):
+    add_product(db, "SKY001", 5)
+    service = BillingService(db)
+    cart = service.build_cart([("SKY001", 5)])
+    db.products.adjust_stock("SKY001", -1, kind="sale")
+    with pytest.raises(InsufficientStock) as raised:
+        service.create_bill(cart, user="admin")
+    assert raised.value.lines == [("SKY001", "Item SKY001", 5, 4)]
+    bill_no = service.create_bill([("SKY001", 4)], user="admin")
+    assert bill_no == db.bill_numbers.format(db.bill_numbers.scope(), 1)
+    assert stock(db, "SKY001") == 0
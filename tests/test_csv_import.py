@@ -0,0 +1,37 @@
+import csv
+
+from conftest import add_product
+from csv_import import ProductImport
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["code", "name", "price", "qty"])
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_dry_run_carries_keys_across_chunks(db, tmp_path):
+    add_product(db, "OLD", 5)
+    path = write_csv(tmp_path / "stock.csv", [
+        ("NEW", "Rocket", 10, 4), ("OLD", "Item OLD", 10, 1),
+        ("NEW", "Rocket", 10, 6), ("OLD", "Item OLD", 10, 2),
+    ])
+    dry = ProductImport(db, path, dry_run=True, chunk_size=2, directory=str(tmp_path)).run()
+    assert (dry.added, dry.updated) == (1, 3)
+    assert ("changed", "NEW", "stock", 4, 10) in dry.changes
+    assert ("changed", "OLD", "stock", 6, 8) in dry.changes
+
+    real = ProductImport(db, path, chunk_size=2, directory=str(tmp_path)).run()
+    assert (real.added, real.updated) == (dry.added, dry.updated)
+    assert db.products.get_by_code("NEW")[4] == 10
+    assert db.products.get_by_code("OLD")[4] == 8
+
+
+def test_reports_from_back_to_back_imports_get_their_own_files(db, tmp_path):
+    path = write_csv(tmp_path / "bad.csv", [("X1", "Rocket", "free", 1)])
+    first = ProductImport(db, path, dry_run=True, directory=str(tmp_path)).run()
+    second = ProductImport(db, path, dry_run=True, directory=str(tmp_path)).run()
+    assert first.errors == second.errors == 1
+    assert first.error_file != second.error_file
@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def modules_after(code):
+    out = subprocess.run([sys.executable, "-c", code + "\nimport sys; print(' '.join(sorted(sys.modules)))"],
+                         cwd=os.getcwd(), env=dict(os.environ, PYTHONPATH=ROOT),
+                         capture_output=True, text=True, check=True)
+    return set(out.stdout.split())
+
+
+def test_spawned_workers_do_not_start_the_app():
+    # What a spawned receipt worker does: re-run main.py as __mp_main__, then import receipts
+    loaded = modules_after(f"import runpy; runpy.run_path({os.path.join(ROOT, 'main.py')!r}, run_name='__mp_main__')\n"
+                           "import receipts")
+    assert "receipts" in loaded
+    assert not {"database", "app", "terminals", "backup"} & loaded
@@ -0,0 +1,69 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import migrations
+
+
+def legacy_db(path):
+    """A database as the flat-table builds left it: no user_version, sales as one row per line."""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE inventory (
+            product_code TEXT PRIMARY KEY, name TEXT, category TEXT, price REAL,
+            stock INTEGER, discount_percent REAL DEFAULT 0, sold_qty INTEGER DEFAULT 0
+        )""")
+    conn.execute("""
+        CREATE TABLE sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, bill_id TEXT, item_name TEXT, category TEXT,
+            quantity INTEGER, total REAL, discount_amount REAL DEFAULT 0, date TEXT
+        )""")
+    conn.execute("INSERT INTO inventory VALUES ('SKY001', 'Sky Shot', 'General', 50.0, 10, 0, 2)")
+    conn.executemany(
+        "INSERT INTO sales (bill_id, item_name, category, quantity, total, discount_amount, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [("B-1", "Sky Shot", "General", 2, 100.0, 0.0, "2024-10-28 18:30:00"),
+         ("B-1", "Flower Pot", "Ground", 1, 40.0, 5.0, "2024-10-28 18:30:00"),
+         ("B-2", "Sky Shot", "General", 1, 50.0, 0.0, "2024-10-29 09:00:00"),
+         (None, "Sparkler", None, 3, 30.0, 0.0, "2024-10-30 12:00:00")])
+    conn.commit()
+    return conn
+
+
+def test_flat_sales_become_bills_and_lines(tmp_path):
+    conn = legacy_db(str(tmp_path / "old.db"))
+    assert migrations.migrate(conn) == migrations.latest_version()
+    assert migrations.current_version(conn) == migrations.latest_version()
+
+    bills = conn.execute("SELECT bill_no, ts, payment_mode, total, discount_amount FROM bills ORDER BY id").fetchall()
+    local_ts = int(time.mktime(datetime(2024, 10, 28, 18, 30).timetuple()))
+    assert bills[0] == ("B-1", local_ts, "Cash", 140.0, 5.0)
+    assert [b[0] for b in bills[1:]] == ["B-2", "LEGACY-4"]
+
+    lines = conn.execute("""
+        SELECT b.bill_no, l.line_no, l.product_code, c.name, l.quantity, l.total
+        FROM bill_lines l JOIN bills b ON b.id = l.bill_id LEFT JOIN categories c ON c.id = l.category_id
+        ORDER BY b.id, l.line_no""").fetchall()
+    # Known products are matched by name; unknown ones keep their name as the code
+    assert lines == [("B-1", 1, "SKY001", "General", 2, 100.0),
+                     ("B-1", 2, "Flower Pot", "Ground", 1, 40.0),
+                     ("B-2", 1, "SKY001", "General", 1, 50.0),
+                     ("LEGACY-4", 1, "Sparkler", None, 3, 30.0)]
+    conn.close()
+
+
+def test_sales_view_reads_like_the_old_table(tmp_path):
+    conn = legacy_db(str(tmp_path / "old.db"))
+    migrations.migrate(conn)
+
+    rows = conn.execute("""
+        SELECT bill_id, item_name, category, quantity, total, discount_amount, date
+        FROM sales ORDER BY bill_id, item_name""").fetchall()
+    assert rows == [("B-1", "Flower Pot", "Ground", 1, 40.0, 5.0, "2024-10-28 18:30:00"),
+                    ("B-1", "Sky Shot", "General", 2, 100.0, 0.0, "2024-10-28 18:30:00"),
+                    ("B-2", "Sky Shot", "General", 1, 50.0, 0.0, "2024-10-29 09:00:00"),
+                    ("LEGACY-4", "Sparkler", None, 3, 30.0, 0.0, "2024-10-30 12:00:00")]
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'sales'").fetchone() == ("view",)
+
+    # Running again is a no-op
+    assert migrations.migrate(conn) == 0
+    conn.close()
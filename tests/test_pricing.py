@@ -0,0 +1,62 @@
+from cart import Cart
+from pricing import PriceBook
+from services import BillingService
+
+PRODUCTS = [
+    # code, category, price, item discount %
+    ("SKY001", "Sky Shots", 10.0, 0.0),
+    ("ROC001", "Rockets", 20.0, 0.0),
+    ("ROC002", "Rockets", 50.0, 12.0),
+    ("FLW001", "Flower Pots", 5.0, 0.0),
+]
+RULES = [
+    # id, product_code, category, min_qty, percent
+    (1, "SKY001", None, 10, 10.0),
+    (2, None, "Rockets", 5, 5.0),
+    (3, None, "Rockets", 20, 15.0),
+    # A bigger slab set lower by mistake must not pay less than a smaller one
+    (4, None, "Rockets", 30, 8.0),
+    (5, None, None, 50, 3.0),
+]
+
+
+def test_line_gets_the_best_discount_it_qualifies_for():
+    book = PriceBook(PRODUCTS, RULES)
+    # SKY001 below its slab; 4 + 2 rockets reach the 5-item category slab
+    priced = book.price([("SKY001", "Sky Shots", 10.0, 9), ("ROC001", "Rockets", 20.0, 4),
+                         ("ROC002", "Rockets", 50.0, 2)])
+    assert priced == [(10.0, 90.0, 0.0), (20.0, 76.0, 4.0), (50.0, 88.0, 12.0)]
+    # Product slab reached; rockets at 30 keep the 15% slab; 52 items reach the bill slab
+    priced = book.price([("SKY001", "Sky Shots", 10.0, 10), ("ROC001", "Rockets", 20.0, 30),
+                         ("FLW001", "Flower Pots", 5.0, 12)])
+    assert priced == [(10.0, 90.0, 10.0), (20.0, 510.0, 90.0), (5.0, 58.2, 1.8)]
+
+
+def test_cart_reprices_other_lines_and_notices_a_new_book():
+    book = PriceBook(PRODUCTS, RULES)
+    cart = Cart(book=book)
+    cart.add("ROC001", "Rocket", "Rockets", 20.0, 4)
+    assert cart.get("ROC001")[5:] == [80.0, 0.0]
+    cart.add("ROC002", "Big Rocket", "Rockets", 50.0, 1)
+    # The fifth rocket takes the first one's line into the slab too
+    assert cart.changed == {"ROC001", "ROC002"}
+    assert cart.get("ROC001")[5:] == [76.0, 4.0]
+    assert (cart.total, cart.discount) == (120.0, 10.0)
+    book.upsert_product("ROC001", "Rockets", 25.0, 0.0)
+    assert cart.stale()
+    cart.reprice()
+    assert cart.get("ROC001")[3:] == [25.0, 4, 95.0, 5.0]
+
+
+def test_bill_stores_each_line_discount_and_net(db):
+    db.products.upsert("ROC001", "Rocket", "Rockets", 20.0, 100, 0)
+    db.products.upsert("ROC002", "Big Rocket", "Rockets", 50.0, 100, 12.0)
+    db.products.refresh_index(["ROC001", "ROC002"])
+    db.price_rules.add("", "Rockets", 5, 5.0)
+    bill_no = BillingService(db).create_bill([("ROC001", 4), ("ROC002", 2)], user="admin")
+    conn = db.reader()
+    lines = conn.execute("""
+        SELECT l.product_code, l.quantity, l.total, l.discount_amount FROM bill_lines l
+        JOIN bills b ON b.id = l.bill_id WHERE b.bill_no = ? ORDER BY l.line_no""", (bill_no,)).fetchall()
+    assert lines == [("ROC001", 4, 76.0, 4.0), ("ROC002", 2, 88.0, 12.0)]
+    assert conn.execute("SELECT total, discount_amount FROM bills WHERE bill_no=?", (bill_no,)).fetchone() == (164.0, 16.0)
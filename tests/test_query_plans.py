@@ -0,0 +1,20 @@
+import pytest
+
+from database import HOT_QUERIES, PLAN_ALLOWLIST, check_query_plans
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_indexes(db, name):
+    assert check_query_plans(db.conn, {name: HOT_QUERIES[name]}) == []
+
+
+def test_allowlist_only_names_hot_queries(db):
+    assert {name for name, step in PLAN_ALLOWLIST} <= set(HOT_QUERIES)
+
+
+def test_full_scans_are_caught(db):
+    covering_scan = {"product_names": ("SELECT name FROM inventory ORDER BY name", ())}
+    assert check_query_plans(db.conn, covering_scan) == [
+        ("product_names", "SCAN inventory USING COVERING INDEX idx_inventory_name")]
+    temp_sort = {"by_price": ("SELECT product_code FROM inventory WHERE category = ? ORDER BY price", ("General",))}
+    assert ("by_price", "USE TEMP B-TREE FOR ORDER BY") in check_query_plans(db.conn, temp_sort)
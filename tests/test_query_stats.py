@@ -0,0 +1,40 @@
+from conftest import add_product
+from database import normalize_sql, query_stats
+from repositories import CategoryRepo, SalesRepo
+from services import BillingService
+
+
+def callers(statement_start):
+    return {row["caller"] for row in query_stats.snapshot() if row["statement"].startswith(statement_start)}
+
+
+def test_statements_are_attributed_past_the_repositories(db):
+    add_product(db, "SKY001", 10)
+    query_stats.reset()
+    db.sales.customer_history("9999999999")
+    assert callers("SELECT bill_no, total, ts FROM bills") == {"test_query_stats.test_statements_are_attributed_past_the_repositories"}
+
+    BillingService(db).create_bill([("SKY001", 1)], user="admin")
+    # The bill is written by the service's job on the writer thread
+    assert callers("INSERT INTO bills") == {"services.billing.save_bill"}
+    # The writer's own transaction control has no caller outside the plumbing
+    assert callers("BEGIN IMMEDIATE") == {"write_queue._commit_batch"}
+
+
+def test_statements_read_by_iteration_are_recorded(db):
+    db.categories.upsert("ROC", "Rockets", "")
+    query_stats.reset()
+    names = db.categories.names()
+    db.sales.days()
+    rows = {row["statement"]: row for row in query_stats.snapshot()}
+    assert "Rockets" in names
+    assert rows[CategoryRepo.NAMES]["rows"] == len(names)
+    assert rows[CategoryRepo.NAMES]["caller"] == "test_query_stats.test_statements_read_by_iteration_are_recorded"
+    assert normalize_sql(SalesRepo.DAYS) in rows
+
+    # A cursor left part-read is recorded when it is closed
+    query_stats.reset()
+    cursor = db.reader().execute("SELECT 1 UNION ALL SELECT 2")
+    next(cursor)
+    cursor.close()
+    assert [(row["statement"], row["rows"]) for row in query_stats.snapshot()] == [("SELECT ? UNION ALL SELECT ?", 1)]
@@ -0,0 +1,50 @@
+import logging
+import time
+import warnings
+
+import pytest
+from fpdf import FPDF
+
+import receipts
+
+BILL = {
+    "bill_no": "BILL-000001", "ts": int(time.time()), "phone": "9840000000",
+    "customer": "முருகன் ஸ்டோர்ஸ்", "address": "Sivakasi", "user": "admin", "payment": "Cash",
+    "total": 240.0, "discount": 0.0,
+    "lines": [("SKY001", "Sky Shot ₹10 ஸ்கை", 2, 40.0, 0.0), ("RKT001", "रॉकेट Rocket", 4, 200.0, 0.0)],
+}
+
+
+@pytest.fixture
+def template(monkeypatch):
+    monkeypatch.setattr(receipts, "_template", None)
+    monkeypatch.setattr(receipts, "PROFILE_FILE", "missing_profile.json")
+
+
+def test_invoice_with_non_latin_names_and_no_font(template, monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(receipts, "FONT_CANDIDATES", [])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        with caplog.at_level(logging.ERROR):
+            paths = receipts.render_bill(BILL, str(tmp_path))
+    assert (tmp_path / "BILL-000001.pdf").stat().st_size > 0
+    assert len(paths) == 3
+    assert "BILL-000001" in caplog.text
+
+
+def test_invoice_with_a_unicode_font(template, tmp_path, monkeypatch, caplog):
+    font = receipts.find_font(receipts.DEFAULT_PROFILE)
+    if font is None:
+        pytest.skip("no Unicode TTF on this machine")
+    receipts._ensure_template()
+    # The font is parsed once per worker, not once per bill
+    monkeypatch.setattr(FPDF, "add_font", None)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        with caplog.at_level(logging.ERROR):
+            for n in range(2):
+                receipts.invoice_pdf(BILL, str(tmp_path / f"invoice{n}.pdf"))
+    assert (tmp_path / "invoice1.pdf").stat().st_size > 0
+    # A font without Tamil or Devanagari is reported with the bill, not only by fpdf
+    assert ("BILL-000001" in caplog.text) == any(ord(c) not in receipts._template["fonts"]["styles"]["shop"].cmap
+                                                 for c in BILL["customer"])
@@ -0,0 +1,22 @@
+from search_index import ProductSearchIndex
+
+
+def index():
+    rows = [(f"A{i:03}", f"Blue sparkler {i}", "Sparklers", 10, 5) for i in range(60)]
+    rows += [(f"G{i:03}", f"Zeta sparkler {i}", "Gift Boxes", 99, 5) for i in range(3)]
+    return ProductSearchIndex(rows)
+
+
+def test_substring_matches_are_filtered_by_category_before_ranking():
+    rows = index().search("parkle", category="Gift Boxes", limit=5)
+    assert [row[0] for row in rows] == ["G000", "G001", "G002"]
+
+
+def test_fuzzy_matches_are_filtered_by_category_before_ranking():
+    rows = index().search("sparklr", category="Gift Boxes", limit=5)
+    assert [row[0] for row in rows] == ["G000", "G001", "G002"]
+
+
+def test_search_without_category_still_ranks_by_name():
+    rows = index().search("parkle", limit=5)
+    assert [row[0] for row in rows] == ["A000", "A001", "A010", "A011", "A012"]
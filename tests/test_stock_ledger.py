@@ -0,0 +1,62 @@
+import time
+
+from repositories import StockRepo
+
+DAY = 86400
+
+
+def book(db, moves):
+    """Backdated (code, ts, kind, qty) moves applied to inventory, as a checkout or edit would."""
+    def save(conn):
+        for code, ts, kind, qty in moves:
+            conn.execute(StockRepo.MOVE, (code, ts, kind, qty, None))
+            conn.execute(StockRepo.ADD, (qty, code))
+    db.writes.submit(save).result()
+
+
+def test_stock_as_of_snapshots_and_reconcile(db):
+    now = int(time.time())
+    base = now - 10 * DAY
+    for code in ("SKY001", "ROC001"):
+        db.products.upsert(code, f"Item {code}", "General", 10.0, 0, 0)
+    book(db, [("SKY001", base, "receipt", 10), ("ROC001", base + DAY, "receipt", 5),
+              ("SKY001", base + 2 * DAY, "sale", -3), ("SKY001", base + 5 * DAY, "return", 1)])
+
+    assert db.stock.as_of(base - 1) == {}
+    assert db.stock.as_of(base + DAY) == {"SKY001": 10, "ROC001": 5}
+    assert db.stock.as_of(base + 3 * DAY) == {"SKY001": 7, "ROC001": 5}
+    assert db.stock.product_as_of("SKY001", base + 6 * DAY) == 8
+    assert db.stock.reconcile() == []
+
+    snapshot = db.writes.submit(db.stock.snapshot).result()
+    assert snapshot is not None
+    # Nothing moved since: no new snapshot
+    assert db.writes.submit(db.stock.snapshot).result() is None
+    assert sorted(db.reader().execute("SELECT product_code, stock FROM stock_snapshot_lines WHERE snapshot_id=?",
+                                      (snapshot,)).fetchall()) == [("ROC001", 5), ("SKY001", 8)]
+    assert db.stock.moves_since_snapshot()[0] == 0
+
+    # Later moves are added to the snapshot; times before it still come from the moves
+    book(db, [("SKY001", now + 10, "sale", -2)])
+    assert db.stock.moves_since_snapshot()[0] == 1
+    assert db.stock.as_of(now + 60) == {"SKY001": 6, "ROC001": 5}
+    assert db.stock.product_as_of("SKY001", now + 60) == 6
+    assert db.stock.as_of(base + 3 * DAY) == {"SKY001": 7, "ROC001": 5}
+    assert db.stock.reconcile() == []
+
+    # A stock change that bypassed the ledger shows up against the ledger total
+    db.writes.submit(lambda conn: conn.execute("UPDATE inventory SET stock = stock + 4 WHERE product_code = 'ROC001'")).result()
+    assert db.stock.reconcile() == [("ROC001", "Item ROC001", 9, 5)]
+
+
+def test_only_the_latest_snapshots_are_kept(db):
+    db.products.upsert("SKY001", "Item SKY001", "General", 10.0, 0, 0)
+    for n in range(3):
+        db.products.adjust_stock("SKY001", 1, kind="receipt")
+        db.writes.submit(db.stock.snapshot, 2).result()
+    conn = db.reader()
+    assert conn.execute("SELECT COUNT(*) FROM stock_snapshots").fetchone()[0] == 2
+    latest = conn.execute("SELECT MAX(id) FROM stock_snapshots").fetchone()[0]
+    assert conn.execute("SELECT stock FROM stock_snapshot_lines WHERE snapshot_id=?", (latest,)).fetchone()[0] == 3
+    assert conn.execute("SELECT COUNT(*) FROM stock_snapshot_lines WHERE snapshot_id NOT IN "
+                        "(SELECT id FROM stock_snapshots)").fetchone()[0] == 0
@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import ROOT, add_product
+from terminals import CounterClient, StockServer
+
+TTL = 1.5
+
+
+@pytest.fixture
+def daemon(db):
+    add_product(db, "SKY001", 10)
+    server = StockServer(db, ("127.0.0.1", 0), ttl=TTL)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_two_counters_share_the_stock(daemon):
+    a = CounterClient(daemon.server_address, "A", ttl=TTL)
+    b = CounterClient(daemon.server_address, "B", ttl=TTL)
+    try:
+        assert a.reserve("SKY001", 6)
+        # Each counter sees the stock less what the other's cart holds
+        assert b.get("SKY001")[4] == 4
+        assert not b.reserve("SKY001", 5)
+        assert b.reserve("SKY001", 4)
+        assert a.get("SKY001")[4] == 6
+
+        # A's heartbeat keeps its cart alive past the TTL
+        time.sleep(TTL * 2)
+        assert b.get("SKY001")[4] == 4
+        assert daemon.reservations.reserved("SKY001") == 10
+
+        # A goes quiet (crashed): its units come back once the TTL runs out
+        a.close()
+        time.sleep(TTL * 1.5)
+        assert b.get("SKY001")[4] == 10
+        assert daemon.reservations.reserved("SKY001") == 4
+        assert b.reserve("SKY001", 10)
+    finally:
+        a.close()
+        b.close()
+
+
+def test_counter_process_that_dies_gives_its_stock_back(daemon):
+    host, port = daemon.server_address
+    code = ("import os\nfrom terminals import CounterClient\n"
+            f"c = CounterClient(({host!r}, {port}), 'C3', ttl={TTL})\n"
+            "print(c.reserve('SKY001', 7), flush=True)\nos._exit(0)\n")
+    out = subprocess.run([sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=ROOT),
+                         capture_output=True, text=True, timeout=30)
+    assert out.stdout.strip() == "True"
+    local = CounterClient(daemon.server_address, "LOCAL", ttl=TTL)
+    try:
+        assert local.get("SKY001")[4] == 3
+        time.sleep(TTL * 1.5)
+        assert local.get("SKY001")[4] == 10
+    finally:
+        local.close()
+
+
+def test_each_connection_gives_its_reader_back(daemon):
+    readers = daemon.db.manager._readers
+    before = len(readers)
+    for n in range(5):
+        client = CounterClient(daemon.server_address, f"C{n}", ttl=TTL)
+        assert client.get("SKY001")[4] == 10
+        client.close()
+        # The daemon's handler thread ends once the counter hangs up
+        sock, rfile = client._local.conn
+        rfile.close()
+        sock.close()
+    deadline = time.monotonic() + 5
+    while len(readers) > before and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(readers) == before
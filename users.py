@@ -1,8 +1,9 @@
 import customtkinter as ctk
-from tkinter import messagebox, ttk, filedialog
+from tkinter import messagebox, filedialog
 import csv
 import logging
 from datetime import datetime
+from virtual_table import VirtualTable
 
 class UserManagementModule:
     def __init__(self, main_view, db):
@@ -43,14 +44,12 @@ class UserManagementModule:
 
         # --- Table ---
         cols = ("Username", "Role")
-        self.tree = ttk.Treeview(self.main_view, columns=cols, show='headings')
-        for col in cols:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=200, anchor="center")
+        self.table = VirtualTable(self.main_view, self.db, cols, self.db.users.page, width=200)
+        self.tree = self.table.tree
         
         # Selection event for modifying
         self.tree.bind("<<TreeviewSelect>>", self.on_row_select)
-        self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+        self.table.pack(fill="both", expand=True, padx=20, pady=10)
         
         self.refresh_list()
 
@@ -72,14 +71,7 @@ class UserManagementModule:
 
         try:
             # Upsert Logic: If username exists, update password and role
-            self.db.cursor.execute("""
-                INSERT INTO users (username, password, role) 
-                VALUES (?, ?, ?)
-                ON CONFLICT(username) 
-                DO UPDATE SET password=excluded.password, role=excluded.role
-            """, (u, p, r))
-            
-            self.db.conn.commit()
+            self.db.users.upsert(u, p, r)
             logging.info(f"USER UPDATE: {u} assigned as {r}")
             messagebox.showinfo("Success", f"User {u} saved/updated.")
             self.refresh_list()
@@ -97,14 +89,12 @@ class UserManagementModule:
             return
 
         if messagebox.askyesno("Confirm", f"Delete user '{u}'?"):
-            self.db.cursor.execute("DELETE FROM users WHERE username=?", (u,))
-            self.db.conn.commit()
+            self.db.users.delete(u)
             logging.warning(f"USER DELETED: {u}")
             self.refresh_list()
 
     def export_users(self):
-        self.db.cursor.execute("SELECT username, role FROM users")
-        rows = self.db.cursor.fetchall()
+        rows = self.db.users.list()
         
         path = filedialog.asksaveasfilename(
             defaultextension=".csv",
@@ -123,10 +113,7 @@ class UserManagementModule:
             messagebox.showerror("Error", f"Export failed: {e}")
 
     def refresh_list(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        self.db.cursor.execute("SELECT username, role FROM users")
-        for row in self.db.cursor.fetchall():
-            self.tree.insert("", "end", values=row)
+        self.table.load()
 
     def clear_entries(self):
         self.u_name.delete(0, 'end')
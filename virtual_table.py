@@ -0,0 +1,131 @@
+import customtkinter as ctk
+from functools import partial
+from tkinter import ttk
+from query_scheduler import QueryScheduler
+
+
+class VirtualTable:
+    """A Treeview for listings too big to load whole.
+
+    `fetch(*filters, sort=, desc=, after=, limit=)` returns one keyset page
+    (see repositories.keyset_page): the visible columns followed by the
+    sort value and unique key of each row. load() shows the first page and
+    scrolling near the bottom fetches the next one after the last row
+    shown, so opening a screen costs one small query however big the
+    table is. Clicking a heading sorts on that column in the database (a
+    second click reverses it). Queries run through a QueryScheduler, off
+    the UI thread.
+
+    Rows are Treeview items named after their key, so update_rows() can
+    redraw single rows when the change bus reports them; a row keeps its
+    place until the next load() even if its sort value changed.
+    """
+
+    def __init__(self, parent, db, columns, fetch, sort=0, desc=False, page_size=100, width=100, anchor="center"):
+        self.columns = columns
+        self.fetch = fetch
+        self.sort, self.desc = sort, desc
+        self.page_size = page_size
+        self.filters = ()
+        self._keys = {}
+        self.cursor = None
+        self.exhausted = True
+
+        self.frame = ctk.CTkFrame(parent, fg_color="transparent")
+        self.tree = ttk.Treeview(self.frame, columns=columns, show='headings')
+        for i, col in enumerate(columns):
+            self.tree.heading(col, text=col, command=partial(self.sort_by, i))
+            self.tree.column(col, width=width, anchor=anchor)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.search = QueryScheduler(self.tree, db)
+        self.show_sort()
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def load(self, *filters, debounce=False):
+        """Shows the first page for these filters (passed on to fetch)."""
+        self.filters = filters
+        self.search.schedule(self.page, self.show_first, filters, self.sort, self.desc, None,
+                             delay=None if debounce else 0)
+
+    def reload(self):
+        self.load(*self.filters)
+
+    def page(self, filters, sort, desc, after):
+        return self.fetch(*filters, sort=sort, desc=desc, after=after, limit=self.page_size)
+
+    def show_first(self, rows):
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self._keys.clear()
+        self.tree.yview_moveto(0)
+        self.show_more(rows)
+
+    def show_more(self, rows):
+        n = len(self.columns)
+        # The next page starts after the last row's (sort value, key)
+        if rows:
+            self.cursor = tuple(rows[-1][n:])
+        self.exhausted = len(rows) < self.page_size
+        for row in rows:
+            key = tuple(row[n + 1:])
+            iid = self.iid(key)
+            # A row whose sort value changed since the last page can come round again
+            if iid in self._keys:
+                self.tree.item(iid, values=row[:n])
+            else:
+                self._keys[iid] = key
+                self.tree.insert("", "end", iid=iid, values=row[:n])
+
+    # --- Row updates ---
+
+    def iid(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        return "\x1f".join(map(str, key))
+
+    def loaded(self):
+        """Keys of every row loaded so far (plain values for single-column keys)."""
+        return [key[0] if len(key) == 1 else key for key in self._keys.values()]
+
+    def shown(self, keys):
+        """Those of `keys` whose rows are loaded."""
+        return [key for key in keys if self.iid(key) in self._keys]
+
+    def update_rows(self, keys, rows):
+        """Redraws loaded rows from fresh page-shaped `rows`; keys missing from rows are removed."""
+        n = len(self.columns)
+        fresh = {self.iid(tuple(row[n + 1:])): row for row in rows}
+        for key in keys:
+            iid = self.iid(key)
+            if iid not in self._keys:
+                continue
+            row = fresh.get(iid)
+            if row is None:
+                self.tree.delete(iid)
+                del self._keys[iid]
+            else:
+                self.tree.item(iid, values=row[:n])
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # Near the bottom (or the rows do not fill the view yet): fetch the next page
+        if float(last) > 0.9 and not self.exhausted and not self.search.pending():
+            self.search.schedule(self.page, self.show_more, self.filters, self.sort, self.desc, self.cursor, delay=0)
+
+    def sort_by(self, column):
+        if column == self.sort:
+            self.desc = not self.desc
+        else:
+            self.sort, self.desc = column, False
+        self.show_sort()
+        self.reload()
+
+    def show_sort(self):
+        for i, col in enumerate(self.columns):
+            arrow = (" ▼" if self.desc else " ▲") if i == self.sort else ""
+            self.tree.heading(col, text=col + arrow)
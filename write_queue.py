@@ -0,0 +1,114 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Background single-writer thread for whole-bill transactions.
+
+    Jobs are callables taking the writer connection; submit() returns a
+    Future resolved after the job's data is committed. Jobs that arrive
+    within `max_wait` seconds of each other share one transaction (group
+    commit), each inside its own savepoint so one failing bill never takes
+    the others down with it. `before_commit` is called just before every
+    commit, with the write lock held, and `on_commit` just after it.
+    """
+
+    def __init__(self, connect, max_batch=32, max_wait=0.005, on_commit=None, before_commit=None):
+        self._connect = connect
+        self._on_commit = on_commit
+        self._before_commit = before_commit
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def submit(self, job, *args):
+        """Queues job(conn, *args) and returns a Future with its result."""
+        future = Future()
+        self._ensure_started()
+        self._jobs.put((future, job, args))
+        return future
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def close(self, timeout=10):
+        """Commits everything already queued, then stops the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._jobs.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        conn = self._connect()
+        # Group commit amortizes the fsync, so every commit can be a full one
+        conn.execute("PRAGMA synchronous=FULL")
+        stopping = False
+        try:
+            while not stopping:
+                item = self._jobs.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._jobs.get(timeout=remaining) if remaining > 0 else self._jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        batch = [(f, job, args) for f, job, args in batch if f.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for n, (future, job, args) in enumerate(batch):
+                conn.execute(f"SAVEPOINT job{n}")
+                try:
+                    result = job(conn, *args)
+                except Exception as e:
+                    conn.execute(f"ROLLBACK TO job{n}")
+                    conn.execute(f"RELEASE job{n}")
+                    future.set_exception(e)
+                    continue
+                conn.execute(f"RELEASE job{n}")
+                results.append((future, result))
+            if self._before_commit:
+                self._before_commit()
+            conn.commit()
+            if self._on_commit:
+                self._on_commit()
+        except Exception as e:
+            # The group could not commit (e.g. lock timeout): nothing was saved
+            logging.error(f"WRITE QUEUE COMMIT FAILED for {len(batch)} job(s): {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in results:
+            future.set_result(result)